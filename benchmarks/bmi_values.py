@@ -0,0 +1,110 @@
+"""Time getting values from BmiTopography on a synthetic DEM.
+
+Run from the root of the repository::
+
+    $ python benchmarks/bmi_values.py --size 10000
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import yaml
+from rasterio.transform import from_origin
+
+from bmi_topography import BmiTopography
+
+NAME = "land_surface__elevation"
+
+
+def write_dem(cache_dir, size, resolution=1.0 / 3600.0):
+    """Write a DEM where BmiTopography will find it already cached."""
+    south, west = 40.0, -105.0
+    north, east = south + size * resolution, west + size * resolution
+    path = Path(cache_dir) / f"SRTMGL1_{south}_{west}_{north}_{east}.tif"
+
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=size,
+        width=size,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(west, north, resolution, resolution),
+        nodata=-9999.0,
+        tiled=True,
+    ) as dst:
+        for _, window in dst.block_windows(1):
+            dst.write(
+                np.random.default_rng()
+                .uniform(1000.0, 2000.0, size=(window.height, window.width))
+                .astype("float32"),
+                1,
+                window=window,
+            )
+
+    return {
+        "dem_type": "SRTMGL1",
+        "south": south,
+        "west": west,
+        "north": north,
+        "east": east,
+        "output_format": "GTiff",
+        "cache_dir": str(cache_dir),
+    }
+
+
+def timeit(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="pixels per side")
+    parser.add_argument("--indices", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        config_file = Path(cache_dir) / "config.yaml"
+        config_file.write_text(
+            yaml.safe_dump({"bmi-topography": write_dem(cache_dir, args.size)})
+        )
+
+        bmi = BmiTopography()
+        bmi.initialize(str(config_file))
+
+        start = time.perf_counter()
+        bmi.get_value_ptr(NAME)
+        print(f"{args.size} x {args.size} grid")
+        print(f"    first access: {time.perf_counter() - start:8.4f} s")
+
+        dest = np.empty(bmi.get_grid_size(0), dtype=bmi.get_var_type(NAME))
+        inds = np.random.default_rng().integers(0, dest.size, size=args.indices)
+        at_indices = np.empty(args.indices, dtype=dest.dtype)
+
+        for label, func in (
+            ("get_value_ptr", lambda: bmi.get_value_ptr(NAME)),
+            ("get_value", lambda: bmi.get_value(NAME, dest)),
+            (
+                f"get_value_at_indices ({args.indices} indices)",
+                lambda: bmi.get_value_at_indices(NAME, at_indices, inds),
+            ),
+        ):
+            print(f"    {label}: {timeit(func, args.repeat):8.4f} s")
+
+        bmi.finalize()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Time the terrain derivatives on a synthetic DEM.
+
+Run from the root of the repository::
+
+    $ python benchmarks/derivatives.py --size 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import xarray as xr
+
+from bmi_topography.derivatives import (
+    DEFAULT_TILE_SIZE,
+    aspect,
+    curvature,
+    hillshade,
+    slope,
+)
+
+
+def synthetic_dem(size, resolution=1.0 / 3600.0, south=40.0, west=-105.0):
+    """A DEM of rolling hills on a geographic grid."""
+    lat = south + resolution * (size - np.arange(size) - 0.5)
+    lon = west + resolution * (np.arange(size) + 0.5)
+
+    z = np.empty((1, size, size), dtype=np.float32)
+    x = np.linspace(0.0, 20.0 * np.pi, size, dtype=np.float32)
+    for row in range(size):
+        z[0, row] = 1500.0 + 100.0 * np.sin(x) * np.cos(x[row])
+
+    return xr.DataArray(
+        z,
+        dims=("band", "y", "x"),
+        coords={"band": [1], "y": lat, "x": lon},
+        attrs={"units": "degrees", "_FillValue": -9999.0},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="pixels per side")
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE)
+    args = parser.parse_args()
+
+    da = synthetic_dem(args.size)
+    mpixels = da.size / 1e6
+    print(f"{args.size} x {args.size} DEM, tiles of {args.tile_size} pixels")
+
+    for func in (slope, aspect, curvature, hillshade):
+        start = time.perf_counter()
+        func(da, tile_size=args.tile_size)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{func.__name__:>10}: {elapsed:7.2f} s, {mpixels / elapsed:6.1f} Mpixel/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
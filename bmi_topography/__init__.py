@@ -1,6 +1,13 @@
 from ._version import __version__
 from .bbox import BoundingBox
 from .bmi import BmiTopography
-from .topography import Topography
+from .topography import Topography, afetch_many, fetch_many
 
-__all__ = ["Topography", "BoundingBox", "BmiTopography", "__version__"]
+__all__ = [
+    "Topography",
+    "BoundingBox",
+    "BmiTopography",
+    "afetch_many",
+    "fetch_many",
+    "__version__",
+]
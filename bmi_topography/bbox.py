@@ -1,3 +1,4 @@
+import math
 from collections.abc import Iterable
 
 
@@ -77,6 +78,49 @@ class BoundingBox:
     def east(self):
         return self.upper_right[1]
 
+    def split(self, tile_size):
+        """Split the box into a grid of non-overlapping sub-boxes.
+
+        Parameters
+        ----------
+        tile_size : float or tuple of float
+            The size of each tile in degrees, either as a single value or
+            as a tuple of *(latitude, longitude)* extents. Tiles along the
+            north and east edges are trimmed to fit within the box.
+
+        Returns
+        -------
+        list of BoundingBox
+            The tiles, ordered from south to north and west to east.
+
+        Examples
+        --------
+        >>> from bmi_topography import BoundingBox
+        >>> bbox = BoundingBox((30.0, -100.0), (32.0, -99.0))
+        >>> [str(tile) for tile in bbox.split(1.0)]
+        ['[(30.0, -100.0), (31.0, -99.0)]', '[(31.0, -100.0), (32.0, -99.0)]']
+        """
+        if isinstance(tile_size, Iterable):
+            dlat, dlon = tile_size
+        else:
+            dlat = dlon = tile_size
+
+        if dlat <= 0 or dlon <= 0:
+            raise ValueError(f"tile size ({tile_size}) must be positive")
+
+        nrows = max(1, math.ceil(round((self.north - self.south) / dlat, 9)))
+        ncols = max(1, math.ceil(round((self.east - self.west) / dlon, 9)))
+
+        tiles = []
+        for row in range(nrows):
+            south = self.south + row * dlat
+            north = self.north if row == nrows - 1 else south + dlat
+            for col in range(ncols):
+                west = self.west + col * dlon
+                east = self.east if col == ncols - 1 else west + dlon
+                tiles.append(BoundingBox((south, west), (north, east)))
+        return tiles
+
     def __str__(self):
         s = f"[{self.lower_left}, {self.upper_right}]"
         return s
@@ -1,9 +1,13 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy
 from bmipy import Bmi
 
+from .cache import hydrology_file
 from .config import load_config
+from .hydrology import MAX_PIXELS, check_size
+from .sample import point_pixels
 from .topography import Topography
 
 BmiVar = namedtuple(
@@ -20,12 +24,33 @@ class BmiTopography(Bmi):
     _name = "bmi-topography"
     _input_var_names = ()
     _output_var_names = ("land_surface__elevation",)
+    _hydrology_var_names = {
+        "depression_filled_land_surface__elevation": "filled_elevation",
+        "land_surface_water_flow__d8_direction_code": "flow_direction",
+        "land_surface_water_flow__upstream_cell_count": "flow_accumulation",
+    }
+    _load_options = ("chunks", "dtype", "nodata", "factor", "resolution")
 
     def __init__(self) -> None:
         self._config = {}
+        self._topo = None
+        self._options = {}
         self._da = None
-        self._grid = {}
-        self._var = None
+        self._routes = None
+        self._buffers = {}
+        self._hydrology = False
+        self._max_pixels = MAX_PIXELS
+        self._params = {}
+        self._tiles = None
+        self._tile = 0
+        self._next = None
+        self._executor = None
+        self._fetching = None
+        self._loading = None
+        self._grids = {}
+        self._transform = None
+        self._crs = None
+        self._var_info = {}
 
     def finalize(self) -> None:
         """Perform tear-down tasks for the model.
@@ -35,6 +60,9 @@ class BmiTopography(Bmi):
         printing reports.
         """
         self._da = None
+        self._routes = None
+        self._buffers = {}
+        self._stop_background()
 
     def get_component_name(self) -> str:
         """Name of the component.
@@ -54,7 +82,7 @@ class BmiTopography(Bmi):
         float
             The current model time.
         """
-        return 0.0
+        return float(self._tile)
 
     def get_end_time(self) -> float:
         """End time of the model.
@@ -64,7 +92,7 @@ class BmiTopography(Bmi):
         float
             The maximum model time.
         """
-        return 0.0
+        return 0.0 if self._tiles is None else float(len(self._tiles) - 1)
 
     def get_grid_edge_count(self, grid: int) -> int:
         """Get the number of edges in the grid.
@@ -307,7 +335,10 @@ class BmiTopography(Bmi):
         ndarray of float
             The input numpy array that holds the grid's column x-coordinates.
         """
-        x[:] = self._da.x.values
+        grid = self._grid[grid]
+        x[:] = grid.yx_of_lower_left[1] + grid.yx_spacing[1] * numpy.arange(
+            grid.shape[1]
+        )
         return x
 
     def get_grid_y(self, grid: int, y: numpy.ndarray) -> numpy.ndarray:
@@ -325,7 +356,10 @@ class BmiTopography(Bmi):
         ndarray of float
             The input numpy array that holds the grid's row y-coordinates.
         """
-        y[:] = self._da.y.values
+        grid = self._grid[grid]
+        y[:] = grid.yx_of_lower_left[0] + grid.yx_spacing[0] * numpy.arange(
+            grid.shape[0] - 1, -1, -1
+        )
         return y
 
     def get_grid_z(self, grid: int, z: numpy.ndarray) -> numpy.ndarray:
@@ -422,7 +456,7 @@ class BmiTopography(Bmi):
         float
             The time step used in model.
         """
-        return 0.0
+        return 0.0 if self._tiles is None else 1.0
 
     def get_time_units(self) -> str:
         """Time units of the model.
@@ -457,7 +491,7 @@ class BmiTopography(Bmi):
         ndarray
             The same numpy array that was passed as an input buffer.
         """
-        dest[:] = self.get_value_ptr(name).reshape(-1).copy()
+        dest[...] = self._buffer(name).reshape(dest.shape)
         return dest
 
     def get_value_at_indices(
@@ -479,7 +513,24 @@ class BmiTopography(Bmi):
         array_like
             Value of the model variable at the given location.
         """
-        dest[:] = self.get_value_ptr(name).reshape(-1)[inds]
+        if name not in self._buffers:
+            values = self._values(name).data
+            if not isinstance(values, numpy.ndarray):
+                dest[:] = values.vindex[
+                    numpy.unravel_index(inds, values.shape)
+                ].compute()
+                return dest
+
+        values = self._buffer(name).reshape(-1)
+        inds = numpy.asarray(inds)
+        if inds.size and (inds.min() < -values.size or inds.max() >= values.size):
+            raise IndexError(
+                f"indices must be in the range [{-values.size}, {values.size})"
+            )
+        if dest.dtype == values.dtype and dest.shape == inds.shape:
+            numpy.take(values, inds, out=dest, mode="wrap")
+        else:
+            dest[:] = values[inds]
         return dest
 
     def get_value_ptr(self, name: str) -> numpy.ndarray:
@@ -499,7 +550,7 @@ class BmiTopography(Bmi):
         array_like
             A reference to a model variable.
         """
-        return self._da.values
+        return self._buffer(name)
 
     def get_var_grid(self, name: str) -> int:
         """Get grid identifier for the given variable.
@@ -514,7 +565,7 @@ class BmiTopography(Bmi):
         int
           The grid identifier.
         """
-        return self._var.grid
+        return self._vars[name].grid
 
     def get_var_itemsize(self, name: str) -> int:
         """Get memory use for each array element in bytes.
@@ -529,7 +580,7 @@ class BmiTopography(Bmi):
         int
             Item size in bytes.
         """
-        return self._var.itemsize
+        return self._vars[name].itemsize
 
     def get_var_location(self, name: str) -> str:
         """Get the grid element type that the a given variable is defined on.
@@ -565,7 +616,7 @@ class BmiTopography(Bmi):
 
         .. _ugrid conventions: http://ugrid-conventions.github.io/ugrid-conventions
         """
-        return self._var.location
+        return self._vars[name].location
 
     def get_var_nbytes(self, name: str) -> int:
         """Get size, in bytes, of the given variable.
@@ -580,7 +631,7 @@ class BmiTopography(Bmi):
         int
             The size of the variable, counted in bytes.
         """
-        return self._var.nbytes
+        return self._vars[name].nbytes
 
     def get_var_type(self, name: str) -> str:
         """Get data type of the given variable.
@@ -595,7 +646,7 @@ class BmiTopography(Bmi):
         str
             The Python variable type; e.g., ``str``, ``int``, ``float``.
         """
-        return self._var.dtype
+        return self._vars[name].dtype
 
     def get_var_units(self, name: str) -> str:
         """Get units of the given variable.
@@ -624,7 +675,7 @@ class BmiTopography(Bmi):
 
         .. _UDUNITS: http://www.unidata.ucar.edu/software/udunits
         """
-        return self._var.units
+        return self._vars[name].units
 
     def initialize(self, config_file: str) -> None:
         """Perform startup tasks for the model.
@@ -646,35 +697,247 @@ class BmiTopography(Bmi):
         how configuration files are formatted, although YAML is
         recommended. A template of a model's configuration file
         with placeholder values is used by the BMI.
+
+        Besides the parameters of :class:`~bmi_topography.Topography`, the
+        configuration may include a *chunks* size. The elevations are then
+        loaded lazily, as a dask array, and
+        :meth:`get_value_at_indices` reads only the chunks that hold the
+        requested values. It may also include the *dtype*, *nodata*,
+        *factor* and *resolution* options of
+        :meth:`~bmi_topography.Topography.load`.
+
+        The data are fetched, but not read. The grid and variable are
+        described from the cached file's header, and the elevations are
+        read on first access to their values, into a single C-contiguous,
+        read-only array. :meth:`get_value_ptr` returns that array, and
+        :meth:`get_value` and :meth:`get_value_at_indices` copy from it.
+
+        If the configuration sets *hydrology* to true, the depression-filled
+        elevations, D8 flow directions and flow accumulation of
+        :meth:`~bmi_topography.Topography.hydrology` are also provided as
+        output variables. They are computed, or read from the cache, on
+        first access to their values. Routing takes about 6 s per million
+        pixels, so, unless they are cached, this method refuses data with
+        more pixels than the *hydrology_max_pixels* option, which defaults
+        to :data:`~bmi_topography.hydrology.MAX_PIXELS`, or null for no
+        limit.
+
+        If the configuration includes a *stream_tile_size*, in degrees, the
+        bounding box is split into tiles of that size, ordered from south
+        to north and west to east, which are provided one at a time. The
+        grid and variables describe the current tile, and each
+        :meth:`update` advances to the next, while the tile after that is
+        fetched and read on a background thread. Time is counted in tiles.
+
+        If the configuration sets *background_fetch* to true, the data are
+        fetched and read on a background thread, and this method returns
+        without waiting for them. Calls that only need to know the
+        component's variables and times return at once. Calls about the
+        grid or a variable's type and size wait for the fetch, and calls
+        for values wait for the data to be read. Errors raised while
+        fetching are raised by each of these calls, and the data are only
+        read once they have been fetched.
         """
         if config_file:
             self._config = load_config(config_file)
         else:
             self._config = Topography.DEFAULT.copy()
-        self._da = Topography(**self._config).load()
+        params = dict(self._config)
+        self._options = {
+            name: params.pop(name) for name in self._load_options if name in params
+        }
+        self._hydrology = bool(params.pop("hydrology", False))
+        self._max_pixels = params.pop("hydrology_max_pixels", MAX_PIXELS)
+        stream_tile_size = params.pop("stream_tile_size", None)
+        background_fetch = bool(params.pop("background_fetch", False))
 
-        self._grid = {
+        self._stop_background()
+        self._da = None
+        self._routes = None
+        self._buffers = {}
+        self._params = params
+        self._tile = 0
+        self._output_var_names = BmiTopography._output_var_names
+        if self._hydrology:
+            self._output_var_names += tuple(self._hydrology_var_names)
+
+        if stream_tile_size is None:
+            self._tiles = None
+            self._topo = Topography(**params)
+        else:
+            self._tiles = Topography(**params).bbox.split(stream_tile_size)
+            self._topo = self._tile_topography(0)
+        if stream_tile_size is not None or background_fetch:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+        if background_fetch:
+            self._fetching = self._executor.submit(self._topo.fetch)
+            self._loading = self._executor.submit(
+                _load_fetched, self._fetching, self._topo, self._options
+            )
+        else:
+            self._describe()
+        if self._tiles is not None:
+            self._prefetch(1)
+
+    def _describe(self):
+        """Describe the grid and variables from the current data's header."""
+        metadata = self._topo.metadata(
+            **{name: value for name, value in self._options.items() if name != "chunks"}
+        )
+        if self._hydrology and not hydrology_file(self._topo.fetch()).is_file():
+            check_size(metadata["shape"], self._max_pixels)
+        _, nrows, ncols = metadata["shape"]
+        transform = metadata["transform"]
+        self._transform, self._crs = transform, metadata["crs"]
+        self._grids = {
             0: BmiGridUniformRectilinear(
-                shape=self._da.rio.shape,
-                yx_spacing=(
-                    abs(self._da.rio.transform().e),
-                    abs(self._da.rio.transform().a),
-                ),
+                shape=(nrows, ncols),
+                yx_spacing=(abs(transform.e), abs(transform.a)),
                 yx_of_lower_left=(
-                    float(self._da.y.min().data),
-                    float(self._da.x.min().data),
+                    min(transform.f + transform.e * (k + 0.5) for k in (0, nrows - 1)),
+                    min(transform.c + transform.a * (k + 0.5) for k in (0, ncols - 1)),
                 ),
             )
         }
 
-        self._var = BmiVar(
-            dtype=str(self._da.values.dtype),
-            itemsize=self._da.values.itemsize,
-            nbytes=self._da.values.nbytes,
-            location="face",
-            units=self._da.attrs["units"],
-            grid=0,
-        )
+        variables = {"land_surface__elevation": (metadata["dtype"], metadata["units"])}
+        if self._hydrology:
+            variables.update(
+                {
+                    "depression_filled_land_surface__elevation": (
+                        "float32",
+                        metadata["units"],
+                    ),
+                    "land_surface_water_flow__d8_direction_code": ("uint8", "1"),
+                    "land_surface_water_flow__upstream_cell_count": ("uint32", "1"),
+                }
+            )
+        self._var_info = {}
+        for name, (dtype, units) in variables.items():
+            dtype = numpy.dtype(dtype)
+            self._var_info[name] = BmiVar(
+                dtype=str(dtype),
+                itemsize=dtype.itemsize,
+                nbytes=int(numpy.prod(metadata["shape"])) * dtype.itemsize,
+                location="face",
+                units=units,
+                grid=0,
+            )
+
+    @property
+    def _grid(self):
+        self._wait_for_fetch()
+        return self._grids
+
+    @property
+    def _vars(self):
+        self._wait_for_fetch()
+        return self._var_info
+
+    def _wait_for_fetch(self):
+        """Wait for a background fetch, if any, and describe its data."""
+        if self._fetching is not None:
+            self._fetching.result()
+            self._describe()
+            self._fetching = None
+
+    def _tile_topography(self, tile):
+        bbox = self._tiles[tile]
+        params = self._params | {
+            "south": bbox.south,
+            "west": bbox.west,
+            "north": bbox.north,
+            "east": bbox.east,
+        }
+        return Topography(**params)
+
+    def _prefetch(self, tile):
+        """Start fetching and reading a tile on the background thread."""
+        if tile < len(self._tiles):
+            topo = self._tile_topography(tile)
+            self._next = (topo, self._executor.submit(topo.load, **self._options))
+        else:
+            self._next = None
+
+    def _stop_background(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._next = None
+        self._fetching = None
+        self._loading = None
+
+    def _load(self):
+        """Read the elevations, if they haven't been read already."""
+        if self._da is None:
+            if self._loading is not None:
+                self._wait_for_fetch()
+                self._da = self._loading.result()
+                self._loading = None
+            else:
+                self._da = self._topo.load(**self._options)
+        return self._da
+
+    def _buffer(self, name):
+        """The values of a variable as a C-contiguous, read-only array.
+
+        The array is made once, on first access, and then returned as is,
+        so that getting values never reads, computes or copies them again.
+        """
+        if name not in self._buffers:
+            values = numpy.ascontiguousarray(self._values(name).values)
+            values.flags.writeable = False
+            self._buffers[name] = values
+        return self._buffers[name]
+
+    def _values(self, name):
+        """The DataArray that holds the values of a variable."""
+        if name in self._hydrology_var_names:
+            if self._routes is None:
+                self._load()
+                self._routes = self._topo.hydrology(
+                    max_pixels=self._max_pixels, **self._options
+                )
+            return self._routes[self._hydrology_var_names[name]]
+        return self._load()
+
+    def get_indices_at_points(
+        self, lats: numpy.ndarray, lons: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Get the indices of the grid cells that hold points.
+
+        This is not part of the BMI. It maps coordinates, all at once, to
+        the flat indices used by :meth:`get_value_at_indices`.
+
+        Parameters
+        ----------
+        lats : array_like of float
+            The latitudes of the points.
+        lons : array_like of float
+            The longitudes of the points.
+
+        Returns
+        -------
+        ndarray of int64
+            The index of the grid cell that holds each point.
+
+        Raises
+        ------
+        ValueError
+            If any of the points are outside of the grid.
+        """
+        nrows, ncols = self._grid[0].shape
+        rows, cols = point_pixels(self._transform, self._crs, lats, lons)
+        rows, cols = numpy.floor(rows), numpy.floor(cols)
+
+        inside = (rows >= 0) & (rows < nrows) & (cols >= 0) & (cols < ncols)
+        if not numpy.all(inside):
+            raise ValueError(
+                f"{inside.size - numpy.count_nonzero(inside)} of {inside.size}"
+                " points are outside of the grid"
+            )
+        return rows.astype(numpy.int64) * ncols + cols.astype(numpy.int64)
 
     def set_value(self, name: str, values: numpy.ndarray) -> None:
         """Specify a new value for a model variable.
@@ -718,7 +981,19 @@ class BmiTopography(Bmi):
         then they can be computed by the :func:`initialize` method and this
         method can return with no action.
         """
-        raise NotImplementedError("update")
+        if self._tiles is None:
+            raise NotImplementedError("update")
+        if self._next is None:
+            raise ValueError("the last tile has already been reached")
+
+        self._topo, future = self._next
+        self._fetching = self._loading = None
+        self._da = future.result()
+        self._routes = None
+        self._buffers = {}
+        self._tile += 1
+        self._prefetch(self._tile + 1)
+        self._describe()
 
     def update_until(self, time: float) -> None:
         """Advance model state until the given time.
@@ -728,4 +1003,17 @@ class BmiTopography(Bmi):
         time : float
             A model time later than the current model time.
         """
-        raise NotImplementedError("update_until")
+        if self._tiles is None:
+            raise NotImplementedError("update_until")
+        if time > self.get_end_time():
+            raise ValueError(
+                f"time ({time}) is later than the end time ({self.get_end_time()})"
+            )
+        while self._tile < time:
+            self.update()
+
+
+def _load_fetched(fetching, topo, options):
+    """Read data once their fetch, on the same thread, has succeeded."""
+    fetching.result()
+    return topo.load(**options)
@@ -0,0 +1,961 @@
+"""An index of the data files stored in a cache directory."""
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+import rioxarray
+import xarray as xr
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.merge import merge
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from .bbox import BoundingBox
+from .errors import BoundingBoxError
+
+ZARR_VARIABLE = "elevation"
+
+
+class CacheIndex:
+    """A spatial index of the DEMs in a cache directory.
+
+    The index is a SQLite database, stored in the cache directory, that
+    records the dataset type and bounding box of each cached file so that
+    a request for a box that lies within an already-cached box can be
+    served from the cached file. It also records the size and last access
+    time of each file, and the size of the sidecar files written for it
+    (see :meth:`record_sidecars`), so that the least recently used files
+    can be evicted when the cache grows too large, and, for files that bmi-topography
+    stored, when and from where they were stored and their SHA-256 digests
+    so that the cache can be checked for corrupt files, and the header of
+    each raster (see :func:`raster_header`) so that it can be described
+    without being opened.
+
+    A cache directory that isn't writable can still be read from: the
+    index is then opened read-only, and access times aren't updated.
+
+    Parameters
+    ----------
+    cache_dir : str or path-like
+        The cache directory.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from bmi_topography import BoundingBox
+    >>> from bmi_topography.cache import CacheIndex
+    >>> with tempfile.TemporaryDirectory() as cache_dir:
+    ...     index = CacheIndex(cache_dir)
+    ...     bbox = BoundingBox((30, -100), (32, -98))
+    ...     index.add("SRTMGL3_30_-100_32_-98.tif", "SRTMGL3", bbox)
+    ...     bbox = BoundingBox((31, -99.5), (31.5, -99))
+    ...     index.find_cover("SRTMGL3", bbox, exists=False)
+    ...
+    'SRTMGL3_30_-100_32_-98.tif'
+    """
+
+    FILENAME = "cache.sqlite"
+
+    COLUMNS = {
+        "size": "INTEGER NOT NULL DEFAULT 0",
+        "last_access": "REAL NOT NULL DEFAULT 0",
+        "created": "REAL",
+        "sha256": "TEXT",
+        "source": "TEXT",
+        "layout": "TEXT NOT NULL DEFAULT 'raw'",
+        "header": "TEXT",
+        "sidecar_size": "INTEGER NOT NULL DEFAULT 0",
+    }
+
+    def __init__(self, cache_dir):
+        self._cache_dir = Path(cache_dir)
+        self._path = self._cache_dir / CacheIndex.FILENAME
+        if not self.writable:
+            return
+
+        with self._connect() as conn:
+            is_new = (
+                conn.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE name = 'entries'"
+                ).fetchone()[0]
+                == 0
+            )
+            self._create_tables(conn)
+            if is_new:
+                self._rebuild(conn)
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                filename TEXT PRIMARY KEY,
+                dem_type TEXT NOT NULL,
+                south REAL NOT NULL,
+                west REAL NOT NULL,
+                north REAL NOT NULL,
+                east REAL NOT NULL
+            )
+            """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS entries_bbox
+                ON entries (dem_type, south, west, north, east)
+            """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        for name, declaration in CacheIndex.COLUMNS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE entries ADD COLUMN {name} {declaration}")
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def writable(self):
+        """If the index, and the cache directory it is in, can be written to."""
+        return os.access(self._cache_dir, os.W_OK) and (
+            not self._path.exists() or os.access(self._path, os.W_OK)
+        )
+
+    @contextmanager
+    def _connect(self, readonly=False):
+        """Connect to the database within a transaction.
+
+        A transaction that writes takes the database's write lock up front
+        so that threads and processes sharing a cache see each other's
+        changes in a consistent order. One that only reads is deferred, and
+        its connection is read-only, so that a read-only cache can still be
+        read from. If there is no database to read, an empty one is read.
+        """
+        if not readonly:
+            database, uri = self._path, False
+        elif self._path.is_file():
+            database, uri = f"{self._path.absolute().as_uri()}?mode=ro", True
+        else:
+            database, uri = ":memory:", False
+
+        with closing(
+            sqlite3.connect(database, timeout=60.0, isolation_level=None, uri=uri)
+        ) as conn:
+            if database == ":memory:":
+                self._create_tables(conn)
+            conn.execute("BEGIN DEFERRED" if readonly else "BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+
+    def add(
+        self,
+        filename,
+        dem_type,
+        bbox,
+        last_access=None,
+        sha256=None,
+        source=None,
+        layout="raw",
+        header=None,
+    ):
+        """Add a cached file to the index.
+
+        Parameters
+        ----------
+        filename : str or path-like
+            The name of the file within the cache directory.
+        dem_type : str
+            The dataset type.
+        bbox : BoundingBox
+            The bounding box that was requested for the file.
+        last_access : float, optional
+            When the file was last used, in seconds since the epoch. If not
+            provided, the current time is used.
+        sha256 : str, optional
+            The SHA-256 digest of the file, as a hex string.
+        source : str, optional
+            Where the file came from, such as the URL it was downloaded from.
+        layout : str, optional
+            How the file is organized, as for
+            :attr:`~bmi_topography.Topography.cache_layout`.
+        header : dict, optional
+            The raster's header, as returned by :func:`raster_header`.
+        """
+        with self._connect() as conn:
+            self._insert(
+                conn,
+                filename,
+                dem_type,
+                bbox,
+                last_access=last_access,
+                sha256=sha256,
+                source=source,
+                layout=layout,
+                header=header,
+            )
+
+    def _insert(
+        self,
+        conn,
+        filename,
+        dem_type,
+        bbox,
+        last_access=None,
+        sha256=None,
+        source=None,
+        layout="raw",
+        header=None,
+    ):
+        path = self._cache_dir / Path(filename).name
+        size = path.stat().st_size if path.is_file() else 0
+        now = time.time()
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO entries (
+                filename, dem_type, south, west, north, east, size,
+                last_access, created, sha256, source, layout, header, sidecar_size
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                path.name,
+                dem_type,
+                bbox.south,
+                bbox.west,
+                bbox.north,
+                bbox.east,
+                size,
+                now if last_access is None else last_access,
+                now,
+                sha256,
+                source,
+                layout,
+                None if header is None else json.dumps(header),
+                sidecar_size(path),
+            ),
+        )
+
+    def entry(self, filename):
+        """Get the record for a cached file.
+
+        Parameters
+        ----------
+        filename : str or path-like
+            The name of the file within the cache directory.
+
+        Returns
+        -------
+        dict or None
+            The indexed values for the file, or ``None`` if it isn't indexed.
+        """
+        with self._connect(readonly=True) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT * FROM entries WHERE filename = ?", (Path(filename).name,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        entry = dict.fromkeys(CacheIndex.COLUMNS) | dict(row)
+        if entry["header"] is not None:
+            entry["header"] = json.loads(entry["header"])
+        return entry
+
+    def verify(self, checksums=True):
+        """Check the indexed files for problems.
+
+        Parameters
+        ----------
+        checksums : bool, optional
+            If ``True``, compare the SHA-256 digest of each file with the
+            recorded digest. Otherwise, only compare sizes.
+
+        Returns
+        -------
+        list of tuple of (pathlib.Path, str)
+            The files that are missing or corrupt, and what is wrong.
+        """
+        with self._connect(readonly=True) as conn:
+            rows = conn.execute(
+                "SELECT filename, size, sha256 FROM entries ORDER BY filename"
+            ).fetchall()
+
+        problems = []
+        for filename, size, sha256 in rows:
+            path = self._cache_dir / filename
+            if not path.is_file():
+                problems.append((path, "missing"))
+            elif path.stat().st_size != size:
+                problems.append((path, "size mismatch"))
+            elif checksums and sha256 and file_digest(path).hexdigest() != sha256:
+                problems.append((path, "checksum mismatch"))
+        return problems
+
+    def touch(self, filename):
+        """Mark a cached file as just used, if the index can be written to."""
+        if not self.writable:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE filename = ?",
+                (time.time(), Path(filename).name),
+            )
+
+    def record_sidecars(self, filename):
+        """Record the size of the sidecar files written for a cached file.
+
+        Call this after writing, or replacing, a sidecar file so that it
+        counts toward the size of the cache. Nothing is recorded if the
+        index can't be written to.
+        """
+        if not self.writable:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE entries SET sidecar_size = ? WHERE filename = ?",
+                (
+                    sidecar_size(self._cache_dir / Path(filename).name),
+                    Path(filename).name,
+                ),
+            )
+
+    def total_size(self):
+        """The total size, in bytes, of the indexed files and their sidecars."""
+        with self._connect(readonly=True) as conn:
+            return conn.execute(
+                "SELECT TOTAL(size + sidecar_size) FROM entries"
+            ).fetchone()[0]
+
+    def evict(self, max_size, keep=()):
+        """Remove least recently used files until the cache fits a quota.
+
+        Parameters
+        ----------
+        max_size : int
+            The quota, in bytes, for the files and their sidecar files.
+        keep : iterable of str, optional
+            Names of files that must not be removed.
+
+        Returns
+        -------
+        list of pathlib.Path
+            The files that were removed.
+        """
+        keep = {Path(filename).name for filename in keep}
+        with self._connect(readonly=True) as conn:
+            rows = conn.execute(
+                "SELECT filename, size + sidecar_size FROM entries"
+                " ORDER BY last_access"
+            ).fetchall()
+
+        total = sum(size for _, size in rows)
+        removed = []
+        for filename, size in rows:
+            if total <= max_size:
+                break
+            if filename in keep:
+                continue
+            path = self._cache_dir / filename
+            try:
+                _remove_raster(path)
+            except OSError:
+                continue
+            self.remove(filename)
+            removed.append(path)
+            total -= size
+        return removed
+
+    def discard(self, filename):
+        """Remove a cached file, and its sidecar files, from the cache and index."""
+        path = self._cache_dir / Path(filename).name
+        if path.is_file():
+            _remove_raster(path)
+        self.remove(filename)
+
+    def remove(self, filename):
+        """Remove a file from the index."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM entries WHERE filename = ?", (Path(filename).name,)
+            )
+
+    def __len__(self):
+        with self._connect(readonly=True) as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def find_cover(self, dem_type, bbox, exists=True):
+        """Find the smallest cached file that covers a bounding box.
+
+        Parameters
+        ----------
+        dem_type : str
+            The dataset type.
+        bbox : BoundingBox
+            The bounding box to cover.
+        exists : bool, optional
+            If ``True``, skip entries whose files are no longer in the cache
+            directory, and drop them from the index if it can be written to.
+
+        Returns
+        -------
+        str or None
+            The name of the covering file, or ``None`` if there isn't one.
+        """
+        with self._connect(readonly=True) as conn:
+            rows = conn.execute(
+                """
+                SELECT filename FROM entries
+                WHERE dem_type = ?
+                    AND south <= ? AND west <= ? AND north >= ? AND east >= ?
+                ORDER BY (north - south) * (east - west)
+                """,
+                (dem_type, bbox.south, bbox.west, bbox.north, bbox.east),
+            ).fetchall()
+
+        for (filename,) in rows:
+            if not exists or (self._cache_dir / filename).is_file():
+                return filename
+            if self.writable:
+                self.remove(filename)
+        return None
+
+    def rebuild(self):
+        """Index the files in the cache directory from their names."""
+        with self._connect() as conn:
+            self._rebuild(conn)
+
+    def _rebuild(self, conn):
+        conn.execute("DELETE FROM entries")
+        for path in self._cache_dir.iterdir():
+            try:
+                dem_type, bbox = _parse_filename(path.name)
+            except ValueError:
+                continue
+            if path.is_file():
+                self._insert(
+                    conn, path.name, dem_type, bbox, last_access=path.stat().st_mtime
+                )
+
+
+def crop(src_path, dst_path, bbox, driver="GTiff"):
+    """Copy the part of a raster that lies within a bounding box.
+
+    Parameters
+    ----------
+    src_path : str or path-like
+        The raster to crop.
+    dst_path : str or path-like
+        The file to write.
+    bbox : BoundingBox
+        A latitude-longitude bounding box. Any pixel that touches the box
+        is included.
+    driver : str, optional
+        The output format.
+    """
+    with rasterio.open(src_path) as src:
+        window = bbox_window(src, bbox)
+        profile = _output_profile(
+            src.profile,
+            driver,
+            width=window.width,
+            height=window.height,
+            transform=src.window_transform(window),
+        )
+        data = src.read(window=window)
+
+    with rasterio.open(dst_path, "w", **profile) as dst:
+        dst.write(data)
+
+
+def bbox_window(src, bbox):
+    """Find the pixels of a raster that lie within a bounding box.
+
+    Parameters
+    ----------
+    src : rasterio.DatasetReader
+        An open raster.
+    bbox : BoundingBox
+        A latitude-longitude bounding box. Any pixel that touches the box
+        is included.
+
+    Returns
+    -------
+    rasterio.windows.Window
+        The window, in whole pixels, clipped to the raster.
+
+    Raises
+    ------
+    BoundingBoxError
+        If the box doesn't overlap the raster.
+    """
+    bounds = transform_bounds(
+        "EPSG:4326", src.crs, bbox.west, bbox.south, bbox.east, bbox.north
+    )
+    window = _snap_outward(from_bounds(*bounds, transform=src.transform))
+    try:
+        return window.intersection(Window(0, 0, src.width, src.height))
+    except WindowError:
+        raise BoundingBoxError(f"{bbox} does not overlap {src.name}") from None
+
+
+def to_cog(src_path, dst_path, blocksize=512, compress="DEFLATE"):
+    """Rewrite a raster as a Cloud-Optimized GeoTIFF.
+
+    The output is internally tiled and compressed, and has overviews,
+    averaged from the full-resolution data, down to a single block.
+
+    Parameters
+    ----------
+    src_path : str or path-like
+        The raster to rewrite.
+    dst_path : str or path-like
+        The file to write.
+    blocksize : int, optional
+        The width and height, in pixels, of the internal tiles.
+    compress : str, optional
+        The compression method.
+    """
+    rasterio.shutil.copy(
+        src_path,
+        dst_path,
+        driver="COG",
+        blocksize=blocksize,
+        compress=compress,
+        predictor="YES",
+        overviews="AUTO",
+        overview_resampling="AVERAGE",
+        bigtiff="IF_SAFER",
+    )
+
+
+def to_zarr(src_path, dst_path, chunks=512):
+    """Copy a raster into a chunked, compressed Zarr store.
+
+    The raster's bands are stored as a single variable, named by
+    ``ZARR_VARIABLE``, along with its coordinates and CRS. The store's
+    layout is written first, and then the data, a row of chunks at a time,
+    so that rasters larger than memory can be copied.
+
+    Parameters
+    ----------
+    src_path : str or path-like
+        The raster to copy.
+    dst_path : str or path-like
+        The store to write.
+    chunks : int, optional
+        The width and height, in pixels, of each chunk.
+    """
+    import_zarr()
+
+    with rioxarray.open_rasterio(src_path) as da:
+        _, ny, nx = da.shape
+        fill_value = da.dtype.type(0 if da.rio.nodata is None else da.rio.nodata)
+        layout = da.copy(data=np.broadcast_to(fill_value, da.shape))
+        layout.to_dataset(name=ZARR_VARIABLE).to_zarr(
+            dst_path,
+            mode="w",
+            encoding={ZARR_VARIABLE: {"chunks": (1, min(chunks, ny), min(chunks, nx))}},
+            consolidated=True,
+        )
+
+        for start in range(0, ny, chunks):
+            rows = slice(start, min(start + chunks, ny))
+            strip = xr.Dataset({ZARR_VARIABLE: (da.dims, da[:, rows].values)})
+            strip.to_zarr(dst_path, region={"y": rows}, consolidated=True)
+
+
+def open_zarr(path, chunks=None):
+    """Open a Zarr store written by :func:`to_zarr` without reading its data.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The store to open.
+    chunks : int, dict or str, optional
+        If provided, back the raster with a dask array of chunks this size,
+        as for :func:`xarray.open_dataset`.
+
+    Returns
+    -------
+    xarray.DataArray
+        The raster, read chunk by chunk as it is accessed.
+    """
+    import_zarr()
+
+    ds = xr.open_dataset(
+        path,
+        engine="zarr",
+        chunks=chunks,
+        mask_and_scale=False,
+        consolidated=True,
+    )
+    return ds.set_coords("spatial_ref")[ZARR_VARIABLE]
+
+
+def zarr_store(path):
+    """The Zarr store that holds a copy of a cached raster."""
+    path = Path(path)
+    return path.with_name(path.name + ".zarr")
+
+
+def to_npy(src_path, dst_path, meta_path):
+    """Copy a raster into a ``.npy`` array and a JSON file of its metadata.
+
+    The array can then be memory-mapped, by :func:`open_npy`, rather than
+    decoded. The metadata hold the array's shape and type, and the
+    raster's transform, CRS, units and nodata value.
+
+    Parameters
+    ----------
+    src_path : str or path-like
+        The raster to copy.
+    dst_path : str or path-like
+        The ``.npy`` file to write.
+    meta_path : str or path-like
+        The metadata file to write.
+    """
+    with rasterio.open(src_path) as src:
+        array = np.lib.format.open_memmap(
+            dst_path,
+            mode="w+",
+            dtype=src.dtypes[0],
+            shape=(src.count, src.height, src.width),
+        )
+        src.read(out=array)
+        array.flush()
+        del array
+
+    Path(meta_path).write_text(json.dumps(raster_header(src_path), indent=2))
+
+
+def raster_header(path):
+    """Describe a raster without reading its data.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The raster.
+
+    Returns
+    -------
+    dict
+        The raster's *shape*, as (bands, rows, columns), the *dtype* of its
+        data, its affine *transform*, as six coefficients, its *crs*, as
+        WKT, the *units* of the CRS (see :func:`crs_units`), and its
+        *nodata* value. Everything is JSON-serializable.
+    """
+    with rasterio.open(path) as src:
+        return {
+            "shape": [src.count, src.height, src.width],
+            "dtype": src.dtypes[0],
+            "transform": list(src.transform)[:6],
+            "crs": None if src.crs is None else src.crs.to_wkt(),
+            "units": crs_units(src.crs),
+            "nodata": src.nodata,
+        }
+
+
+def open_npy(path, meta_path):
+    """Memory-map an array written by :func:`to_npy` as a DataArray.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The ``.npy`` file.
+    meta_path : str or path-like
+        Its metadata file.
+
+    Returns
+    -------
+    xarray.DataArray
+        The raster, backed by a read-only memory map of the file.
+    """
+    meta = json.loads(Path(meta_path).read_text())
+    data = np.load(path, mmap_mode="r")
+
+    transform = Affine(*meta["transform"])
+    nbands, ny, nx = data.shape
+    x, _ = transform * (np.arange(nx) + 0.5, np.full(nx, 0.5))
+    _, y = transform * (np.full(ny, 0.5), np.arange(ny) + 0.5)
+
+    da = xr.DataArray(
+        data,
+        dims=("band", "y", "x"),
+        coords={"band": np.arange(1, nbands + 1), "y": y, "x": x},
+    )
+    if meta["nodata"] is not None:
+        da.attrs["_FillValue"] = data.dtype.type(meta["nodata"])
+    if meta["crs"] is not None:
+        da.rio.write_crs(meta["crs"], inplace=True)
+    da.rio.write_transform(transform, inplace=True)
+    return da
+
+
+def npy_files(path):
+    """The array and metadata files that hold a copy of a cached raster."""
+    path = Path(path)
+    return path.with_name(path.name + ".npy"), path.with_name(path.name + ".json")
+
+
+def crs_units(crs):
+    """The units of a CRS: *degrees*, a linear unit, or ``None`` if unknown.
+
+    Examples
+    --------
+    >>> from bmi_topography.cache import crs_units
+    >>> crs_units("EPSG:4326")
+    'degrees'
+    >>> crs_units("EPSG:32613")
+    'metre'
+    """
+    if crs is None:
+        return None
+    crs = CRS.from_user_input(crs)
+    return "degrees" if crs.is_geographic else crs.linear_units
+
+
+def import_zarr():
+    """Import zarr, which is needed only for the *zarr* cache layout."""
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError(
+            "The zarr cache layout requires the zarr package."
+            " Install it with: pip install bmi-topography[zarr]"
+        ) from None
+    return zarr
+
+
+def build_overview(src_path, dst_path, factor):
+    """Write a copy of a raster averaged over blocks of pixels.
+
+    Missing values are left out of the averages.
+
+    Parameters
+    ----------
+    src_path : str or path-like
+        The raster to average.
+    dst_path : str or path-like
+        The GeoTIFF to write.
+    factor : int
+        The width and height, in pixels, of the blocks to average over.
+    """
+    with rasterio.open(src_path) as src:
+        height = math.ceil(src.height / factor)
+        width = math.ceil(src.width / factor)
+        data = src.read(
+            out_shape=(src.count, height, width), resampling=Resampling.average
+        )
+        profile = _output_profile(
+            src.profile,
+            "GTiff",
+            width=width,
+            height=height,
+            transform=src.transform
+            * Affine.scale(src.width / width, src.height / height),
+        )
+
+    with rasterio.open(dst_path, "w", **profile) as dst:
+        dst.write(data)
+
+
+def pyramid_dir(path):
+    """The directory that holds block-averaged copies of a cached raster."""
+    path = Path(path)
+    return path.with_name(path.name + ".pyramid")
+
+
+def hydrology_file(path):
+    """The file that holds flow routing computed for a cached raster."""
+    path = Path(path)
+    return path.with_name(path.name + ".hydrology.npz")
+
+
+def pyramid_level(path, factor):
+    """The block-averaged copy of a cached raster for a factor."""
+    return pyramid_dir(path) / f"x{factor}.tif"
+
+
+def pyramid_factors(path):
+    """The factors of the block-averaged copies of a cached raster."""
+    return sorted(int(level.stem[1:]) for level in pyramid_dir(path).glob("x*.tif"))
+
+
+def merge_tiles(paths, dst_path, driver="GTiff", blocksize=512, mem_limit=64):
+    """Merge raster tiles into a single file.
+
+    The mosaic is written as a tiled GeoTIFF, a window at a time, so that
+    mosaics larger than memory can be merged. For other formats, the
+    GeoTIFF is then translated into *driver*'s format.
+
+    Parameters
+    ----------
+    paths : iterable of path-like
+        The tiles to merge.
+    dst_path : str or path-like
+        The file to write.
+    driver : str, optional
+        The output format.
+    blocksize : int, optional
+        The width and height, in pixels, of the GeoTIFF's internal tiles.
+    mem_limit : float, optional
+        The most memory, in MB, to use for each window of the mosaic.
+    """
+    dst_path = Path(dst_path)
+    mosaic = (
+        dst_path if driver == "GTiff" else dst_path.with_name(dst_path.name + ".tif")
+    )
+
+    datasets = [rasterio.open(path) for path in paths]
+    try:
+        merge(
+            datasets,
+            dst_path=mosaic,
+            dst_kwds={
+                "driver": "GTiff",
+                "tiled": True,
+                "blockxsize": blocksize,
+                "blockysize": blocksize,
+                "bigtiff": "IF_SAFER",
+            },
+            mem_limit=mem_limit,
+        )
+    finally:
+        for dataset in datasets:
+            dataset.close()
+
+    if mosaic != dst_path:
+        try:
+            rasterio.shutil.copy(mosaic, dst_path, driver=driver)
+        finally:
+            mosaic.unlink()
+
+
+def _output_profile(profile, driver, **kwds):
+    """Adapt a raster profile for writing with a driver."""
+    profile = profile | kwds | {"driver": driver}
+    if driver != "GTiff":
+        for key in ("blockxsize", "blockysize", "tiled", "compress", "interleave"):
+            profile.pop(key, None)
+    return profile
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Compute the SHA-256 digest of a file.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The file.
+    chunk_size : int, optional
+        The number of bytes to read at a time.
+
+    Returns
+    -------
+    hashlib.sha256
+        The digest, which can be updated with more data.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+    return digest
+
+
+def parse_size(size):
+    """Convert a size, like ``"10G"`` or ``512000``, to a number of bytes.
+
+    Examples
+    --------
+    >>> from bmi_topography.cache import parse_size
+    >>> parse_size(1024)
+    1024
+    >>> parse_size("1.5K")
+    1536
+    >>> parse_size("2GB")
+    2147483648
+    """
+    if isinstance(size, (int, float)):
+        nbytes = size
+    else:
+        match = re.fullmatch(
+            r"\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)I?B?\s*", str(size), re.IGNORECASE
+        )
+        if match is None:
+            raise ValueError(f"{size}: unable to parse size")
+        value, unit = match.groups()
+        nbytes = float(value) * 1024 ** " KMGT".index(unit.upper() or " ")
+    if nbytes < 0:
+        raise ValueError(f"{size}: size must not be negative")
+    return int(nbytes)
+
+
+def sidecar_size(path):
+    """The total size, in bytes, of the sidecar files of a cached raster."""
+    size = 0
+    for sidecar in _sidecars(path):
+        if sidecar.is_dir():
+            size += sum(
+                child.stat().st_size for child in sidecar.rglob("*") if child.is_file()
+            )
+        elif sidecar.is_file():
+            size += sidecar.stat().st_size
+    return size
+
+
+def _sidecars(path):
+    """The files and directories that may be written next to a cached raster."""
+    path = Path(path)
+    return (
+        zarr_store(path),
+        pyramid_dir(path),
+        *npy_files(path),
+        hydrology_file(path),
+        path.with_suffix(".prj"),
+        path.with_name(path.name + ".aux.xml"),
+    )
+
+
+def _remove_raster(path):
+    """Remove a raster file along with any sidecar files written for it."""
+    path.unlink()
+    for sidecar in _sidecars(path):
+        if sidecar.is_dir():
+            shutil.rmtree(sidecar)
+        elif sidecar.is_file():
+            sidecar.unlink()
+
+
+def _snap_outward(window, ndigits=6):
+    """Expand a fractional window to whole pixels."""
+    col_off = math.floor(round(window.col_off, ndigits))
+    row_off = math.floor(round(window.row_off, ndigits))
+    col_end = math.ceil(round(window.col_off + window.width, ndigits))
+    row_end = math.ceil(round(window.row_off + window.height, ndigits))
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+
+def _parse_filename(filename):
+    """Get the dataset type and bounding box from a cache filename."""
+    stem = filename.rsplit(".", 1)[0]
+    try:
+        dem_type, south, west, north, east = stem.rsplit("_", 4)
+    except ValueError:
+        raise ValueError(f"{filename}: not a cache filename")
+    return dem_type, BoundingBox(
+        (float(south), float(west)), (float(north), float(east))
+    )
@@ -2,6 +2,7 @@
 
 import click
 
+from .cache import parse_size
 from .config import load_config
 from .topography import Topography
 
@@ -15,6 +16,9 @@ _CONFIG_FILE_EXCLUSIVE = {
     "output_format",
     "cache_dir",
     "api_key",
+    "tile_size",
+    "max_workers",
+    "cache_max_size",
 }
 
 
@@ -38,6 +42,15 @@ class MutuallyExclusiveOption(click.Option):
         return super().handle_parse_result(ctx, opts, args)
 
 
+def _validate_size(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+
+
 @click.command()
 @click.version_option()
 @click.option("-q", "--quiet", is_flag=True, help="Enables quiet mode.")
@@ -48,7 +61,8 @@ class MutuallyExclusiveOption(click.Option):
     help=(
         "Path to a YAML configuration file. "
         "Mutually exclusive with --dem-type, --south, --north, --west, --east, "
-        "--output-format, --cache-dir, and --api-key."
+        "--output-format, --cache-dir, --api-key, --tile-size, --max-workers, "
+        "and --cache-max-size."
     ),
     cls=MutuallyExclusiveOption,
     mutually_exclusive_with=list(_CONFIG_FILE_EXCLUSIVE),
@@ -127,6 +141,34 @@ class MutuallyExclusiveOption(click.Option):
     cls=MutuallyExclusiveOption,
     mutually_exclusive_with=["config_file"],
 )
+@click.option(
+    "--tile-size",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Download the bounding box in tiles of this size, in degrees.",
+    cls=MutuallyExclusiveOption,
+    mutually_exclusive_with=["config_file"],
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of tiles to download at once.",
+    cls=MutuallyExclusiveOption,
+    mutually_exclusive_with=["config_file"],
+)
+@click.option(
+    "--cache-max-size",
+    type=str,
+    default=None,
+    callback=_validate_size,
+    help=(
+        "Remove least recently used files from the cache until it is no larger"
+        " than this size, in bytes or with a suffix like 500M or 10G."
+    ),
+    cls=MutuallyExclusiveOption,
+    mutually_exclusive_with=["config_file"],
+)
 @click.option("--no-fetch", is_flag=True, help="Do not fetch data from server.")
 def main(
     quiet,
@@ -139,6 +181,9 @@ def main(
     output_format,
     cache_dir,
     api_key,
+    tile_size,
+    max_workers,
+    cache_max_size,
     no_fetch,
 ):
     """Fetch and cache land elevation data from OpenTopography
@@ -171,10 +216,16 @@ def main(
             ),
             "cache_dir": cache_dir if cache_dir is not None else defaults["cache_dir"],
             "api_key": api_key,
+            "tile_size": tile_size,
+            "max_workers": max_workers,
+            "cache_max_size": cache_max_size,
         }
 
     topo = Topography(**params)
 
+    if no_fetch and topo.cache_max_size is not None and topo.cache_dir.is_dir():
+        Topography.prune_cache(topo.cache_dir, topo.cache_max_size)
+
     if not no_fetch:
         if not quiet:
             click.secho("Fetching data...", fg="yellow", err=True)
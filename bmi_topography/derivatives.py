@@ -0,0 +1,238 @@
+"""Terrain derivatives of loaded DEMs: slope, aspect, curvature and hillshade.
+
+Each derivative is computed from the 3 x 3 neighbourhood of every pixel
+with vectorized NumPy stencils. Gradients use Horn's method, as
+``gdaldem`` does. The DEM is processed in square tiles, each read with a
+one-pixel halo of its neighbours, so that only a tile's worth of
+intermediate arrays is held at once and DEMs backed by dask arrays or
+memory maps are read a tile at a time. Pixels on the edges of a DEM use
+their own values in place of the missing neighbours. Pixels that are, or
+neighbour, missing values are NaN.
+
+Spacings are taken from the DEM's transform. If the DEM's units are
+*degrees*, they are converted to metres, with the east-west spacing
+corrected for the latitude of each row.
+"""
+
+import numpy as np
+import xarray as xr
+
+DEFAULT_TILE_SIZE = 1024
+EARTH_RADIUS = 6371008.8
+
+
+def slope(da, tile_size=DEFAULT_TILE_SIZE):
+    """Calculate the slope of a DEM.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+    tile_size : int, optional
+        The width and height, in pixels, of the tiles to process at once.
+
+    Returns
+    -------
+    xarray.DataArray
+        The slope, in degrees from horizontal.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import xarray as xr
+    >>> from bmi_topography.derivatives import slope
+    >>> da = xr.DataArray(
+    ...     np.arange(16.0).reshape(1, 4, 4) * 10.0,
+    ...     dims=("band", "y", "x"),
+    ...     coords={"y": [3.5, 2.5, 1.5, 0.5], "x": [0.5, 1.5, 2.5, 3.5]},
+    ...     attrs={"units": "m"},
+    ... )
+    >>> slope(da).values[0, 1:3, 1:3].round(2)
+    array([[88.61, 88.61],
+           [88.61, 88.61]], dtype=float32)
+    """
+    return _map_tiles(da, _slope, tile_size, name="slope", units="degrees")
+
+
+def aspect(da, tile_size=DEFAULT_TILE_SIZE):
+    """Calculate the aspect of a DEM.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+    tile_size : int, optional
+        The width and height, in pixels, of the tiles to process at once.
+
+    Returns
+    -------
+    xarray.DataArray
+        The direction the surface faces, downslope, in degrees clockwise
+        from north. Flat pixels have no aspect, and are NaN.
+    """
+    return _map_tiles(da, _aspect, tile_size, name="aspect", units="degrees")
+
+
+def curvature(da, tile_size=DEFAULT_TILE_SIZE):
+    """Calculate the curvature of a DEM.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+    tile_size : int, optional
+        The width and height, in pixels, of the tiles to process at once.
+
+    Returns
+    -------
+    xarray.DataArray
+        The Laplacian of elevation, in inverse units of the spacing
+        (``1/m`` for geographic DEMs). It is positive where the surface is
+        concave up, as in valleys, and negative where it is convex, as on
+        ridges.
+    """
+    units = "1/m" if da.attrs.get("units") == "degrees" else "1/" + _units(da)
+    return _map_tiles(da, _curvature, tile_size, name="curvature", units=units)
+
+
+def hillshade(da, azimuth=315.0, altitude=45.0, tile_size=DEFAULT_TILE_SIZE):
+    """Calculate the shaded relief of a DEM.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+    azimuth : float, optional
+        The direction of the light source, in degrees clockwise from north.
+    altitude : float, optional
+        The angle of the light source above the horizon, in degrees.
+    tile_size : int, optional
+        The width and height, in pixels, of the tiles to process at once.
+
+    Returns
+    -------
+    xarray.DataArray
+        The illumination of the surface, from 0 (in shadow) to 1 (facing
+        the light source).
+    """
+    azimuth, altitude = np.radians(azimuth), np.radians(altitude)
+    light = (
+        np.sin(azimuth) * np.cos(altitude),
+        np.cos(azimuth) * np.cos(altitude),
+        np.sin(altitude),
+    )
+
+    def _hillshade(z, dx, dy):
+        dzdx, dzdy = _gradients(z, dx, dy)
+        shade = (light[2] - dzdx * light[0] - dzdy * light[1]) / np.sqrt(
+            1.0 + dzdx**2 + dzdy**2
+        )
+        return np.clip(shade, 0.0, 1.0, out=shade)
+
+    return _map_tiles(da, _hillshade, tile_size, name="hillshade", units="1")
+
+
+def _slope(z, dx, dy):
+    dzdx, dzdy = _gradients(z, dx, dy)
+    return np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+
+
+def _aspect(z, dx, dy):
+    dzdx, dzdy = _gradients(z, dx, dy)
+    direction = np.degrees(np.arctan2(-dzdx, -dzdy)) % 360.0
+    return np.where((dzdx == 0.0) & (dzdy == 0.0), np.nan, direction)
+
+
+def _curvature(z, dx, dy):
+    center = z[1:-1, 1:-1]
+    d2zdx2 = (z[1:-1, :-2] - 2.0 * center + z[1:-1, 2:]) / dx**2
+    d2zdy2 = (z[:-2, 1:-1] - 2.0 * center + z[2:, 1:-1]) / dy**2
+    return d2zdx2 + d2zdy2
+
+
+def _gradients(z, dx, dy):
+    """Horn's gradients, eastward and northward, of a tile with a halo.
+
+    *dx* and *dy* are the signed spacings of columns and rows, as in the
+    DEM's transform, so that the gradients point east and north whatever
+    the DEM's orientation.
+    """
+    west = z[:-2, :-2] + 2.0 * z[1:-1, :-2] + z[2:, :-2]
+    east = z[:-2, 2:] + 2.0 * z[1:-1, 2:] + z[2:, 2:]
+    top = z[:-2, :-2] + 2.0 * z[:-2, 1:-1] + z[:-2, 2:]
+    bottom = z[2:, :-2] + 2.0 * z[2:, 1:-1] + z[2:, 2:]
+    return (east - west) / (8.0 * dx), (bottom - top) / (8.0 * dy)
+
+
+def _map_tiles(da, kernel, tile_size, name, units):
+    """Apply a 3 x 3 stencil to a DEM a tile at a time."""
+    if tile_size < 1:
+        raise ValueError(f"tile_size ({tile_size}) must be at least 1")
+
+    elevation = da if da.ndim == 3 else da.expand_dims("band")
+    fill_value = elevation.attrs.get("_FillValue")
+    nbands, ny, nx = elevation.shape
+    dx, dy = _spacing(elevation)
+
+    out = np.empty((nbands, ny, nx), dtype=np.float32)
+    for row in range(0, ny, tile_size):
+        rows = slice(row, min(row + tile_size, ny))
+        halo_rows = slice(max(row - 1, 0), min(rows.stop + 1, ny))
+        for col in range(0, nx, tile_size):
+            cols = slice(col, min(col + tile_size, nx))
+            halo_cols = slice(max(col - 1, 0), min(cols.stop + 1, nx))
+
+            tiles = np.asarray(
+                elevation[:, halo_rows, halo_cols].values, dtype=np.float64
+            )
+            if fill_value is not None and not np.isnan(fill_value):
+                tiles[tiles == fill_value] = np.nan
+            pad_width = (
+                (rows.start - halo_rows.start, halo_rows.stop - rows.stop),
+                (cols.start - halo_cols.start, halo_cols.stop - cols.stop),
+            )
+            for band, tile in enumerate(tiles):
+                z = np.pad(
+                    tile,
+                    [(1 - before, 1 - after) for before, after in pad_width],
+                    mode="edge",
+                )
+                values = kernel(z, dx[rows], dy)
+                values[np.isnan(z[1:-1, 1:-1])] = np.nan
+                out[band, rows, cols] = values
+
+    result = xr.DataArray(
+        out if da.ndim == 3 else out[0],
+        dims=da.dims,
+        coords=da.coords,
+        name=name,
+        attrs={"units": units, "_FillValue": np.float32(np.nan)},
+    )
+    if "mask" in result.coords:
+        result = result.drop_vars("mask")
+    return result
+
+
+def _spacing(da):
+    """The signed spacings, per row, of columns, and of rows."""
+    x, y = da.x.values, da.y.values
+    dx = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else _resolution(da)[0]
+    dy = (y[-1] - y[0]) / (len(y) - 1) if len(y) > 1 else _resolution(da)[1]
+
+    if da.attrs.get("units") == "degrees":
+        metres_per_degree = np.pi / 180.0 * EARTH_RADIUS
+        dx = dx * metres_per_degree * np.cos(np.radians(y))
+        dy = dy * metres_per_degree
+    else:
+        dx = np.full(len(y), dx)
+    return dx[:, np.newaxis], dy
+
+
+def _resolution(da):
+    transform = da.rio.transform()
+    return transform.a, transform.e
+
+
+def _units(da):
+    units = da.attrs.get("units", "unknown")
+    return {"metre": "m", "meter": "m"}.get(units, units)
@@ -32,3 +32,9 @@ class BadConfigFileError(BmiTopographyError):
     """Raise for an invalid or incomplete config file."""
 
     pass
+
+
+class IncompleteDownloadError(BmiTopographyError):
+    """Raise if a download ends before all of its data are received."""
+
+    pass
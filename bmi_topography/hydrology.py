@@ -0,0 +1,337 @@
+"""Condition loaded DEMs for flow routing: depression filling and D8 flow.
+
+Depressions are filled with the Priority-Flood algorithm of Barnes et al.
+(2014), which visits every pixel once, in order of elevation, from the
+edges of the DEM and its missing values inward. Pixels are held on a
+binary heap, except for those in depressions, which are raised to the
+level of their spill point and go on a first-in, first-out queue, so that
+filling takes O(n log n) time.
+
+Flow directions follow the steepest descent to one of the eight
+neighbours of each pixel (D8), with distances to neighbours taken from
+the DEM's spacing. The filled surface of a depression is flat, so pixels
+without a lower neighbour drain toward the neighbour that the flood
+reached them from, which leads, across the flat, to its spill point.
+Flow accumulation is the number of pixels that drain through each
+pixel, including itself.
+
+Filling and accumulation visit pixels one at a time, in Python, and take
+about 6 s, and 100 MB of memory, per million pixels, so DEMs larger than
+``MAX_PIXELS`` are refused unless a larger limit is asked for. Results
+are cached (see :meth:`Topography.hydrology`), so each DEM is routed only
+once.
+
+References
+----------
+Barnes, R., Lehman, C., and Mulla, D. (2014). Priority-Flood: An optimal
+depression-filling and watershed-labeling algorithm for digital elevation
+models. Computers & Geosciences, 62, 117-127.
+"""
+
+import heapq
+import os
+import tempfile
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from .derivatives import _spacing
+
+D8_CODES = {
+    "E": 1,
+    "SE": 2,
+    "S": 4,
+    "SW": 8,
+    "W": 16,
+    "NW": 32,
+    "N": 64,
+    "NE": 128,
+}
+OUTLET = 0
+NODATA_DIRECTION = 255
+MAX_PIXELS = 4_000_000
+VARIABLES = ("filled_elevation", "flow_direction", "flow_accumulation")
+
+_ROW_OFFSETS = (0, 1, 1, 1, 0, -1, -1, -1)
+_COL_OFFSETS = (1, 1, 0, -1, -1, -1, 0, 1)
+
+
+def check_size(shape, max_pixels=MAX_PIXELS):
+    """Check that a DEM is small enough to route.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        The shape of the DEM, whose last two dimensions are its rows and
+        columns.
+    max_pixels : int or None, optional
+        The largest number of pixels, in each band, to route, or ``None``
+        for no limit.
+
+    Raises
+    ------
+    ValueError
+        If the DEM has more than *max_pixels* pixels in a band.
+
+    Examples
+    --------
+    >>> from bmi_topography.hydrology import check_size
+    >>> check_size((1, 2000, 2000))
+    >>> check_size((1, 3601, 3601))
+    Traceback (most recent call last):
+    ...
+    ValueError: DEM (12967201 pixels) is larger than max_pixels (4000000)...
+    """
+    npixels = int(np.prod(shape[-2:]))
+    if max_pixels is not None and npixels > max_pixels:
+        raise ValueError(
+            f"DEM ({npixels} pixels) is larger than max_pixels ({max_pixels}):"
+            f" routing it would take about {6 * npixels // 1_000_000} s and"
+            f" {100 * npixels // 1_000_000} MB. Load it with a coarser factor or"
+            " resolution, or raise max_pixels."
+        )
+
+
+def route(da, cache_file=None, key=None, max_pixels=MAX_PIXELS):
+    """Fill the depressions of a DEM and route flow over it.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+    cache_file : str or path-like, optional
+        A ``.npz`` file to read the results from, if it was written for
+        the same *key*, or to write them to, if not.
+    key : str, optional
+        Identifies the DEM that the results in *cache_file* are for.
+    max_pixels : int or None, optional
+        The largest number of pixels, in each band, to route, or ``None``
+        for no limit. Results read from *cache_file* aren't limited.
+
+    Returns
+    -------
+    xarray.Dataset
+        The elevations with depressions filled (*filled_elevation*), the
+        D8 flow direction of each pixel as one of the codes of
+        ``D8_CODES``, or ``OUTLET`` for pixels that drain off the DEM
+        (*flow_direction*), and the number of pixels that drain through
+        each pixel (*flow_accumulation*).
+
+    Raises
+    ------
+    ValueError
+        If the DEM has to be routed and is larger than *max_pixels*.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import xarray as xr
+    >>> from bmi_topography.hydrology import route
+    >>> da = xr.DataArray(
+    ...     [[[5.0, 5.0, 5.0], [5.0, 1.0, 4.0], [5.0, 5.0, 5.0]]],
+    ...     dims=("band", "y", "x"),
+    ...     coords={"y": [2.5, 1.5, 0.5], "x": [0.5, 1.5, 2.5]},
+    ...     attrs={"units": "m"},
+    ... )
+    >>> routes = route(da)
+    >>> routes.filled_elevation.values[0]
+    array([[5., 5., 5.],
+           [5., 4., 4.],
+           [5., 5., 5.]], dtype=float32)
+    >>> routes.flow_direction.values[0, 1]
+    array([1, 1, 0], dtype=uint8)
+    >>> int(routes.flow_accumulation[0, 1, 2])
+    9
+    """
+    if cache_file is not None:
+        cached = _read_cache(cache_file, key)
+        if cached is not None:
+            return _to_dataset(da, *cached)
+    check_size(da.shape, max_pixels)
+
+    elevation = da if da.ndim == 3 else da.expand_dims("band")
+    fill_value = elevation.attrs.get("_FillValue")
+    dx, dy = _spacing(elevation)
+
+    filled = np.empty(elevation.shape, dtype=np.float32)
+    direction = np.empty(elevation.shape, dtype=np.uint8)
+    accumulation = np.empty(elevation.shape, dtype=np.uint32)
+    for band in range(elevation.shape[0]):
+        z = np.asarray(elevation[band].values, dtype=np.float64)
+        if fill_value is not None and not np.isnan(fill_value):
+            z[z == fill_value] = np.nan
+        filled[band], direction[band], accumulation[band] = _route(
+            z, np.abs(dx[:, 0]), abs(dy)
+        )
+
+    if da.ndim == 2:
+        filled, direction, accumulation = filled[0], direction[0], accumulation[0]
+    if cache_file is not None:
+        _write_cache(cache_file, key, filled, direction, accumulation)
+
+    return _to_dataset(da, filled, direction, accumulation)
+
+
+def _route(z, dx, dy):
+    """Fill, and route flow over, a 2D array of elevations."""
+    ny, nx = z.shape
+    width = nx + 2
+    padded = np.full((ny + 2, width), np.nan)
+    padded[1:-1, 1:-1] = z
+    offsets = [row * width + col for row, col in zip(_ROW_OFFSETS, _COL_OFFSETS)]
+
+    filled, from_neighbour, order = _priority_flood(padded, offsets)
+    filled = filled.reshape(padded.shape)
+
+    receiver = _steepest_descent(filled, dx, dy)
+    receiver = np.where(receiver < 0, from_neighbour.reshape(padded.shape), receiver)
+    missing = np.isnan(filled)
+    receiver[missing] = -1
+
+    accumulation = np.zeros(padded.size, dtype=np.int64)
+    accumulation[order] = 1
+    _accumulate(accumulation, receiver.ravel(), offsets, order)
+
+    direction = np.full(padded.shape, OUTLET, dtype=np.uint8)
+    for k, code in enumerate(D8_CODES.values()):
+        direction[receiver == k] = code
+    direction[missing] = NODATA_DIRECTION
+
+    return (
+        filled[1:-1, 1:-1],
+        direction[1:-1, 1:-1],
+        accumulation.reshape(padded.shape)[1:-1, 1:-1],
+    )
+
+
+def _priority_flood(padded, offsets):
+    """Fill depressions in elevations surrounded by a border of NaNs.
+
+    Returns the filled elevations, the direction toward the neighbour that
+    the flood reached each pixel from (or -1), and the order in which
+    pixels were visited, all as flat arrays.
+
+    The arrays are NumPy arrays, read and written one pixel at a time
+    through memoryviews, which is faster than indexing them as arrays.
+    """
+    missing = np.isnan(padded)
+
+    next_to_missing = np.zeros_like(missing)
+    for row, col in zip(_ROW_OFFSETS, _COL_OFFSETS):
+        next_to_missing[1:-1, 1:-1] |= missing[
+            1 + row : padded.shape[0] - 1 + row, 1 + col : padded.shape[1] - 1 + col
+        ]
+    seeds = np.flatnonzero(next_to_missing & ~missing)
+
+    filled = padded.astype(np.float64).ravel()
+    closed = missing.ravel().view(np.uint8).copy()
+    closed[seeds] = 1
+    from_neighbour = np.full(filled.size, -1, dtype=np.int8)
+    order = np.empty(np.count_nonzero(~missing), dtype=np.int64)
+
+    level_of, is_closed = memoryview(filled), memoryview(closed)
+    came_from, visited = memoryview(from_neighbour), memoryview(order)
+
+    heap = list(zip(filled[seeds].tolist(), seeds.tolist()))
+    heapq.heapify(heap)
+    pit = deque()
+
+    push, pop = heapq.heappush, heapq.heappop
+    enqueue, dequeue = pit.append, pit.popleft
+    neighbours = [(offset, (k + 4) % 8) for k, offset in enumerate(offsets)]
+    n_visited = 0
+    while heap or pit:
+        cell = dequeue() if pit else pop(heap)[1]
+        visited[n_visited] = cell
+        n_visited += 1
+
+        level = level_of[cell]
+        for offset, toward in neighbours:
+            neighbour = cell + offset
+            if is_closed[neighbour]:
+                continue
+            is_closed[neighbour] = 1
+            came_from[neighbour] = toward
+            if level_of[neighbour] <= level:
+                level_of[neighbour] = level
+                enqueue(neighbour)
+            else:
+                push(heap, (level_of[neighbour], neighbour))
+
+    return filled, from_neighbour, order[:n_visited]
+
+
+def _steepest_descent(filled, dx, dy):
+    """The direction to each pixel's steepest downhill neighbour, or -1."""
+    ny, nx = filled.shape[0] - 2, filled.shape[1] - 2
+    center = filled[1:-1, 1:-1]
+    dx = dx[:, np.newaxis]
+
+    steepest = np.zeros((ny, nx))
+    receiver = np.full(filled.shape, -1, dtype=np.int8)
+    for k, (row, col) in enumerate(zip(_ROW_OFFSETS, _COL_OFFSETS)):
+        neighbour = filled[1 + row : 1 + row + ny, 1 + col : 1 + col + nx]
+        with np.errstate(invalid="ignore"):
+            drop = (center - neighbour) / np.hypot(col * dx, row * dy)
+        is_steeper = drop > steepest
+        steepest[is_steeper] = drop[is_steeper]
+        receiver[1:-1, 1:-1][is_steeper] = k
+    return receiver
+
+
+def _accumulate(accumulation, receiver, offsets, order):
+    """Add the accumulation of each pixel to its receiver, upstream first."""
+    counts = accumulation.tolist()
+    receiver = receiver.tolist()
+    for cell in reversed(order.tolist()):
+        k = receiver[cell]
+        if k >= 0:
+            counts[cell + offsets[k]] += counts[cell]
+    accumulation[:] = counts
+
+
+def _to_dataset(da, filled, direction, accumulation):
+    coords = {name: coord for name, coord in da.coords.items() if name != "mask"}
+    return xr.Dataset(
+        {
+            "filled_elevation": (
+                da.dims,
+                filled,
+                {
+                    "units": da.attrs.get("units", "unknown"),
+                    "_FillValue": np.float32(np.nan),
+                },
+            ),
+            "flow_direction": (
+                da.dims,
+                direction,
+                {"units": "1", "_FillValue": np.uint8(NODATA_DIRECTION)},
+            ),
+            "flow_accumulation": (da.dims, accumulation, {"units": "1"}),
+        },
+        coords=coords,
+    )
+
+
+def _read_cache(cache_file, key):
+    try:
+        with np.load(cache_file) as cached:
+            if str(cached["key"]) != str(key):
+                return None
+            return tuple(cached[name] for name in VARIABLES)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(cache_file, key, *arrays):
+    cache_file = Path(cache_file)
+    fd, tmp = tempfile.mkstemp(dir=cache_file.parent, suffix=".npz.part")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            np.savez(fp, key=str(key), **dict(zip(VARIABLES, arrays)))
+        os.replace(tmp, cache_file)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
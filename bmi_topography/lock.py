@@ -0,0 +1,109 @@
+"""Locks that serialize work on a cache file across threads and processes."""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+if sys.platform == "win32":
+    import msvcrt
+
+    def _lock_fd(fd):
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                time.sleep(0.05)
+            else:
+                return
+
+    def _unlock_fd(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def _lock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class FileLock:
+    """An exclusive lock on a path, shared by threads and processes.
+
+    Threads within a process wait on an in-memory lock for the path, so
+    only one of them at a time holds an operating-system lock on the lock
+    file. Other processes wait on that lock file.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The lock file. It is created if it doesn't exist, and is left in
+        place after the lock is released.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from pathlib import Path
+    >>> from bmi_topography.lock import FileLock
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     with FileLock(Path(tmp) / "dem.tif.lock") as lock:
+    ...         lock.is_locked
+    ...
+    True
+    """
+
+    _thread_locks = {}
+    _thread_locks_lock = threading.Lock()
+
+    def __init__(self, path):
+        self._path = Path(path).absolute()
+        self._fd = None
+
+        with FileLock._thread_locks_lock:
+            self._thread_lock = FileLock._thread_locks.setdefault(
+                str(self._path), threading.Lock()
+            )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def is_locked(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Block until the lock is held."""
+        self._thread_lock.acquire()
+        try:
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                _lock_fd(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+
+    def release(self):
+        """Release the lock."""
+        fd, self._fd = self._fd, None
+        try:
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,185 @@
+"""A process-wide store of loaded DEMs shared by Topography instances."""
+
+import os
+import threading
+from collections import OrderedDict
+
+from .cache import parse_size
+
+DEFAULT_MEMORY_BUDGET = 1 << 30
+MEMORY_BUDGET_ENV_VAR = "BMI_TOPOGRAPHY_MEMORY_BUDGET"
+
+_lock = threading.Lock()
+_registry = None
+
+
+class Registry:
+    """Loaded DataArrays, shared within a process under a memory budget.
+
+    Each DataArray is loaded once, by the first caller to ask for its key,
+    and its data are then marked read-only and shared by everyone that
+    asks for the same key. Callers get their own shallow copy, so they can
+    rename it or change its attributes without affecting each other. When
+    the arrays held take more memory than the budget allows, the least
+    recently used are dropped.
+
+    Parameters
+    ----------
+    max_bytes : int or str, optional
+        The memory budget, as a number of bytes or a size like ``"2G"``. If
+        not provided, the value of the ``BMI_TOPOGRAPHY_MEMORY_BUDGET``
+        environment variable is used, falling back to
+        ``DEFAULT_MEMORY_BUDGET``.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import xarray as xr
+    >>> from bmi_topography.registry import Registry
+    >>> registry = Registry(max_bytes="1K")
+    >>> da = registry.get("ones", lambda: xr.DataArray(np.ones(8)))
+    >>> da.values.flags.writeable
+    False
+    >>> registry.get("ones", lambda: None).values is da.values
+    True
+    >>> registry.stats()
+    {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1, 'nbytes': 64}
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = os.environ.get(MEMORY_BUDGET_ENV_VAR, DEFAULT_MEMORY_BUDGET)
+        self._max_bytes = parse_size(max_bytes)
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._loading = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = parse_size(max_bytes)
+            self._evict(self._max_bytes)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key, loader):
+        """Get a shared DataArray, loading it if it isn't held.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the data, for example by file and load options.
+        loader : callable
+            A function, taking no arguments, that returns the DataArray,
+            with its data in memory. It is called only if no DataArray is
+            held for *key*, and by only one thread at a time.
+
+        Returns
+        -------
+        xarray.DataArray
+            A shallow copy of the shared DataArray.
+        """
+        with self._lock:
+            da = self._lookup(key)
+            if da is None:
+                key_lock = self._loading.setdefault(key, threading.Lock())
+
+        if da is None:
+            with key_lock:
+                with self._lock:
+                    da = self._lookup(key)
+                if da is None:
+                    da = loader()
+                    da.values.flags.writeable = False
+                    with self._lock:
+                        self._stats["misses"] += 1
+                        self._insert(key, da)
+                        self._loading.pop(key, None)
+
+        return da.copy(deep=False)
+
+    def clear(self):
+        """Drop all held DataArrays."""
+        with self._lock:
+            self._evict(0)
+
+    def stats(self):
+        """Count lookups and report the memory held.
+
+        Returns
+        -------
+        dict
+            The number of lookups that found a held DataArray (*hits*) and
+            that had to load one (*misses*), the number of DataArrays
+            dropped to stay within the budget (*evictions*), and the number
+            of DataArrays held (*entries*) and bytes they use (*nbytes*).
+        """
+        with self._lock:
+            return self._stats | {
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _lookup(self, key):
+        da = self._entries.get(key)
+        if da is not None:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        return da
+
+    def _insert(self, key, da):
+        if da.nbytes > self._max_bytes:
+            return
+        self._evict(self._max_bytes - da.nbytes)
+        self._entries[key] = da
+        self._nbytes += da.nbytes
+
+    def _evict(self, max_bytes):
+        while self._entries and self._nbytes > max_bytes:
+            _, da = self._entries.popitem(last=False)
+            self._nbytes -= da.nbytes
+            self._stats["evictions"] += 1
+
+
+def get_registry():
+    """Get the process-wide registry of loaded DEMs, creating it if needed.
+
+    Returns
+    -------
+    Registry
+        The shared registry.
+    """
+    global _registry
+
+    with _lock:
+        if _registry is None:
+            _registry = Registry()
+        return _registry
+
+
+def set_memory_budget(max_bytes):
+    """Change the memory budget of the process-wide registry.
+
+    Parameters
+    ----------
+    max_bytes : int or str
+        The memory budget, as a number of bytes or a size like ``"2G"``.
+        Loaded DEMs are dropped, least recently used first, to fit.
+    """
+    get_registry().max_bytes = max_bytes
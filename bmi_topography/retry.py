@@ -0,0 +1,314 @@
+"""Retry failed downloads and limit the rate of requests to OpenTopography."""
+
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+
+from .errors import IncompleteDownloadError
+
+RATE_LIMIT_ENV_VAR = "BMI_TOPOGRAPHY_RATE_LIMIT"
+
+_stats_lock = threading.Lock()
+_stats = {"retries": 0, "throttled": 0, "waits": 0, "wait_time": 0.0}
+
+
+class Retry:
+    """How many times, and how long to wait before, retrying a download.
+
+    The wait before retry *n* (counting from zero) is drawn uniformly from
+    ``[0, backoff_factor * 2**n]``, capped at *max_backoff*. If the server
+    sends a ``Retry-After`` header, that is used instead, unless it is
+    longer than *max_backoff*, in which case the request isn't retried.
+
+    Parameters
+    ----------
+    max_retries : int, optional
+        The number of times to retry a failed request.
+    backoff_factor : float, optional
+        The base wait time, in seconds.
+    max_backoff : float, optional
+        The longest time to wait between retries, in seconds.
+    status_forcelist : iterable of int, optional
+        HTTP status codes that should be retried.
+
+    Examples
+    --------
+    >>> from bmi_topography.retry import Retry
+    >>> Retry(max_retries=3)
+    Retry(max_retries=3, backoff_factor=0.5, max_backoff=60.0)
+    """
+
+    DEFAULT_STATUS_FORCELIST = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        max_retries=5,
+        backoff_factor=0.5,
+        max_backoff=60.0,
+        status_forcelist=None,
+    ):
+        if max_retries < 0:
+            raise ValueError(f"max_retries ({max_retries}) must not be negative")
+        self._max_retries = int(max_retries)
+        self._backoff_factor = float(backoff_factor)
+        self._max_backoff = float(max_backoff)
+        self._status_forcelist = frozenset(
+            Retry.DEFAULT_STATUS_FORCELIST
+            if status_forcelist is None
+            else status_forcelist
+        )
+
+    @classmethod
+    def from_value(cls, value):
+        """Create a retry policy from a number of retries or an existing policy."""
+        if value is None:
+            return cls()
+        elif isinstance(value, Retry):
+            return value
+        else:
+            return cls(max_retries=value)
+
+    @property
+    def max_retries(self):
+        return self._max_retries
+
+    @property
+    def max_backoff(self):
+        return self._max_backoff
+
+    @property
+    def status_forcelist(self):
+        return self._status_forcelist
+
+    def is_retryable(self, status_code):
+        """Check if a response with this status code should be retried."""
+        return status_code in self._status_forcelist
+
+    def backoff(self, attempt, response=None):
+        """The time to wait, in seconds, before the next attempt.
+
+        Parameters
+        ----------
+        attempt : int
+            The number of retries made so far.
+        response : requests.Response, optional
+            The failed response, whose ``Retry-After`` header is honored in
+            full, even if it is longer than *max_backoff*.
+        """
+        if response is not None:
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(
+            0.0, min(self._backoff_factor * 2**attempt, self._max_backoff)
+        )
+
+    def __repr__(self):
+        return (
+            f"Retry(max_retries={self._max_retries},"
+            f" backoff_factor={self._backoff_factor},"
+            f" max_backoff={self._max_backoff})"
+        )
+
+
+class RateLimiter:
+    """A token bucket that limits how often requests are made.
+
+    Parameters
+    ----------
+    rate : float
+        The sustained number of requests allowed per second.
+    burst : int, optional
+        The number of requests that can be made at once before the rate
+        applies.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError(f"rate ({rate}) must be positive")
+        if burst < 1:
+            raise ValueError(f"burst ({burst}) must be at least 1")
+        self._rate = float(rate)
+        self._burst = int(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    def acquire(self):
+        """Block until a request is allowed.
+
+        Returns
+        -------
+        float
+            The time waited, in seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) * self._rate
+            )
+            self._updated = now
+            self._tokens -= 1.0
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+        if wait > 0.0:
+            _count(waits=1, wait_time=wait)
+            time.sleep(wait)
+        return wait
+
+
+def call_with_retry(func, retry, rate_limiter=None):
+    """Call a function that makes a request, retrying if it fails.
+
+    Parameters
+    ----------
+    func : callable
+        A function, taking no arguments, that makes a request.
+    retry : Retry
+        The retry policy.
+    rate_limiter : RateLimiter, optional
+        A rate limiter to acquire before each attempt.
+
+    Returns
+    -------
+    object
+        The value returned by *func*.
+
+    Raises
+    ------
+    requests.exceptions.HTTPError
+        If the request fails with an error that isn't retried, the retries
+        run out, or the server asks, with a ``Retry-After`` header, for a
+        wait longer than the policy's *max_backoff*.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return func()
+        except requests.exceptions.HTTPError as error:
+            response = error.response
+            if response.status_code == 429:
+                _count(throttled=1)
+            if (
+                not retry.is_retryable(response.status_code)
+                or attempt >= retry.max_retries
+            ):
+                raise
+            wait = retry.backoff(attempt, response)
+            if wait > retry.max_backoff:
+                raise
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownloadError,
+        ):
+            if attempt >= retry.max_retries:
+                raise
+            wait = retry.backoff(attempt)
+
+        time.sleep(wait)
+        attempt += 1
+        _count(retries=1)
+
+
+_limiters_lock = threading.Lock()
+_limiters = {}
+
+
+def get_rate_limiter(api_key):
+    """Get the rate limiter shared by all requests made with an API key.
+
+    Parameters
+    ----------
+    api_key : ApiKey or str
+        The key that requests are made with.
+
+    Returns
+    -------
+    RateLimiter or None
+        The limiter for the key, or ``None`` if requests made with the key
+        are not limited. Unless set with :func:`set_rate_limit`, the limit
+        is taken from the ``BMI_TOPOGRAPHY_RATE_LIMIT`` environment
+        variable, in requests per second.
+    """
+    key = str(api_key)
+    with _limiters_lock:
+        if key not in _limiters:
+            rate = os.environ.get(RATE_LIMIT_ENV_VAR)
+            _limiters[key] = RateLimiter(float(rate)) if rate else None
+        return _limiters[key]
+
+
+def set_rate_limit(api_key, rate, burst=1):
+    """Limit the rate of requests made with an API key.
+
+    Parameters
+    ----------
+    api_key : ApiKey or str
+        The key that requests are made with.
+    rate : float or None
+        The sustained number of requests allowed per second, or ``None``
+        to remove the limit.
+    burst : int, optional
+        The number of requests that can be made at once before the rate
+        applies.
+    """
+    with _limiters_lock:
+        _limiters[str(api_key)] = None if rate is None else RateLimiter(rate, burst)
+
+
+def retry_stats():
+    """Count the retries and throttling of requests made by this process.
+
+    Returns
+    -------
+    dict
+        The number of *retries*, the number of responses from the server
+        asking the client to slow down (*throttled*), and the number and
+        total duration, in seconds, of waits imposed by rate limiters
+        (*waits* and *wait_time*).
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_retry_stats():
+    """Reset the counts reported by :func:`retry_stats`."""
+    with _stats_lock:
+        _stats.update(retries=0, throttled=0, waits=0, wait_time=0.0)
+
+
+def _count(**kwds):
+    with _stats_lock:
+        for name, value in kwds.items():
+            _stats[name] += value
+
+
+def _parse_retry_after(value):
+    """Parse a Retry-After header into a number of seconds."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,151 @@
+"""Sample rasters at many points at once."""
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform as transform_points
+from rasterio.windows import Window
+
+SAMPLE_METHODS = ("nearest", "bilinear")
+DEFAULT_TILE_SIZE = 512
+
+
+def point_pixels(transform, crs, lats, lons):
+    """Find the fractional pixel coordinates of points.
+
+    Parameters
+    ----------
+    transform : affine.Affine
+        The raster's transform.
+    crs : rasterio.crs.CRS or str or None
+        The raster's CRS. If it isn't geographic, the points are transformed
+        into it. If ``None``, the points are taken to be in the raster's
+        coordinates already.
+    lats, lons : array_like of float
+        The latitudes and longitudes of the points.
+
+    Returns
+    -------
+    tuple of ndarray
+        The rows and columns of the points, measured in pixels from the
+        upper-left corner of the raster. The center of the upper-left pixel
+        is at ``(0.5, 0.5)``.
+
+    Examples
+    --------
+    >>> from affine import Affine
+    >>> from bmi_topography.sample import point_pixels
+    >>> transform = Affine(0.5, 0.0, -105.0, 0.0, -0.5, 41.0)
+    >>> rows, cols = point_pixels(transform, "EPSG:4326", [40.75], [-104.0])
+    >>> rows, cols
+    (array([0.5]), array([2.]))
+    """
+    lats = np.asarray(lats, dtype=float).reshape(-1)
+    lons = np.asarray(lons, dtype=float).reshape(-1)
+    if lats.shape != lons.shape:
+        raise ValueError(
+            f"lats ({lats.size} points) and lons ({lons.size} points) must match"
+        )
+
+    if crs is None or CRS.from_user_input(crs).is_geographic:
+        xs, ys = lons, lats
+    else:
+        xs, ys = (
+            np.asarray(coords)
+            for coords in transform_points("EPSG:4326", crs, lons, lats)
+        )
+
+    cols, rows = ~transform * (xs, ys)
+    return np.asarray(rows, dtype=float), np.asarray(cols, dtype=float)
+
+
+def sample_raster(path, lats, lons, method="nearest", tile_size=DEFAULT_TILE_SIZE):
+    """Sample the first band of a raster at points.
+
+    Points are grouped by the square tile of the raster that they fall in,
+    and each tile with points in it is read once, so sampling reads no more
+    of the raster than needed.
+
+    Parameters
+    ----------
+    path : str or path-like
+        The raster.
+    lats, lons : array_like of float
+        The latitudes and longitudes of the points.
+    method : {"nearest", "bilinear"}, optional
+        Take the value of the pixel that a point falls in, or interpolate
+        between the centers of the four pixels around it.
+    tile_size : int, optional
+        The width and height, in pixels, of the tiles that points are
+        grouped by.
+
+    Returns
+    -------
+    ndarray of float
+        The value at each point. Points outside of the raster, or that
+        depend on a pixel with a missing value, are NaN.
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(
+            f"method ({method!r}) must be one of {', '.join(SAMPLE_METHODS)}"
+        )
+    if tile_size < 1:
+        raise ValueError(f"tile_size ({tile_size}) must be at least 1")
+
+    with rasterio.open(path) as src:
+        rows, cols = point_pixels(src.transform, src.crs, lats, lons)
+        values = np.full(rows.shape, np.nan)
+
+        inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+        if method == "nearest":
+            row0 = np.floor(rows).astype(np.int64)
+            col0 = np.floor(cols).astype(np.int64)
+        else:
+            rows = np.clip(rows - 0.5, 0, src.height - 1)
+            cols = np.clip(cols - 0.5, 0, src.width - 1)
+            row0 = np.minimum(rows.astype(np.int64), max(src.height - 2, 0))
+            col0 = np.minimum(cols.astype(np.int64), max(src.width - 2, 0))
+
+        points = np.flatnonzero(inside)
+        if points.size == 0:
+            return values
+
+        tile = (row0[points] // tile_size) * (src.width // tile_size + 1) + (
+            col0[points] // tile_size
+        )
+        by_tile = np.argsort(tile, kind="stable")
+        _, starts = np.unique(tile[by_tile], return_index=True)
+
+        for in_tile in np.split(points[by_tile], starts[1:]):
+            top, left = row0[in_tile].min(), col0[in_tile].min()
+            bottom = min(row0[in_tile].max() + 2, src.height)
+            right = min(col0[in_tile].max() + 2, src.width)
+
+            window = Window(left, top, right - left, bottom - top)
+            block = src.read(1, window=window, masked=True).astype(float)
+
+            values[in_tile] = _interpolate(
+                block.filled(np.nan),
+                row0[in_tile] - top,
+                col0[in_tile] - left,
+                rows[in_tile] - top,
+                cols[in_tile] - left,
+                method,
+            )
+
+    return values
+
+
+def _interpolate(block, row0, col0, rows, cols, method):
+    if method == "nearest":
+        return block[row0, col0]
+
+    row1 = np.minimum(row0 + 1, block.shape[0] - 1)
+    col1 = np.minimum(col0 + 1, block.shape[1] - 1)
+    dy, dx = rows - row0, cols - col0
+    return (
+        block[row0, col0] * (1.0 - dy) * (1.0 - dx)
+        + block[row0, col1] * (1.0 - dy) * dx
+        + block[row1, col0] * dy * (1.0 - dx)
+        + block[row1, col1] * dy * dx
+    )
@@ -0,0 +1,111 @@
+"""A shared, pooled HTTP session for downloads from OpenTopography."""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 16
+POOL_SIZE_ENV_VAR = "BMI_TOPOGRAPHY_POOL_SIZE"
+
+_lock = threading.Lock()
+_session = None
+
+
+def create_session(pool_size=None):
+    """Create an HTTP session that keeps connections alive for reuse.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        The maximum number of connections kept open to each host. If not
+        provided, the value of the ``BMI_TOPOGRAPHY_POOL_SIZE`` environment
+        variable is used, falling back to ``DEFAULT_POOL_SIZE``.
+
+    Returns
+    -------
+    requests.Session
+        A new session.
+    """
+    if pool_size is None:
+        pool_size = int(os.environ.get(POOL_SIZE_ENV_VAR, DEFAULT_POOL_SIZE))
+    if pool_size < 1:
+        raise ValueError(f"pool size ({pool_size}) must be at least 1")
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Get the process-wide HTTP session, creating it if needed.
+
+    Returns
+    -------
+    requests.Session
+        The shared session.
+    """
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def set_session(session):
+    """Replace the process-wide HTTP session.
+
+    Parameters
+    ----------
+    session : requests.Session or None
+        The session to share. If ``None``, a new default session is
+        created on next use.
+    """
+    global _session
+
+    with _lock:
+        _session = session
+
+
+def session_stats(session=None):
+    """Count connections opened and requests made by a session.
+
+    Parameters
+    ----------
+    session : requests.Session, optional
+        The session to report on. If not provided, report on the
+        process-wide session.
+
+    Returns
+    -------
+    dict
+        The number of *connections* opened, *requests* made, and requests
+        that *reused* an already-open connection.
+
+    Examples
+    --------
+    >>> from bmi_topography.session import create_session, session_stats
+    >>> session_stats(create_session())
+    {'connections': 0, 'requests': 0, 'reused': 0}
+    """
+    session = session or get_session()
+
+    connections = requests_made = 0
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_made += pool.num_requests
+
+    return {
+        "connections": connections,
+        "requests": requests_made,
+        "reused": requests_made - connections,
+    }
@@ -0,0 +1,204 @@
+"""Share loaded DEMs between processes through shared memory.
+
+A DEM is copied, once, into a block of shared memory by :func:`publish`.
+Worker processes are sent a :class:`SharedDemHandle`, which holds only the
+block's name and the DEM's shape, type and georeferencing, and so pickles
+in constant time whatever the size of the DEM. Each worker then maps the
+block with :func:`attach`, without copying it, so that the memory used and
+the time taken to start N workers don't grow with N.
+
+The process that publishes a DEM owns its block. The block is removed when
+the owner's :class:`SharedDem` is closed, when it leaves a ``with`` block,
+or, at the latest, when it is garbage collected or the process exits.
+Each call to :func:`attach` maps the block anew, and the mapping is closed
+as soon as the array, or DataArray, that it returned, and every view of
+it, has been garbage collected. A worker that keeps its arrays keeps the
+block's memory in use, even after the owner has removed the block.
+"""
+
+import ctypes
+import weakref
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+import xarray as xr
+from affine import Affine
+
+SharedDemHandle = namedtuple(
+    "SharedDemHandle",
+    ["name", "shape", "dtype", "transform", "crs", "units", "nodata"],
+)
+
+
+class SharedDem:
+    """A DEM published into shared memory by this process.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`. Lazy (dask)
+        arrays are computed as they are copied.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> import xarray as xr
+    >>> from bmi_topography.shared import SharedDem, attach
+    >>> da = xr.DataArray(
+    ...     np.arange(6.0).reshape(1, 2, 3),
+    ...     dims=("band", "y", "x"),
+    ...     coords={"band": [1], "y": [1.5, 0.5], "x": [0.5, 1.5, 2.5]},
+    ... )
+    >>> with SharedDem(da) as shared:
+    ...     attach(shared.handle).values.tolist()
+    ...
+    [[[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]]]
+    """
+
+    def __init__(self, da):
+        elevation = da if da.ndim == 3 else da.expand_dims("band")
+        values = elevation.values
+        crs = elevation.rio.crs
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=self._shm.buf)[...] = values
+        self._finalizer = weakref.finalize(self, _remove, self._shm)
+
+        self._handle = SharedDemHandle(
+            name=self._shm.name,
+            shape=values.shape,
+            dtype=values.dtype.str,
+            transform=tuple(elevation.rio.transform())[:6],
+            crs=None if crs is None else crs.to_wkt(),
+            units=da.attrs.get("units", "unknown"),
+            nodata=da.attrs.get("_FillValue"),
+        )
+
+    @property
+    def handle(self):
+        """The picklable handle that workers attach to the DEM with."""
+        return self._handle
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def close(self):
+        """Remove the block of shared memory.
+
+        Arrays already attached to the block keep their views of it, but
+        no more can be attached, by this or any other process.
+        """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def publish(da):
+    """Copy a DEM into shared memory.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Elevations, as returned by :meth:`Topography.load`.
+
+    Returns
+    -------
+    SharedDem
+        The published DEM. Send its :attr:`~SharedDem.handle` to workers,
+        and close it when they are done.
+    """
+    return SharedDem(da)
+
+
+def attach_array(handle):
+    """Map a published DEM as a read-only NumPy array, without copying it.
+
+    Parameters
+    ----------
+    handle : SharedDemHandle
+        The handle of a published DEM.
+
+    Returns
+    -------
+    numpy.ndarray
+        The elevations, with shape *(band, y, x)*. The block stays mapped
+        until the array, and every view of it, is garbage collected.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the block has been removed by its owner.
+    """
+    shm = shared_memory.SharedMemory(name=handle.name)
+    return np.asarray(_Mapping(shm, handle.shape, handle.dtype))
+
+
+def attach(handle):
+    """Map a published DEM as a read-only DataArray, without copying it.
+
+    Parameters
+    ----------
+    handle : SharedDemHandle
+        The handle of a published DEM.
+
+    Returns
+    -------
+    xarray.DataArray
+        The elevations, with the coordinates, CRS and attributes of the
+        published DataArray.
+    """
+    values = attach_array(handle)
+
+    transform = Affine(*handle.transform)
+    nbands, ny, nx = values.shape
+    x, _ = transform * (np.arange(nx) + 0.5, np.full(nx, 0.5))
+    _, y = transform * (np.full(ny, 0.5), np.arange(ny) + 0.5)
+
+    da = xr.DataArray(
+        values,
+        dims=("band", "y", "x"),
+        coords={"band": np.arange(1, nbands + 1), "y": y, "x": x},
+        attrs={"units": handle.units},
+    )
+    if handle.nodata is not None:
+        da.attrs["_FillValue"] = values.dtype.type(handle.nodata)
+    if handle.crs is not None:
+        da.rio.write_crs(handle.crs, inplace=True)
+    da.rio.write_transform(transform, inplace=True)
+    return da
+
+
+class _Mapping:
+    """A mapping of a block of shared memory that NumPy arrays view.
+
+    Arrays made from the mapping hold it as their base, so it is closed
+    once the last of them is garbage collected.
+    """
+
+    def __init__(self, shm, shape, dtype):
+        self._shm = shm
+        self._start = ctypes.c_char.from_buffer(shm.buf)
+        self.__array_interface__ = {
+            "shape": tuple(shape),
+            "typestr": np.dtype(dtype).str,
+            "data": (ctypes.addressof(self._start), True),
+            "version": 3,
+        }
+
+    def __del__(self):
+        self._start = None
+        self._shm.close()
+
+
+def _remove(shm):
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        pass
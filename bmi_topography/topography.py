@@ -1,18 +1,56 @@
 """Base class to access elevation data"""
 
+import asyncio
+import hashlib
+import math
 import os
+import shutil
+import tempfile
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from urllib.parse import ParseResult, urlencode, urlunparse
+from urllib.parse import ParseResult, parse_qsl, urlencode, urlparse, urlunparse
 
-import requests
+import numpy as np
+import rasterio
 import rioxarray
+from affine import Affine
 from rasterio.crs import CRS
-from rasterio.errors import CRSError
+from rasterio.errors import CRSError, WindowError
+from rasterio.windows import Window
 
 from .api_key import ApiKey
 from .bbox import BoundingBox
-from .errors import BoundingBoxError
+from .cache import (
+    CacheIndex,
+    bbox_window,
+    build_overview,
+    crop,
+    file_digest,
+    hydrology_file,
+    import_zarr,
+    merge_tiles,
+    npy_files,
+    open_npy,
+    open_zarr,
+    parse_size,
+    pyramid_dir,
+    pyramid_factors,
+    pyramid_level,
+    raster_header,
+    to_cog,
+    to_npy,
+    to_zarr,
+    zarr_store,
+)
+from .errors import BoundingBoxError, IncompleteDownloadError
+from .hydrology import MAX_PIXELS, route
+from .lock import FileLock
+from .registry import get_registry
+from .retry import Retry, call_with_retry, get_rate_limiter
+from .sample import sample_raster
+from .session import get_session
 
 
 class Topography:
@@ -33,6 +71,9 @@ class Topography:
         "cache_dir": "~/.bmi_topography",
     }
 
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_MAX_CONCURRENCY = 16
+
     VALID_GLOBALDEM_TYPES = (
         "SRTMGL3",
         "SRTMGL1",
@@ -57,6 +98,8 @@ class Topography:
     )
     VALID_DEM_TYPES = VALID_GLOBALDEM_TYPES + VALID_USGSDEM_TYPES
     VALID_OUTPUT_FORMATS = {"GTiff": "tif", "AAIGrid": "asc", "HFA": "img"}
+    VALID_CACHE_LAYOUTS = ("raw", "cog", "zarr", "npy")
+    VALID_NODATA = ("sentinel", "mask", "nan")
 
     def __init__(
         self,
@@ -68,6 +111,13 @@ class Topography:
         output_format="GTiff",
         cache_dir=None,
         api_key=None,
+        tile_size=None,
+        max_workers=None,
+        session=None,
+        retry=None,
+        crop_from_cache=True,
+        cache_max_size=None,
+        cache_layout="raw",
     ):
         self._api_key = ApiKey.from_sources(api_key)
         # if api_key is None:
@@ -93,6 +143,16 @@ class Topography:
                 % [k for k in Topography.VALID_OUTPUT_FORMATS.keys()]
             )
 
+        if cache_layout not in Topography.VALID_CACHE_LAYOUTS:
+            raise ValueError(
+                f"cache_layout must be one of {Topography.VALID_CACHE_LAYOUTS}."
+            )
+        if cache_layout == "cog" and output_format != "GTiff":
+            raise ValueError("cache_layout 'cog' requires the GTiff output_format.")
+        if cache_layout == "zarr":
+            import_zarr()
+        self._cache_layout = cache_layout
+
         if None in (south, west, north, east):
             raise BoundingBoxError(
                 "'north', 'east', 'south', and 'west' parameters are required"
@@ -102,6 +162,7 @@ class Topography:
         self._url = self._build_url()
 
         self._da = None
+        self._load_options = None
 
         if cache_dir is None:
             cache_dir = os.environ.get(
@@ -109,6 +170,18 @@ class Topography:
             )
         self._cache_dir = Path(cache_dir).expanduser().resolve().absolute()
 
+        if cache_max_size is None:
+            cache_max_size = os.environ.get("BMI_TOPOGRAPHY_CACHE_MAX_SIZE")
+        self._cache_max_size = (
+            None if cache_max_size is None else parse_size(cache_max_size)
+        )
+
+        self._tile_size = tile_size
+        self._max_workers = max_workers or Topography.DEFAULT_MAX_WORKERS
+        self._session = session
+        self._retry = Retry.from_value(retry)
+        self._crop_from_cache = bool(crop_from_cache)
+
     @property
     def server(self):
         return str(self._server)
@@ -133,6 +206,51 @@ class Topography:
     def cache_dir(self):
         return self._cache_dir
 
+    @property
+    def cache_layout(self):
+        """How cached files are organized.
+
+        Either *raw*, for files stored as they were downloaded, *cog*,
+        for files rewritten as tiled, compressed Cloud-Optimized GeoTIFFs
+        with overviews, *zarr*, for files that are also copied into a
+        chunked, compressed Zarr store from which :meth:`load` reads, or
+        *npy*, for files that are also copied into a raw ``.npy`` array,
+        with a JSON file of metadata, that :meth:`load` memory-maps.
+        """
+        return self._cache_layout
+
+    @property
+    def cache_max_size(self):
+        """The size, in bytes, that the cache is trimmed to after a fetch."""
+        return self._cache_max_size
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @property
+    def crop_from_cache(self):
+        return self._crop_from_cache
+
+    @property
+    def retry(self):
+        """The policy for retrying failed downloads."""
+        return self._retry
+
+    @property
+    def session(self):
+        """The HTTP session used for downloads.
+
+        Unless a session was passed when the instance was created, this is
+        the process-wide session from :func:`bmi_topography.session.get_session`,
+        so connections are reused across instances.
+        """
+        return self._session or get_session()
+
     @staticmethod
     def base_url():
         url_components = ParseResult(
@@ -156,26 +274,27 @@ class Topography:
         )
         return Path(self.cache_dir) / filename
 
-    def _build_query(self):
+    def _build_query(self, bbox=None, output_format=None):
+        bbox = bbox or self.bbox
         params = {}
         if "usgs" in self.server:
             params["datasetName"] = self.dem_type
         else:
             params["demtype"] = self.dem_type
 
-        params["south"] = self.bbox.south
-        params["north"] = self.bbox.north
-        params["west"] = self.bbox.west
-        params["east"] = self.bbox.east
-        params["outputFormat"] = self.output_format
+        params["south"] = bbox.south
+        params["north"] = bbox.north
+        params["west"] = bbox.west
+        params["east"] = bbox.east
+        params["outputFormat"] = output_format or self.output_format
 
         if self._api_key:
             params["API_Key"] = str(self._api_key)
 
         return params
 
-    def _build_url(self):
-        query_params = self._build_query()
+    def _build_url(self, bbox=None, output_format=None):
+        query_params = self._build_query(bbox=bbox, output_format=output_format)
         url_components = ParseResult(
             scheme=Topography.SCHEME,
             netloc=Topography.NETLOC,
@@ -194,35 +313,299 @@ class Topography:
     def fetch(self):
         """Download and locally store topography data.
 
+        If ``crop_from_cache`` is set and a cached file of the same dataset
+        covers the bounding box, the data are cropped from that file rather
+        than downloaded.
+
+        If a ``tile_size`` was given and the bounding box spans more than
+        one tile, the box is split into tiles that are downloaded
+        concurrently, by up to ``max_workers`` threads, and then mosaicked
+        into a single file.
+
+        If ``cache_layout`` is *cog*, each file is rewritten, once, as a
+        Cloud-Optimized GeoTIFF after it is stored. If it is *zarr*, each
+        file is also copied, once, into a Zarr store next to it, and if it
+        is *npy*, into a ``.npy`` array and a ``.json`` metadata file.
+
+        A cached file whose size doesn't match the size recorded in the
+        cache index when it was stored is treated as corrupt and fetched
+        again. It, and the files built from it, are removed before the new
+        download starts, so a download that fails leaves nothing behind to
+        be mistaken for a cached file.
+
+        Only one thread or process downloads a given file at a time. Others
+        that ask for the same file wait for the download to finish and then
+        use the cached file.
+
+        If ``cache_max_size`` is set, the least recently used files, and
+        their sidecar files, are then removed from the cache until it, along
+        with the sidecar files, fits within that size.
+
         Returns:
             pathlib.Path: The path to the downloaded file
         """
         fname = self._build_filename()
-        if not fname.is_file():
+        if not self._is_cached(fname):
             self.cache_dir.mkdir(exist_ok=True)
 
-            response = requests.get(self.url, stream=True)
+            with FileLock(fname.with_name(fname.name + ".lock")):
+                if not self._is_cached(fname):
+                    self._fetch(fname)
+        else:
+            CacheIndex(self.cache_dir).touch(fname)
+
+        if self.cache_max_size is not None:
+            CacheIndex(self.cache_dir).evict(self.cache_max_size, keep=[fname.name])
+
+        return fname.absolute()
+
+    def _is_cached(self, fname):
+        if not fname.is_file():
+            return False
+        if not (self.cache_dir / CacheIndex.FILENAME).is_file():
+            return self.cache_layout == "raw"
+
+        index = CacheIndex(self.cache_dir)
+        entry = index.entry(fname)
+        if entry is None:
+            if not index.writable:
+                return self.cache_layout == "raw"
+            index.add(
+                fname, self.dem_type, self.bbox, last_access=fname.stat().st_mtime
+            )
+            entry = index.entry(fname)
+        if entry["size"] != fname.stat().st_size:
+            warnings.warn(f"{fname}: cached file is corrupt, fetching it again")
+            return False
+        if self.cache_layout == "zarr" and not zarr_store(fname).is_dir():
+            return False
+        if self.cache_layout == "npy" and not all(
+            sidecar.is_file() for sidecar in npy_files(fname)
+        ):
+            return False
+        return self.cache_layout == "raw" or entry["layout"] == self.cache_layout
+
+    def _fetch(self, fname):
+        index = CacheIndex(self.cache_dir)
+
+        entry = index.entry(fname)
+        if (
+            fname.is_file()
+            and entry is not None
+            and entry["size"] == fname.stat().st_size
+        ):
+            sha256, source = entry["sha256"], entry["source"]
+        else:
+            index.discard(fname)
+            sha256, source = self._fetch_raw(index, fname)
 
-            if response.status_code == 401:
-                if self._api_key.source == "demo":
-                    msg = (
-                        "It looks like you are using a demo key. This error may be the"
-                        " result of you reaching your maximum number of downloads."
-                    )
+        if self.cache_layout == "cog":
+            self._transcode(fname)
+            sha256 = file_digest(fname).hexdigest()
+        elif self.cache_layout == "zarr":
+            self._write_zarr(fname)
+        elif self.cache_layout == "npy":
+            self._write_npy(fname)
+
+        index.add(
+            fname,
+            self.dem_type,
+            self.bbox,
+            sha256=sha256,
+            source=source,
+            layout=self.cache_layout,
+            header=raster_header(fname),
+        )
+
+    def _fetch_raw(self, index, fname):
+        cover = None
+        if self.crop_from_cache:
+            cover = index.find_cover(self.dem_type, self.bbox)
+
+        tiles = (
+            [self.bbox] if self.tile_size is None else self.bbox.split(self.tile_size)
+        )
+        if cover is not None:
+            self._crop(self.cache_dir / cover, fname)
+            index.touch(cover)
+            return file_digest(fname).hexdigest(), cover
+        elif len(tiles) > 1:
+            self._fetch_tiles(tiles, fname)
+            return file_digest(fname).hexdigest(), _redact(self.url)
+        else:
+            return self._download(self.url, fname), _redact(self.url)
+
+    def _crop(self, src_path, fname):
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            cropped = Path(tmp_dir) / fname.name
+            crop(src_path, cropped, self.bbox, driver=self.output_format)
+            os.replace(cropped, fname)
+
+    def _transcode(self, fname):
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            cog = Path(tmp_dir) / fname.name
+            to_cog(fname, cog)
+            os.replace(cog, fname)
+
+    def _write_npy(self, fname):
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            tmp_files = [Path(tmp_dir) / path.name for path in npy_files(fname)]
+            to_npy(fname, *tmp_files)
+            for tmp_file, path in zip(tmp_files, npy_files(fname)):
+                os.replace(tmp_file, path)
+
+    def _write_zarr(self, fname):
+        store = zarr_store(fname)
+        with tempfile.TemporaryDirectory(dir=self.cache_dir) as tmp_dir:
+            tmp_store = Path(tmp_dir) / store.name
+            to_zarr(fname, tmp_store)
+            if store.exists():
+                shutil.rmtree(store)
+            os.replace(tmp_store, store)
+
+    async def afetch(self, executor=None):
+        """Download and locally store topography data without blocking.
+
+        The download runs in a worker thread so that many fetches can be
+        awaited concurrently on a single event loop.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            The executor that runs the download. If not provided, the event
+            loop's default executor is used.
+
+        Returns
+        -------
+        pathlib.Path
+            The path to the downloaded file.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.fetch)
+
+    def _download(self, url, fname):
+        """Download a file, retrying if the request fails.
+
+        Returns the SHA-256 digest of the file.
+        """
+        return call_with_retry(
+            partial(self._download_once, url, fname),
+            self.retry,
+            rate_limiter=get_rate_limiter(self._api_key),
+        )
+
+    def _download_once(self, url, fname):
+        """Download a file, resuming a previous partial download if possible.
+
+        Data are streamed to a ``.part`` file next to *fname* that is renamed
+        to *fname* only once it is complete, so a partial download is never
+        mistaken for a cached file. The SHA-256 digest of the file is
+        computed as the data arrive and is returned.
+
+        The response's validator (its strong ETag, or else its Last-Modified
+        date) is stored in a ``.part.validator`` file and sent with the
+        ``Range`` request that resumes the download, as ``If-Range``, so the
+        server sends the whole file again if it has changed. A ``.part`` file
+        without a validator, or a response for a range other than the one
+        asked for, restarts the download from the beginning.
+        """
+        part = fname.with_name(fname.name + ".part")
+        validator_file = _validator_file(part)
+        validator = validator_file.read_text() if validator_file.is_file() else None
+        offset = part.stat().st_size if part.is_file() and validator else 0
+
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        with self.session.get(url, stream=True, headers=headers) as response:
+            if response.status_code == 416:
+                _discard_part(part)
+                return self._download_once(url, fname)
+            self._raise_for_status(response)
+
+            if response.status_code == 206:
+                start, total = _content_range(response)
+                if start != offset or offset == 0:
+                    _discard_part(part)
+                    if offset == 0:
+                        raise IncompleteDownloadError(
+                            f"received part of a file from {_redact(url)}"
+                            " when the whole file was asked for"
+                        )
+                    return self._download_once(url, fname)
+                digest = file_digest(part)
+            else:
+                offset, total = 0, _content_length(response)
+                digest = hashlib.sha256()
+                validator = _validator(response)
+                if validator is None:
+                    validator_file.unlink(missing_ok=True)
                 else:
-                    msg = (
-                        "It looks like you are using a user-supplied key. This error"
-                        " may mean that your key is out of date or there is a typo in"
-                        f" the supplied key. (source={self._api_key.source})"
-                    )
-                response.reason = os.linesep.join([response.reason, "", msg, ""])
-            response.raise_for_status()
-
-            with fname.open("wb") as fp:
+                    validator_file.write_text(validator)
+
+            with part.open("ab" if offset else "wb") as fp:
                 for chunk in response.iter_content(chunk_size=None):
                     fp.write(chunk)
+                    digest.update(chunk)
 
-        return fname.absolute()
+        size = part.stat().st_size
+        if total is not None and size != total:
+            raise IncompleteDownloadError(
+                f"downloaded {size} of {total} bytes from {_redact(url)}"
+            )
+        os.replace(part, fname)
+        validator_file.unlink(missing_ok=True)
+
+        return digest.hexdigest()
+
+    def _raise_for_status(self, response):
+        if response.status_code == 401:
+            if self._api_key.source == "demo":
+                msg = (
+                    "It looks like you are using a demo key. This error may be the"
+                    " result of you reaching your maximum number of downloads."
+                )
+            else:
+                msg = (
+                    "It looks like you are using a user-supplied key. This error"
+                    " may mean that your key is out of date or there is a typo in"
+                    f" the supplied key. (source={self._api_key.source})"
+                )
+            response.reason = os.linesep.join([response.reason, "", msg, ""])
+        response.raise_for_status()
+
+    def _fetch_tiles(self, tiles, fname):
+        """Download tiles and mosaic them into *fname*.
+
+        Tiles are kept in a ``.tiles`` directory next to *fname* until the
+        mosaic is complete so that an interrupted fetch only downloads the
+        tiles that are missing. Tiles are named by their bounds, and any
+        left over from a fetch with a different tiling are removed.
+        """
+        tile_dir = fname.with_name(fname.name + ".tiles")
+        tile_dir.mkdir(exist_ok=True)
+
+        tile_paths = [tile_dir / _tile_filename(tile) for tile in tiles]
+        keep = {path.name for path in tile_paths}
+        keep |= {name + ".part" for name in keep} | {
+            _validator_file(path.with_name(path.name + ".part")).name
+            for path in tile_paths
+        }
+        for path in tile_dir.iterdir():
+            if path.name not in keep:
+                path.unlink()
+
+        urls, paths = [], []
+        for tile, path in zip(tiles, tile_paths):
+            if not path.is_file():
+                urls.append(self._build_url(bbox=tile, output_format="GTiff"))
+                paths.append(path)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self._download, urls, paths))
+
+        mosaic = tile_dir / fname.name
+        merge_tiles(tile_paths, mosaic, driver=self.output_format)
+        os.replace(mosaic, fname)
+        shutil.rmtree(tile_dir)
 
     @staticmethod
     def clear_cache(dir):
@@ -231,23 +614,171 @@ class Topography:
         cache_files = []
         for fext in Topography.VALID_OUTPUT_FORMATS.values():
             cache_files.extend(cache_dir.glob(f"*.{fext}"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.part"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.part.validator"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.lock"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.npy"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.json"))
+            cache_files.extend(cache_dir.glob(f"*.{fext}.hydrology.npz"))
 
         for cache_file in cache_files:
             cache_file.unlink()
             print(f"rm {cache_file}")
 
+        for fext in Topography.VALID_OUTPUT_FORMATS.values():
+            for cache_store in (
+                *cache_dir.glob(f"*.{fext}.tiles"),
+                *cache_dir.glob(f"*.{fext}.zarr"),
+                *cache_dir.glob(f"*.{fext}.pyramid"),
+            ):
+                shutil.rmtree(cache_store)
+                print(f"rm -r {cache_store}")
+
+        index = cache_dir / CacheIndex.FILENAME
+        if index.is_file():
+            index.unlink()
+            print(f"rm {index}")
+
+    @staticmethod
+    def prune_cache(dir, max_size):
+        """Remove least recently used files until a cache fits within a size.
+
+        Parameters
+        ----------
+        dir : str or path-like
+            The cache directory.
+        max_size : int or str
+            The size, in bytes or as a string like ``"10G"``, to trim the
+            cache to.
+        """
+        cache_dir = Path(dir).expanduser()
+        for cache_file in CacheIndex(cache_dir).evict(parse_size(max_size)):
+            print(f"rm {cache_file}")
+
+    @staticmethod
+    def verify_cache(dir, checksums=True):
+        """Check cached files against the sizes and checksums in the index.
+
+        Sizes are always compared. If *checksums* is ``True``, the SHA-256
+        digest of each file is computed, without decoding the raster, and
+        compared too.
+
+        Parameters
+        ----------
+        dir : str or path-like
+            The cache directory.
+        checksums : bool, optional
+            Compare checksums as well as sizes.
+
+        Returns
+        -------
+        list of pathlib.Path
+            The files that are missing or corrupt.
+        """
+        cache_dir = Path(dir).expanduser()
+        bad_files = []
+        for cache_file, problem in CacheIndex(cache_dir).verify(checksums=checksums):
+            print(f"{cache_file}: {problem}")
+            bad_files.append(cache_file)
+        return bad_files
+
     @property
     def da(self):
         return self._da
 
-    def load(self):
+    def load(
+        self,
+        chunks=None,
+        window=None,
+        dtype=None,
+        nodata="sentinel",
+        factor=None,
+        resolution=None,
+    ):
         """Load a cached topography data file into an xarray DataArray.
 
+        The data are read into memory once per process and shared, read-only,
+        by every Topography that loads the same file (see
+        :mod:`bmi_topography.registry`). Data larger than the registry's
+        memory budget are instead opened lazily, and read each time their
+        values are accessed, rather than read only to be dropped. If
+        ``cache_layout`` is *zarr*, the data are instead opened from the
+        Zarr store and read chunk by chunk as they are accessed, and if it
+        is *npy*, the ``.npy`` array is memory-mapped, without copying, so
+        processes share the operating system's page cache rather than each
+        holding a decoded copy.
+
+        If *chunks* is given, the data are instead backed by a dask array
+        and nothing is read until blocks of it are computed, so rasters
+        larger than memory can be worked with a block at a time.
+
+        If a *window* is given, only the pixels within it are read. The
+        result carries the coordinates, and so the transform, of the
+        window.
+
+        The data keep the type they are stored with unless a *dtype* is
+        given. Missing values keep the file's nodata value, recorded in the
+        ``_FillValue`` attribute, unless *nodata* asks for them to be
+        marked in a separate boolean ``mask`` coordinate or replaced with
+        NaN. Only *nan* changes the type of integer data, to float32.
+
+        A *factor* or *resolution* loads the data averaged over blocks of
+        pixels. They are read from the file's overviews if it has one for
+        that factor, as files in the *cog* layout do. Otherwise the averaged
+        data are computed the first time they are asked for, and cached in
+        a ``.pyramid`` directory next to the file.
+
+        Args:
+            chunks (int, tuple, dict or str, optional): The size of the dask
+                chunks, as for :func:`rioxarray.open_rasterio`, or ``"auto"``.
+                Requires dask.
+            window (BoundingBox or rasterio.windows.Window, optional): The
+                part of the data to read, either as a latitude-longitude box,
+                in which case every pixel that touches the box is read, or
+                as a pixel window. A pixel window can also be given as
+                ``((row_start, row_stop), (col_start, col_stop))``, in
+                the pixels of the averaged data if a *factor* is given.
+            dtype (str or numpy.dtype, optional): The type to convert the
+                data to, for example ``"float32"`` or ``"int16"``. Values
+                are rounded when converted to an integer type, and missing
+                values are then set to the file's nodata value, or to the
+                type's smallest value if that can't be represented.
+            nodata (str, optional): How missing values are represented:
+                *sentinel*, *mask* or *nan*.
+            factor (int, optional): The width and height, in pixels, of the
+                blocks to average over.
+            resolution (float, optional): The coarsest pixel size wanted, in
+                the units of the data's CRS. The data are averaged over the
+                largest blocks whose pixel size is no coarser.
+
         Returns:
             xarray.DataArray: A container for the data
         """
-        if self._da is None:
-            self._da = rioxarray.open_rasterio(self.fetch())
+        _check_load_options(nodata=nodata, factor=factor, resolution=resolution)
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+
+        options = {
+            "chunks": chunks,
+            "window": _window_key(window),
+            "dtype": dtype,
+            "nodata": nodata,
+            "factor": factor,
+            "resolution": resolution,
+        }
+        if self._da is None or options != self._load_options:
+            fname = self.fetch()
+            if resolution is not None:
+                factor = _resolution_factor(self._header(fname), resolution)
+            self._da = self._open(
+                fname,
+                chunks=chunks,
+                window=window,
+                dtype=dtype,
+                nodata=nodata,
+                factor=int(factor or 1),
+            )
+            self._load_options = options
             self._da.name = self.dem_type
 
             self._da.attrs["units"] = "unknown"
@@ -265,3 +796,411 @@ class Topography:
                     self._da.attrs["units"] = crs.linear_units
 
         return self._da
+
+    def sample(self, lats, lons, method="nearest"):
+        """Sample elevations at many points at once.
+
+        The points are mapped to pixels with the transform of the cached
+        file, all at once, and grouped by the tile of the file they fall
+        in, so that each tile is read once.
+
+        Args:
+            lats (array_like of float): The latitudes of the points.
+            lons (array_like of float): The longitudes of the points.
+            method (str, optional): *nearest* to take the value of the
+                pixel that holds each point, or *bilinear* to interpolate
+                between the centers of the four pixels around it.
+
+        Returns:
+            numpy.ndarray: The elevation at each point, with the shape of
+                *lats*. Points outside of the data, or that depend on a
+                missing value, are NaN.
+        """
+        values = sample_raster(self.fetch(), lats, lons, method=method)
+        return values.reshape(np.shape(lats))
+
+    def hydrology(self, max_pixels=MAX_PIXELS, **kwds):
+        """Fill the depressions of the data and route flow over them.
+
+        The results are computed from the data that :meth:`load` returns,
+        and saved next to the cached file, so that they are computed once
+        for each file and set of load options.
+
+        Routing takes about 6 s per million pixels, so data larger than
+        *max_pixels* are refused unless results for them are already
+        cached.
+
+        Args:
+            max_pixels (int or None, optional): The largest number of
+                pixels, in each band, to route, or ``None`` for no limit.
+            **kwds: Options passed to :meth:`load`.
+
+        Returns:
+            xarray.Dataset: The filled elevations, D8 flow directions and
+                flow accumulation, as described in
+                :func:`bmi_topography.hydrology.route`.
+
+        Raises:
+            ValueError: If the data aren't cached and have more than
+                *max_pixels* pixels in a band.
+        """
+        da = self.load(**kwds)
+        fname = self.fetch()
+        options = {
+            name: value
+            for name, value in self._load_options.items()
+            if name != "chunks"
+        }
+        cache_file = hydrology_file(fname)
+        written = _mtime(cache_file)
+        routes = route(
+            da,
+            cache_file=cache_file,
+            key=repr(_registry_key(fname, **options)),
+            max_pixels=max_pixels,
+        )
+        if _mtime(cache_file) != written:
+            CacheIndex(self.cache_dir).record_sidecars(fname)
+        return routes
+
+    def metadata(self, dtype=None, nodata="sentinel", factor=None, resolution=None):
+        """Describe the data that :meth:`load` returns, without reading them.
+
+        The description comes from the header that the cache index records
+        for the file when it is stored, or, for files stored before headers
+        were recorded, from the file's header. No pixel data are decoded.
+
+        Args:
+            dtype (str or numpy.dtype, optional): As for :meth:`load`.
+            nodata (str, optional): As for :meth:`load`.
+            factor (int, optional): As for :meth:`load`.
+            resolution (float, optional): As for :meth:`load`.
+
+        Returns:
+            dict: The *shape* of the data, as (bands, rows, columns), their
+            *dtype*, their affine *transform*, their *crs*, as WKT, and its
+            *units*.
+        """
+        _check_load_options(nodata=nodata, factor=factor, resolution=resolution)
+
+        header = self._header(self.fetch())
+        nbands, height, width = header["shape"]
+        transform = Affine(*header["transform"])
+
+        if resolution is not None:
+            factor = _resolution_factor(header, resolution)
+        if factor is not None and factor > 1:
+            rows, cols = math.ceil(height / factor), math.ceil(width / factor)
+            transform *= Affine.scale(width / cols, height / rows)
+            height, width = rows, cols
+
+        dtype = np.dtype(header["dtype"] if dtype is None else dtype)
+        if (
+            nodata == "nan"
+            and header["nodata"] is not None
+            and not np.issubdtype(dtype, np.floating)
+        ):
+            dtype = np.dtype("float32")
+
+        return {
+            "shape": (nbands, height, width),
+            "dtype": str(dtype),
+            "transform": transform,
+            "crs": header["crs"],
+            "units": header["units"] or "unknown",
+        }
+
+    def _header(self, fname):
+        entry = CacheIndex(self.cache_dir).entry(fname)
+        if entry is not None and entry["header"] is not None:
+            return entry["header"]
+        return raster_header(fname)
+
+    def _open(
+        self,
+        fname,
+        chunks=None,
+        window=None,
+        dtype=None,
+        nodata="sentinel",
+        factor=1,
+    ):
+        path, open_kwds = self._averaged(fname, factor)
+        if window is not None:
+            window = _pixel_window(path, window, **open_kwds)
+
+        if self.cache_layout == "zarr" and factor == 1:
+            da = open_zarr(zarr_store(fname), chunks=chunks)
+        elif self.cache_layout == "npy" and factor == 1:
+            da = open_npy(*npy_files(fname))
+            if chunks is not None:
+                da = da.chunk(chunks)
+        elif chunks is not None:
+            da = rioxarray.open_rasterio(path, chunks=chunks, **open_kwds)
+        elif (
+            _read_nbytes(self._header(fname), factor, window, dtype)
+            > get_registry().max_bytes
+        ):
+            da = rioxarray.open_rasterio(path, **open_kwds)
+        else:
+            return get_registry().get(
+                _registry_key(
+                    path,
+                    window=_window_key(window),
+                    dtype=dtype,
+                    nodata=nodata,
+                    **open_kwds,
+                ),
+                partial(
+                    _read_raster,
+                    path,
+                    window=window,
+                    dtype=dtype,
+                    nodata=nodata,
+                    **open_kwds,
+                ),
+            )
+
+        if window is not None:
+            da = _select_window(da, window)
+        return _convert(da, dtype=dtype, nodata=nodata)
+
+    def _averaged(self, fname, factor):
+        """Find, or build, the raster that holds data averaged by a factor."""
+        if factor == 1:
+            return fname, {}
+
+        with rasterio.open(fname) as src:
+            overviews = src.overviews(1)
+        if factor in overviews:
+            return fname, {"overview_level": overviews.index(factor)}
+
+        level = pyramid_level(fname, factor)
+        if not level.is_file():
+            src_path, src_factor = fname, 1
+            for coarser in reversed(pyramid_factors(fname)):
+                if factor % coarser == 0:
+                    src_path, src_factor = pyramid_level(fname, coarser), coarser
+                    break
+
+            pyramid_dir(fname).mkdir(exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=pyramid_dir(fname)) as tmp_dir:
+                averaged = Path(tmp_dir) / level.name
+                build_overview(src_path, averaged, factor // src_factor)
+                os.replace(averaged, level)
+            CacheIndex(self.cache_dir).record_sidecars(fname)
+        return level, {}
+
+
+async def afetch_many(topos, max_concurrency=None):
+    """Download and locally store data for many Topography instances.
+
+    Parameters
+    ----------
+    topos : iterable of Topography
+        The datasets to fetch.
+    max_concurrency : int, optional
+        The maximum number of downloads in flight at once.
+
+    Returns
+    -------
+    list of pathlib.Path
+        Paths to the downloaded files, in the same order as *topos*.
+    """
+    max_concurrency = max_concurrency or Topography.DEFAULT_MAX_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return await asyncio.gather(*[topo.afetch(executor) for topo in topos])
+
+
+def fetch_many(topos, max_concurrency=None):
+    """Download and locally store data for many Topography instances.
+
+    The downloads run concurrently on a single event loop. Use
+    :func:`afetch_many` from within code that is already running an
+    event loop.
+
+    Parameters
+    ----------
+    topos : iterable of Topography
+        The datasets to fetch.
+    max_concurrency : int, optional
+        The maximum number of downloads in flight at once.
+
+    Returns
+    -------
+    list of pathlib.Path
+        Paths to the downloaded files, in the same order as *topos*.
+    """
+    return asyncio.run(afetch_many(topos, max_concurrency=max_concurrency))
+
+
+def _tile_filename(bbox):
+    """The name of a downloaded tile, from its bounds."""
+    return f"tile_{bbox.south}_{bbox.west}_{bbox.north}_{bbox.east}.tif"
+
+
+def _registry_key(path, **options):
+    """Identify a loaded file by its path, version and load options."""
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size, tuple(sorted(options.items())))
+
+
+def _mtime(path):
+    """When a file was last modified, or ``None`` if it doesn't exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _read_nbytes(header, factor=1, window=None, dtype=None):
+    """The size, in bytes, of the data read from a raster with a header."""
+    nbands, height, width = header["shape"]
+    if window is not None:
+        height, width = window.height, window.width
+    else:
+        height, width = math.ceil(height / factor), math.ceil(width / factor)
+    itemsize = np.dtype(header["dtype"] if dtype is None else dtype).itemsize
+    return nbands * height * width * itemsize
+
+
+def _read_raster(path, window=None, dtype=None, nodata="sentinel", **open_kwds):
+    with rioxarray.open_rasterio(path, **open_kwds) as da:
+        if window is not None:
+            da = _select_window(da, window)
+        return _convert(da.load(), dtype=dtype, nodata=nodata)
+
+
+def _convert(da, dtype=None, nodata="sentinel"):
+    """Change the type of a DataArray and how its missing values are marked."""
+    if (dtype is None or dtype == da.dtype) and nodata == "sentinel":
+        return da
+
+    fill_value = da.rio.nodata
+    if fill_value is None:
+        is_missing = None
+    elif np.isnan(fill_value):
+        is_missing = da.isnull()
+    else:
+        is_missing = da == fill_value
+
+    if dtype is not None and dtype != da.dtype:
+        if np.issubdtype(dtype, np.integer):
+            da = da.round()
+            info = np.iinfo(dtype)
+            if fill_value is not None and not (
+                float(fill_value).is_integer() and info.min <= fill_value <= info.max
+            ):
+                fill_value = info.min
+        if is_missing is not None:
+            da = da.where(~is_missing, fill_value)
+        da = da.astype(dtype)
+        if fill_value is not None:
+            da.rio.write_nodata(fill_value, encoded=False, inplace=True)
+
+    if is_missing is not None and nodata == "mask":
+        da = da.assign_coords(mask=is_missing)
+    elif is_missing is not None and nodata == "nan":
+        if not np.issubdtype(da.dtype, np.floating):
+            da = da.astype("float32")
+        da = da.where(~is_missing)
+        da.rio.write_nodata(np.nan, encoded=False, inplace=True)
+    return da
+
+
+def _select_window(da, window):
+    rows, cols = window.toslices()
+    return da.isel(y=rows, x=cols)
+
+
+def _pixel_window(path, window, **open_kwds):
+    """Resolve a bounding box or pixel window to whole pixels of a raster."""
+    with rasterio.open(path, **open_kwds) as src:
+        if isinstance(window, BoundingBox):
+            return bbox_window(src, window)
+
+        if not isinstance(window, Window):
+            window = Window.from_slices(*window, height=src.height, width=src.width)
+        try:
+            return window.intersection(Window(0, 0, src.width, src.height))
+        except WindowError:
+            raise ValueError(f"{window} does not overlap {src.name}") from None
+
+
+def _check_load_options(nodata="sentinel", factor=None, resolution=None):
+    if nodata not in Topography.VALID_NODATA:
+        raise ValueError(f"nodata must be one of {Topography.VALID_NODATA}.")
+    if factor is not None and resolution is not None:
+        raise ValueError("factor and resolution cannot both be given.")
+    if factor is not None and (int(factor) != factor or factor < 1):
+        raise ValueError(f"factor ({factor}) must be a positive integer.")
+    if resolution is not None and resolution <= 0:
+        raise ValueError(f"resolution ({resolution}) must be positive.")
+
+
+def _resolution_factor(header, resolution):
+    """The largest averaging factor that gives pixels no coarser than a size."""
+    a, _, _, _, e, _ = header["transform"]
+    pixel_size = max(abs(a), abs(e))
+    return max(1, math.floor(resolution / pixel_size + 1e-9))
+
+
+def _window_key(window):
+    """A hashable, comparable form of a window."""
+    if window is None:
+        return None
+    elif isinstance(window, BoundingBox):
+        return (window.lower_left, window.upper_right)
+    elif isinstance(window, Window):
+        return window.flatten()
+    else:
+        return tuple(tuple(bounds) for bounds in window)
+
+
+def _validator_file(part):
+    """The file that holds the validator of a partial download."""
+    return part.with_name(part.name + ".validator")
+
+
+def _validator(response):
+    """A response's strong ETag, or its Last-Modified date, for If-Range."""
+    etag = response.headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _discard_part(part):
+    """Remove a partial download and its validator."""
+    part.unlink(missing_ok=True)
+    _validator_file(part).unlink(missing_ok=True)
+
+
+def _content_range(response):
+    """Parse the first byte and total size from a Content-Range header."""
+    try:
+        unit, _, value = response.headers["Content-Range"].partition(" ")
+        byte_range, _, total = value.partition("/")
+        start = int(byte_range.partition("-")[0])
+    except (KeyError, ValueError):
+        return None, None
+    if unit != "bytes":
+        return None, None
+    return start, None if total == "*" else int(total)
+
+
+def _content_length(response):
+    """Get the size of a response body, if it is known."""
+    if "Content-Encoding" in response.headers:
+        return None
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _redact(url):
+    """Remove an API key from a URL."""
+    parts = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "API_Key"]
+    return urlunparse(parts._replace(query=urlencode(query)))
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy
+import pytest
+import rasterio
+import requests
+from rasterio.transform import from_origin
+
+RESOLUTION = 1.0 / 120.0
+
+
+def elevation(lat, lon):
+    """Synthetic terrain used by the fake OpenTopography server."""
+    return 1000.0 + 100.0 * lat + 10.0 * lon
+
+
+def make_dem(south, west, north, east, resolution=RESOLUTION):
+    """Build a synthetic DEM for a bounding box as an in-memory GeoTIFF."""
+    ncols = max(1, round((east - west) / resolution))
+    nrows = max(1, round((north - south) / resolution))
+    transform = from_origin(west, north, resolution, resolution)
+
+    lon = west + (numpy.arange(ncols) + 0.5) * resolution
+    lat = north - (numpy.arange(nrows) + 0.5) * resolution
+    data = elevation(lat[:, None], lon[None, :]).astype("float32")
+
+    with rasterio.MemoryFile() as memfile:
+        with memfile.open(
+            driver="GTiff",
+            height=nrows,
+            width=ncols,
+            count=1,
+            dtype=data.dtype,
+            crs="EPSG:4326",
+            transform=transform,
+            nodata=-9999.0,
+        ) as dst:
+            dst.write(data, 1)
+        return memfile.read()
+
+
+class _BrokenStream(io.BytesIO):
+    """A response body that drops the connection after some bytes."""
+
+    def __init__(self, content, limit):
+        super().__init__(content)
+        self._limit = limit
+
+    def read(self, size=-1):
+        if self.tell() >= self._limit:
+            raise requests.exceptions.ConnectionError("connection dropped")
+        if size is None or size < 0:
+            size = self._limit - self.tell()
+        return super().read(min(size, self._limit - self.tell()))
+
+
+class FakeServer:
+    """Stand in for the OpenTopography REST API."""
+
+    def __init__(self, delay=0.0, accept_ranges=True, etags=True):
+        self.delay = delay
+        self.accept_ranges = accept_ranges
+        self.etags = etags
+        self.range_shift = 0
+        self.drop_after = None
+        self.errors = []
+        self.requests = []
+        self.headers = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, stream=False, headers=None, **kwds):
+        headers = headers or {}
+        with self._lock:
+            self.requests.append(url)
+            self.headers.append(headers)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+
+        query = {key: value[0] for key, value in parse_qs(urlparse(url).query).items()}
+        content = make_dem(
+            float(query["south"]),
+            float(query["west"]),
+            float(query["north"]),
+            float(query["east"]),
+        )
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+
+        if self.errors:
+            response.status_code, response.reason, extra = self.errors.pop(0)
+            response.headers.update(extra)
+            response.raw = io.BytesIO(b"")
+            return response
+
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        if self.etags:
+            response.headers["ETag"] = etag
+
+        start = 0
+        if (
+            self.accept_ranges
+            and "Range" in headers
+            and headers.get("If-Range", etag) == etag
+        ):
+            start = int(headers["Range"].removeprefix("bytes=").rstrip("-"))
+            start += self.range_shift
+            response.status_code = 206
+            response.reason = "Partial Content"
+            response.headers["Content-Range"] = (
+                f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        response.headers["Content-Length"] = str(len(content) - start)
+
+        if self.drop_after is None:
+            response.raw = io.BytesIO(content[start:])
+        else:
+            response.raw = _BrokenStream(content[start:], self.drop_after)
+            self.drop_after = None
+        return response
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server = FakeServer()
+    monkeypatch.setattr("bmi_topography.session._session", server)
+    return server
@@ -60,3 +60,27 @@ def test_east_out_of_range():
 def test_west_greater_than_east():
     with pytest.raises(ValueError):
         BoundingBox((0, 90), (0, 0))
+
+
+def test_split_single_tile():
+    bbox = BoundingBox((30.0, -100.0), (30.5, -99.5))
+    tiles = bbox.split(1.0)
+    assert len(tiles) == 1
+    assert str(tiles[0]) == str(bbox)
+
+
+def test_split_covers_box():
+    bbox = BoundingBox((30.0, -100.0), (32.5, -99.0))
+    tiles = bbox.split((1.0, 0.5))
+    assert len(tiles) == 6
+    assert min(tile.south for tile in tiles) == bbox.south
+    assert max(tile.north for tile in tiles) == bbox.north
+    assert min(tile.west for tile in tiles) == bbox.west
+    assert max(tile.east for tile in tiles) == bbox.east
+    assert tiles[-1].south == pytest.approx(32.0)
+
+
+@pytest.mark.parametrize("tile_size", [0, -1.0, (1.0, 0.0)])
+def test_split_bad_tile_size(tile_size):
+    with pytest.raises(ValueError):
+        BoundingBox(VALID_LL, VALID_UR).split(tile_size)
@@ -0,0 +1,303 @@
+"""Test the BMI"""
+
+import time
+
+import numpy as np
+import pytest
+import rasterio
+import requests
+import yaml
+from conftest import RESOLUTION
+
+from bmi_topography import BmiTopography, Topography
+
+PARAMS = {
+    "dem_type": "SRTMGL3",
+    "south": 40.0,
+    "west": -105.0,
+    "north": 40.5,
+    "east": -104.5,
+    "output_format": "GTiff",
+}
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    def _make_config(**kwds):
+        config_file = tmp_path / "config.yaml"
+        config = PARAMS | {"cache_dir": str(tmp_path / "cache")} | kwds
+        config_file.write_text(yaml.safe_dump({"bmi-topography": config}))
+        return str(config_file)
+
+    return _make_config
+
+
+def _read(tmp_path):
+    (fname,) = (tmp_path / "cache").glob("*.tif")
+    with rasterio.open(fname) as src:
+        return src.read(1)
+
+
+def test_initialize(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+
+    expected = _read(tmp_path)
+    assert tuple(bmi.get_grid_shape(0, np.empty(2, dtype=int))) == expected.shape
+    assert bmi.get_var_type("land_surface__elevation") == "float32"
+    assert bmi.get_var_nbytes("land_surface__elevation") == expected.nbytes
+
+    dest = np.empty(expected.size, dtype=np.float32)
+    bmi.get_value("land_surface__elevation", dest)
+    np.testing.assert_array_equal(dest, expected.reshape(-1))
+
+
+def test_initialize_chunked(tmp_path, fake_server, make_config):
+    pytest.importorskip("dask")
+
+    bmi = BmiTopography()
+    bmi.initialize(make_config(chunks=16))
+
+    expected = _read(tmp_path).reshape(-1)
+    inds = np.array([0, 17, 1000, expected.size - 1])
+    dest = np.empty(len(inds), dtype=np.float32)
+    bmi.get_value_at_indices("land_surface__elevation", dest, inds)
+    np.testing.assert_array_equal(dest, expected[inds])
+    assert bmi._da.chunks is not None
+
+
+def test_initialize_with_dtype(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config(dtype="int16"))
+
+    assert bmi.get_var_type("land_surface__elevation") == "int16"
+    assert bmi.get_var_itemsize("land_surface__elevation") == 2
+    dest = np.empty(bmi.get_grid_size(0), dtype=np.int16)
+    bmi.get_value("land_surface__elevation", dest)
+    np.testing.assert_array_equal(dest, np.round(_read(tmp_path)).reshape(-1))
+
+
+def test_initialize_reads_no_data(tmp_path, fake_server, make_config, monkeypatch):
+    loads = []
+    load = Topography.load
+    monkeypatch.setattr(
+        Topography, "load", lambda self, **kwds: loads.append(1) or load(self, **kwds)
+    )
+
+    bmi = BmiTopography()
+    bmi.initialize(make_config(factor=2))
+    assert tuple(bmi.get_grid_shape(0, np.empty(2, dtype=int))) == (30, 30)
+    assert bmi.get_var_nbytes("land_surface__elevation") == 30 * 30 * 4
+    assert bmi.get_grid_spacing(0, np.empty(2)) == pytest.approx(
+        [2 * RESOLUTION, 2 * RESOLUTION]
+    )
+    assert bmi.get_grid_origin(0, np.empty(2)) == pytest.approx(
+        [40.0 + RESOLUTION, -105.0 + RESOLUTION]
+    )
+    assert loads == []
+
+    da = bmi.get_value_ptr("land_surface__elevation")
+    assert da.shape == (1, 30, 30)
+    assert loads == [1]
+
+
+def test_grid_coordinates(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+    da = bmi._topo.load()
+
+    np.testing.assert_allclose(bmi.get_grid_x(0, np.empty(60)), da.x)
+    np.testing.assert_allclose(bmi.get_grid_y(0, np.empty(60)), da.y)
+    assert bmi.get_grid_origin(0, np.empty(2)) == pytest.approx(
+        [float(da.y.min()), float(da.x.min())]
+    )
+
+
+def test_hydrology_variables(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+    assert bmi.get_output_var_names() == ("land_surface__elevation",)
+
+    bmi.initialize(make_config(hydrology=True))
+    assert bmi.get_output_item_count() == 4
+    assert bmi.get_var_type("land_surface_water_flow__d8_direction_code") == "uint8"
+    assert bmi._routes is None
+
+    name = "land_surface_water_flow__upstream_cell_count"
+    dest = np.empty(bmi.get_grid_size(0), dtype=bmi.get_var_type(name))
+    bmi.get_value(name, dest)
+    assert dest.min() >= 1
+    assert dest.max() <= dest.size
+    assert list((tmp_path / "cache").glob("*.hydrology.npz"))
+
+    dest = np.empty(3, dtype=np.float32)
+    bmi.get_value_at_indices(
+        "depression_filled_land_surface__elevation", dest, np.array([0, 1, 2])
+    )
+    assert np.all(dest >= _read(tmp_path).reshape(-1)[:3])
+
+
+def test_hydrology_max_pixels(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    with pytest.raises(ValueError, match="max_pixels"):
+        bmi.initialize(make_config(hydrology=True, hydrology_max_pixels=100))
+
+    bmi.initialize(make_config(hydrology=True, hydrology_max_pixels=None))
+    name = "land_surface_water_flow__upstream_cell_count"
+    bmi.get_value(name, np.empty(bmi.get_grid_size(0), dtype=np.uint32))
+
+    bmi.initialize(make_config(hydrology=True, hydrology_max_pixels=100))
+    bmi.get_value(name, np.empty(bmi.get_grid_size(0), dtype=np.uint32))
+
+
+def test_get_indices_at_points(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+
+    lats, lons = np.array([40.01, 40.25, 40.49]), np.array([-104.99, -104.75, -104.6])
+    inds = bmi.get_indices_at_points(lats, lons)
+    assert inds.dtype == np.int64
+
+    dest = np.empty(len(inds), dtype=np.float32)
+    bmi.get_value_at_indices("land_surface__elevation", dest, inds)
+    np.testing.assert_array_equal(dest, bmi._topo.sample(lats, lons))
+
+    with pytest.raises(ValueError):
+        bmi.get_indices_at_points([41.0], [-104.75])
+
+
+def test_value_buffer(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+
+    values = bmi.get_value_ptr("land_surface__elevation")
+    assert values.flags.c_contiguous
+    assert not values.flags.writeable
+    assert bmi.get_value_ptr("land_surface__elevation") is values
+
+    dest = np.empty(values.size, dtype=values.dtype)
+    assert bmi.get_value("land_surface__elevation", dest) is dest
+    np.testing.assert_array_equal(dest, values.reshape(-1))
+    assert not np.shares_memory(dest, values)
+
+    bmi.finalize()
+    assert bmi._buffers == {}
+
+
+def test_get_value_at_indices(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+    expected = _read(tmp_path).reshape(-1)
+
+    inds = np.random.default_rng(1945).integers(0, expected.size, size=10000)
+    dest = np.empty(len(inds), dtype=np.float32)
+    bmi.get_value_at_indices("land_surface__elevation", dest, inds)
+    np.testing.assert_array_equal(dest, expected[inds])
+
+    dest = np.empty(2, dtype=np.float64)
+    bmi.get_value_at_indices("land_surface__elevation", dest, np.array([-1, 0]))
+    np.testing.assert_array_equal(dest, expected[[-1, 0]])
+
+    with pytest.raises(IndexError):
+        bmi.get_value_at_indices(
+            "land_surface__elevation", dest, np.array([0, expected.size])
+        )
+
+
+def test_update_without_streaming(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config())
+
+    assert bmi.get_end_time() == 0.0
+    with pytest.raises(NotImplementedError):
+        bmi.update()
+
+
+def test_streaming(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config(stream_tile_size=0.25))
+
+    assert bmi.get_current_time() == 0.0
+    assert bmi.get_end_time() == 3.0
+    assert bmi.get_time_step() == 1.0
+    assert tuple(bmi.get_grid_shape(0, np.empty(2, dtype=int))) == (30, 30)
+
+    origins = []
+    for step in range(4):
+        assert bmi.get_current_time() == step
+        origins.append(tuple(bmi.get_grid_origin(0, np.empty(2))))
+
+        dest = np.empty(bmi.get_grid_size(0), dtype=np.float32)
+        bmi.get_value("land_surface__elevation", dest)
+        with rasterio.open(bmi._topo.fetch()) as src:
+            np.testing.assert_array_equal(dest, src.read(1).reshape(-1))
+
+        if step < 3:
+            topo, future = bmi._next
+            future.result()
+            assert topo.fetch().is_file()
+            bmi.update()
+
+    assert origins == pytest.approx(
+        [
+            (40.0 + RESOLUTION / 2, -105.0 + RESOLUTION / 2),
+            (40.0 + RESOLUTION / 2, -104.75 + RESOLUTION / 2),
+            (40.25 + RESOLUTION / 2, -105.0 + RESOLUTION / 2),
+            (40.25 + RESOLUTION / 2, -104.75 + RESOLUTION / 2),
+        ]
+    )
+    with pytest.raises(ValueError):
+        bmi.update()
+
+    bmi.finalize()
+    assert bmi._executor is None
+
+
+def test_streaming_update_until(tmp_path, fake_server, make_config):
+    bmi = BmiTopography()
+    bmi.initialize(make_config(stream_tile_size=0.25))
+
+    bmi.update_until(2.0)
+    assert bmi.get_current_time() == 2.0
+    assert bmi._topo.bbox.south == pytest.approx(40.25)
+
+    with pytest.raises(ValueError):
+        bmi.update_until(4.0)
+    bmi.finalize()
+
+
+def test_background_fetch(tmp_path, fake_server, make_config):
+    fake_server.delay = 0.5
+
+    bmi = BmiTopography()
+    start = time.monotonic()
+    bmi.initialize(make_config(background_fetch=True))
+    assert time.monotonic() - start < 0.5
+
+    assert bmi.get_output_var_names() == ("land_surface__elevation",)
+    assert bmi.get_current_time() == 0.0
+    assert bmi._fetching is not None
+
+    assert bmi.get_var_type("land_surface__elevation") == "float32"
+    assert time.monotonic() - start >= 0.5
+    assert bmi._fetching is None
+
+    dest = np.empty(bmi.get_grid_size(0), dtype=np.float32)
+    bmi.get_value("land_surface__elevation", dest)
+    np.testing.assert_array_equal(dest, _read(tmp_path).reshape(-1))
+    bmi.finalize()
+
+
+def test_background_fetch_error(tmp_path, fake_server, make_config):
+    fake_server.errors.append((404, "Not Found", {}))
+
+    bmi = BmiTopography()
+    bmi.initialize(make_config(background_fetch=True))
+    with pytest.raises(requests.exceptions.HTTPError):
+        bmi.get_grid_shape(0, np.empty(2, dtype=int))
+    with pytest.raises(requests.exceptions.HTTPError):
+        bmi.get_grid_size(0)
+    with pytest.raises(requests.exceptions.HTTPError):
+        bmi.get_value_ptr("land_surface__elevation")
+    bmi.finalize()
+    assert len(fake_server.requests) == 1
@@ -0,0 +1,479 @@
+"""Test the cache index"""
+
+import hashlib
+import json
+import os
+import stat
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+import requests
+from conftest import RESOLUTION, elevation, make_dem
+
+from bmi_topography import BoundingBox, Topography
+from bmi_topography.cache import (
+    CacheIndex,
+    merge_tiles,
+    npy_files,
+    open_zarr,
+    parse_size,
+    pyramid_level,
+    raster_header,
+    to_zarr,
+    zarr_store,
+)
+
+PARAMS = {
+    "dem_type": "SRTMGL3",
+    "south": 40.0,
+    "west": -105.0,
+    "north": 40.5,
+    "east": -104.5,
+}
+
+
+def test_find_cover(tmp_path):
+    index = CacheIndex(tmp_path)
+    index.add("big.tif", "SRTMGL3", BoundingBox((30, -110), (45, -95)))
+    index.add("small.tif", "SRTMGL3", BoundingBox((39, -106), (41, -104)))
+    index.add("other.tif", "COP30", BoundingBox((39, -106), (41, -104)))
+
+    bbox = BoundingBox((40, -105), (40.5, -104.5))
+    assert index.find_cover("SRTMGL3", bbox, exists=False) == "small.tif"
+    assert index.find_cover("COP30", bbox, exists=False) == "other.tif"
+    assert index.find_cover("COP90", bbox, exists=False) is None
+
+    bbox = BoundingBox((35, -105), (40.5, -104.5))
+    assert index.find_cover("SRTMGL3", bbox, exists=False) == "big.tif"
+
+
+def test_find_cover_drops_missing_files(tmp_path):
+    index = CacheIndex(tmp_path)
+    index.add("gone.tif", "SRTMGL3", BoundingBox((30, -110), (45, -95)))
+
+    assert index.find_cover("SRTMGL3", BoundingBox((40, -105), (41, -104))) is None
+    assert len(index) == 0
+
+
+def test_rebuild_from_existing_files(tmp_path):
+    (tmp_path / "SRTMGL1_E_36.5_-120.0_38.0_-118.5.tif").touch()
+    (tmp_path / "SRTMGL3_36.5_-120.0_38.0_-118.5.tif.part").touch()
+    (tmp_path / "notes.txt").touch()
+
+    index = CacheIndex(tmp_path)
+    assert len(index) == 1
+    assert (
+        index.find_cover("SRTMGL1_E", BoundingBox((37, -119), (37.5, -118.6)))
+        == "SRTMGL1_E_36.5_-120.0_38.0_-118.5.tif"
+    )
+
+
+@pytest.mark.parametrize("output_format", ["GTiff", "AAIGrid"])
+def test_fetch_crops_cached_superset(tmp_path, fake_server, output_format):
+    Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    assert len(fake_server.requests) == 1
+
+    topo = Topography(
+        dem_type="SRTMGL3",
+        south=40.1,
+        west=-104.9,
+        north=40.2,
+        east=-104.8,
+        cache_dir=tmp_path,
+        output_format=output_format,
+    )
+    fname = topo.fetch()
+    assert len(fake_server.requests) == 1
+
+    with rasterio.open(fname) as src:
+        assert src.shape == (12, 12)
+        assert src.bounds.left == pytest.approx(-104.9)
+        assert src.bounds.top == pytest.approx(40.2)
+        assert src.read(1)[0, 0] == pytest.approx(
+            elevation(40.2 - RESOLUTION / 2, -104.9 + RESOLUTION / 2)
+        )
+
+
+def test_fetch_without_crop(tmp_path, fake_server):
+    Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    Topography(
+        **PARAMS | {"north": 40.25}, cache_dir=tmp_path, crop_from_cache=False
+    ).fetch()
+    assert len(fake_server.requests) == 2
+
+
+def test_clear_cache_removes_index(tmp_path, fake_server):
+    Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    assert (tmp_path / CacheIndex.FILENAME).is_file()
+
+    Topography.clear_cache(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def _fetch(tmp_path, south, **kwds):
+    return Topography(
+        dem_type="SRTMGL3",
+        south=south,
+        west=-105.0,
+        north=south + 0.2,
+        east=-104.8,
+        cache_dir=tmp_path,
+        **kwds,
+    ).fetch()
+
+
+def test_evict_least_recently_used(tmp_path, fake_server):
+    first, second, third = (_fetch(tmp_path, south) for south in (10.0, 20.0, 30.0))
+    _fetch(tmp_path, 10.0)
+
+    index = CacheIndex(tmp_path)
+    quota = index.total_size() - 1
+    assert index.evict(quota) == [second]
+    assert first.is_file() and not second.exists() and third.is_file()
+    assert index.total_size() <= quota
+
+
+def test_evict_during_fetch(tmp_path, fake_server):
+    paths = [_fetch(tmp_path, south) for south in (10.0, 20.0)]
+    size = paths[0].stat().st_size
+
+    latest = _fetch(tmp_path, 30.0, cache_max_size=2 * size)
+    assert latest.is_file()
+    assert not paths[0].exists()
+    assert paths[1].is_file()
+
+
+def test_evict_keeps_current_file(tmp_path, fake_server):
+    path = _fetch(tmp_path, 10.0, cache_max_size=0)
+    assert path.is_file()
+    assert CacheIndex(tmp_path).evict(0) == [path]
+
+
+def test_prune_cache(tmp_path, fake_server, capsys):
+    paths = [_fetch(tmp_path, south) for south in (10.0, 20.0)]
+    Topography.prune_cache(tmp_path, "1K")
+    assert not any(path.exists() for path in paths)
+    assert capsys.readouterr().out.count("rm ") == 2
+
+
+def test_cache_max_size_from_env(monkeypatch):
+    monkeypatch.setenv("BMI_TOPOGRAPHY_CACHE_MAX_SIZE", "2M")
+    assert Topography(**Topography.DEFAULT).cache_max_size == 2 * 1024**2
+
+
+@pytest.mark.parametrize(
+    "size,expected", [(10, 10), ("10", 10), ("1k", 1024), ("1.5 MiB", 1572864)]
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@pytest.mark.parametrize("size", ["", "ten", "-1", "1X", -5])
+def test_parse_bad_size(size):
+    with pytest.raises(ValueError):
+        parse_size(size)
+
+
+def test_manifest_records_download(tmp_path, fake_server):
+    topo = Topography(**PARAMS, cache_dir=tmp_path, api_key="secret")
+    fname = topo.fetch()
+
+    entry = CacheIndex(tmp_path).entry(fname)
+    assert entry["size"] == fname.stat().st_size
+    assert entry["sha256"] == hashlib.sha256(fname.read_bytes()).hexdigest()
+    assert entry["source"].startswith(Topography.base_url())
+    assert "secret" not in entry["source"]
+    assert entry["created"] > 0
+
+
+def test_manifest_checksum_of_resumed_download(tmp_path, fake_server):
+    fake_server.drop_after = 100
+    fname = Topography(**PARAMS, cache_dir=tmp_path, retry=1).fetch()
+
+    entry = CacheIndex(tmp_path).entry(fname)
+    assert entry["sha256"] == hashlib.sha256(fname.read_bytes()).hexdigest()
+
+
+@pytest.mark.parametrize("driver", ["GTiff", "AAIGrid"])
+def test_merge_tiles_by_window(tmp_path, driver):
+    bbox = BoundingBox((40.0, -105.0), (40.5, -104.5))
+    paths = []
+    for i, tile in enumerate(bbox.split(0.25)):
+        paths.append(tmp_path / f"tile{i}.tif")
+        paths[-1].write_bytes(make_dem(tile.south, tile.west, tile.north, tile.east))
+
+    dst_path = tmp_path / "mosaic"
+    merge_tiles(paths, dst_path, driver=driver, blocksize=16, mem_limit=0.001)
+
+    with rasterio.open(dst_path) as src:
+        assert src.driver == driver
+        assert src.shape == (60, 60)
+        assert src.bounds.left == pytest.approx(-105.0)
+        assert src.bounds.top == pytest.approx(40.5)
+        with rasterio.MemoryFile(make_dem(40.0, -105.0, 40.5, -104.5)) as memfile:
+            with memfile.open() as expected:
+                np.testing.assert_allclose(src.read(1), expected.read(1), rtol=1e-6)
+    assert not dst_path.with_name("mosaic.tif").exists()
+
+
+def test_manifest_records_crop(tmp_path, fake_server):
+    big = Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    small = Topography(**PARAMS | {"north": 40.25}, cache_dir=tmp_path).fetch()
+
+    entry = CacheIndex(tmp_path).entry(small)
+    assert entry["source"] == big.name
+    assert entry["sha256"] == hashlib.sha256(small.read_bytes()).hexdigest()
+
+
+def test_verify(tmp_path, fake_server):
+    paths = [_fetch(tmp_path, south) for south in (10.0, 20.0, 30.0)]
+    assert Topography.verify_cache(tmp_path) == []
+
+    paths[0].write_bytes(b"truncated")
+    data = bytearray(paths[1].read_bytes())
+    data[-1] ^= 0xFF
+    paths[1].write_bytes(data)
+    paths[2].unlink()
+
+    problems = dict(CacheIndex(tmp_path).verify())
+    assert problems == {
+        paths[0]: "size mismatch",
+        paths[1]: "checksum mismatch",
+        paths[2]: "missing",
+    }
+    assert CacheIndex(tmp_path).verify(checksums=False) == [
+        (paths[0], "size mismatch"),
+        (paths[2], "missing"),
+    ]
+
+
+def test_fetch_replaces_corrupt_file(tmp_path, fake_server):
+    fname = _fetch(tmp_path, 10.0)
+    fname.write_bytes(b"truncated")
+
+    with pytest.warns(UserWarning, match="corrupt"):
+        assert _fetch(tmp_path, 10.0) == fname
+    assert len(fake_server.requests) == 2
+    assert Topography.verify_cache(tmp_path) == []
+
+
+def test_fetch_again_after_failed_refetch(tmp_path, fake_server):
+    fname = _fetch(tmp_path, 10.0)
+    fname.write_bytes(b"truncated")
+    fake_server.errors = [(404, "Not Found", {})]
+
+    with pytest.warns(UserWarning, match="corrupt"):
+        with pytest.raises(requests.exceptions.HTTPError):
+            _fetch(tmp_path, 10.0)
+    assert not fname.exists()
+
+    assert _fetch(tmp_path, 10.0) == fname
+    assert len(fake_server.requests) == 3
+    assert Topography.verify_cache(tmp_path) == []
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "geteuid") or os.geteuid() == 0,
+    reason="file permissions aren't enforced for root",
+)
+def test_read_only_cache(tmp_path, fake_server):
+    topo = Topography(**PARAMS, cache_dir=tmp_path)
+    fname = topo.fetch()
+    last_access = CacheIndex(tmp_path).entry(fname)["last_access"]
+
+    index_file = tmp_path / CacheIndex.FILENAME
+    index_file.chmod(stat.S_IRUSR)
+    tmp_path.chmod(stat.S_IRUSR | stat.S_IXUSR)
+    try:
+        assert Topography(**PARAMS, cache_dir=tmp_path).fetch() == fname
+        index = CacheIndex(tmp_path)
+        assert not index.writable
+        assert index.entry(fname)["last_access"] == last_access
+        assert index.find_cover("SRTMGL3", topo.bbox) == fname.name
+        assert Topography(**PARAMS, cache_dir=tmp_path).load().shape == (1, 60, 60)
+    finally:
+        tmp_path.chmod(stat.S_IRWXU)
+        index_file.chmod(stat.S_IRUSR | stat.S_IWUSR)
+
+
+def test_cog_layout(tmp_path, fake_server):
+    fname = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="cog").fetch()
+
+    with rasterio.open(fname) as src:
+        assert src.profile["tiled"]
+        assert src.profile["compress"].lower() == "deflate"
+        assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert src.read(1)[0, 0] == pytest.approx(
+            elevation(40.5 - RESOLUTION / 2, -105.0 + RESOLUTION / 2), abs=1e-3
+        )
+
+    entry = CacheIndex(tmp_path).entry(fname)
+    assert entry["layout"] == "cog"
+    assert entry["sha256"] == hashlib.sha256(fname.read_bytes()).hexdigest()
+    assert Topography.verify_cache(tmp_path) == []
+
+
+def test_raw_file_converted_to_cog(tmp_path, fake_server):
+    fname = Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == "raw"
+
+    Topography(**PARAMS, cache_dir=tmp_path, cache_layout="cog").fetch()
+    assert len(fake_server.requests) == 1
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == "cog"
+
+    Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == "cog"
+
+
+@pytest.mark.parametrize(
+    "kwds",
+    [{"cache_layout": "zip"}, {"cache_layout": "cog", "output_format": "AAIGrid"}],
+)
+def test_bad_cache_layout(kwds):
+    with pytest.raises(ValueError):
+        Topography(**Topography.DEFAULT | kwds)
+
+
+def test_zarr_layout(tmp_path, fake_server):
+    pytest.importorskip("zarr")
+
+    topo = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="zarr")
+    fname = topo.fetch()
+    assert zarr_store(fname).is_dir()
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == "zarr"
+
+    da = topo.load()
+    assert da.name == "SRTMGL3"
+    assert da.attrs["units"] == "degrees"
+    assert da.dtype == "float32"
+    assert da.encoding["chunks"] == (1, 60, 60)
+    with rasterio.open(fname) as src:
+        assert da.rio.transform() == src.transform
+        assert da.rio.crs == src.crs
+        assert (da.values == src.read()).all()
+
+    Topography.clear_cache(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_to_zarr_by_row_of_chunks(tmp_path, fake_server):
+    pytest.importorskip("zarr")
+
+    fname = Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    store = tmp_path / "dem.zarr"
+    to_zarr(fname, store, chunks=16)
+
+    da = open_zarr(store)
+    assert da.encoding["chunks"] == (1, 16, 16)
+    with rasterio.open(fname) as src:
+        assert da.rio.transform() == src.transform
+        assert da.rio.crs == src.crs
+        np.testing.assert_array_equal(da.values, src.read())
+
+
+def test_zarr_layout_loads_lazily(tmp_path, fake_server):
+    pytest.importorskip("zarr")
+
+    topo = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="zarr")
+    da = topo.load()
+    assert not isinstance(da.variable._data, np.ndarray)
+    assert not da.variable._in_memory
+
+
+def test_zarr_store_written_for_cached_file(tmp_path, fake_server):
+    pytest.importorskip("zarr")
+
+    fname = Topography(**PARAMS, cache_dir=tmp_path).fetch()
+    Topography(**PARAMS, cache_dir=tmp_path, cache_layout="zarr").fetch()
+    assert len(fake_server.requests) == 1
+    assert zarr_store(fname).is_dir()
+
+    CacheIndex(tmp_path).evict(0)
+    assert not fname.exists() and not zarr_store(fname).exists()
+
+
+def test_zarr_layout_requires_zarr(monkeypatch):
+    monkeypatch.setitem(sys.modules, "zarr", None)
+    with pytest.raises(ImportError, match="pip install"):
+        Topography(**Topography.DEFAULT, cache_layout="zarr")
+
+
+def test_npy_layout(tmp_path, fake_server):
+    topo = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="npy")
+    fname = topo.fetch()
+    array_file, meta_file = npy_files(fname)
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == "npy"
+
+    meta = json.loads(meta_file.read_text())
+    assert meta["units"] == "degrees"
+    assert meta["shape"] == [1, 60, 60]
+
+    da = topo.load()
+    assert isinstance(da.variable._data, np.memmap)
+    assert da.variable._data.filename == array_file
+    assert not da.values.flags.writeable
+    assert da.name == "SRTMGL3"
+    assert da.attrs["units"] == "degrees"
+    with rasterio.open(fname) as src:
+        assert da.rio.transform() == src.transform
+        assert da.rio.crs == src.crs
+        assert da.rio.nodata == src.nodata
+        np.testing.assert_array_equal(da.values, src.read())
+        np.testing.assert_array_equal(da.x, topo.load().x)
+
+    window = topo.load(window=((10, 20), (5, 15)))
+    assert window.variable._data.filename == array_file
+    np.testing.assert_array_equal(window, da[:, 10:20, 5:15])
+
+    Topography.clear_cache(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("cache_layout", ["raw", "cog", "npy"])
+def test_unindexed_file_is_indexed(tmp_path, fake_server, cache_layout):
+    other = Topography(**PARAMS, cache_dir=tmp_path / "other").fetch()
+    CacheIndex(tmp_path)
+    fname = tmp_path / other.name
+    fname.write_bytes(other.read_bytes())
+
+    topo = Topography(**PARAMS, cache_dir=tmp_path, cache_layout=cache_layout)
+    assert topo.load().shape == (1, 60, 60)
+    assert len(fake_server.requests) == 1
+    assert CacheIndex(tmp_path).entry(fname)["layout"] == cache_layout
+    if cache_layout == "cog":
+        with rasterio.open(fname) as src:
+            assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+
+
+def test_npy_files_evicted(tmp_path, fake_server):
+    fname = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="npy").fetch()
+    CacheIndex(tmp_path).evict(0)
+    assert not any(path.exists() for path in (fname, *npy_files(fname)))
+
+
+def test_sidecars_count_toward_cache_size(tmp_path, fake_server):
+    topo = Topography(**PARAMS, cache_dir=tmp_path, cache_layout="npy")
+    fname = topo.fetch()
+    sidecars = sum(path.stat().st_size for path in npy_files(fname))
+    assert CacheIndex(tmp_path).total_size() == fname.stat().st_size + sidecars
+
+    topo.load(factor=2)
+    level = pyramid_level(fname, 2)
+    assert CacheIndex(tmp_path).total_size() == (
+        fname.stat().st_size + sidecars + level.stat().st_size
+    )
+
+    assert CacheIndex(tmp_path).evict(fname.stat().st_size) == [fname]
+
+
+def test_manifest_records_header(tmp_path, fake_server):
+    fname = Topography(**PARAMS, cache_dir=tmp_path).fetch()
+
+    header = CacheIndex(tmp_path).entry(fname)["header"]
+    assert header == raster_header(fname)
+    assert header["shape"] == [1, 60, 60]
+    assert header["dtype"] == "float32"
+    assert header["units"] == "degrees"
+    assert header["nodata"] == -9999.0
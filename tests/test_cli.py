@@ -199,3 +199,19 @@ def test_config_file_mutually_exclusive(tmp_path, extra_opt):
     runner = CliRunner()
     result = runner.invoke(main, [f"--config-file={cfg}", extra_opt, "--no-fetch"])
     assert result.exit_code != 0
+
+
+def test_cache_max_size_prunes(tmp_path):
+    (tmp_path / "SRTMGL3_36.5_-120.0_38.0_-118.5.tif").write_bytes(b"x" * 2048)
+    runner = CliRunner()
+    result = runner.invoke(
+        main, [f"--cache-dir={tmp_path}", "--cache-max-size=1K", "--no-fetch"]
+    )
+    assert result.exit_code == 0, result.output
+    assert not (tmp_path / "SRTMGL3_36.5_-120.0_38.0_-118.5.tif").exists()
+
+
+def test_cache_max_size_invalid():
+    runner = CliRunner()
+    result = runner.invoke(main, ["--cache-max-size=lots", "--no-fetch"])
+    assert result.exit_code != 0
@@ -0,0 +1,130 @@
+"""Test the terrain derivatives"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bmi_topography import Topography
+from bmi_topography.derivatives import EARTH_RADIUS, aspect, curvature, hillshade, slope
+
+
+def _dem(z, spacing=10.0, units="m", west=0.0, north=None):
+    ny, nx = z.shape
+    north = ny * spacing if north is None else north
+    return xr.DataArray(
+        z[np.newaxis].astype(np.float32),
+        dims=("band", "y", "x"),
+        coords={
+            "band": [1],
+            "y": north - spacing * (np.arange(ny) + 0.5),
+            "x": west + spacing * (np.arange(nx) + 0.5),
+        },
+        attrs={"units": units},
+    )
+
+
+def _plane(east, north, shape=(20, 30), spacing=10.0):
+    """A plane that rises *east* and *north* metres per metre."""
+    rows, cols = np.indices(shape)
+    return _dem(
+        east * cols * spacing - north * rows * spacing + 1000.0, spacing=spacing
+    )
+
+
+@pytest.mark.parametrize(
+    "east,north,expected",
+    [(0.1, 0.0, 270.0), (0.0, 0.1, 180.0), (-0.1, 0.0, 90.0), (0.0, -0.1, 0.0)],
+)
+def test_plane(east, north, expected):
+    da = _plane(east, north)
+
+    interior = (0, slice(1, -1), slice(1, -1))
+
+    np.testing.assert_allclose(
+        slope(da)[interior], np.degrees(np.arctan(0.1)), rtol=1e-5
+    )
+    np.testing.assert_allclose(aspect(da)[interior] % 360.0, expected, atol=1e-4)
+    np.testing.assert_allclose(curvature(da)[interior], 0.0, atol=1e-6)
+
+
+def test_flat():
+    da = _dem(np.full((5, 5), 100.0))
+
+    assert (slope(da) == 0.0).all()
+    assert aspect(da).isnull().all()
+    np.testing.assert_allclose(hillshade(da, altitude=30.0), 0.5, rtol=1e-6)
+
+
+def test_curvature_of_bowl():
+    rows, cols = np.indices((21, 21)) - 10.0
+    da = _dem(rows**2 + cols**2, spacing=1.0)
+    np.testing.assert_allclose(curvature(da)[0, 1:-1, 1:-1], 4.0, rtol=1e-6)
+    assert curvature(da).attrs["units"] == "1/m"
+
+
+def test_hillshade():
+    shade = hillshade(_plane(-1.0, 0.0), azimuth=90.0, altitude=45.0)
+    np.testing.assert_allclose(shade[0, 1:-1, 1:-1], 1.0, rtol=1e-5)
+
+    shade = hillshade(_plane(1.0, 0.0), azimuth=90.0, altitude=45.0)
+    np.testing.assert_allclose(shade[0, 1:-1, 1:-1], 0.0, atol=1e-6)
+    assert ((shade >= 0.0) & (shade <= 1.0)).all()
+
+
+@pytest.mark.parametrize("func", [slope, aspect, curvature, hillshade])
+def test_tiles_match_whole(func):
+    rng = np.random.default_rng(1945)
+    da = _dem(rng.uniform(0.0, 100.0, size=(37, 23)))
+    np.testing.assert_array_equal(func(da, tile_size=5), func(da, tile_size=100))
+
+
+def test_geographic_spacing():
+    spacing = 1.0 / 120.0
+    metres_per_degree = np.pi / 180.0 * EARTH_RADIUS
+    lats = 60.0 - spacing * (np.arange(40) + 0.5)
+    lons = spacing * (np.arange(10) + 0.5)
+    z = (
+        0.1
+        * metres_per_degree
+        * lons[np.newaxis, :]
+        * np.cos(np.radians(lats))[:, np.newaxis]
+    )
+
+    da = _dem(z, spacing=spacing, units="degrees", north=60.0)
+    np.testing.assert_allclose(
+        slope(da)[0, 1:-1, 1:-1], np.degrees(np.arctan(0.1)), rtol=1e-3
+    )
+
+
+def test_nodata():
+    z = np.full((7, 7), 100.0)
+    z[3, 3] = -9999.0
+    da = _dem(z)
+    da.attrs["_FillValue"] = -9999.0
+
+    result = slope(da)
+    assert result[0, 2:5, 2:5].isnull().all()
+    assert int(result.isnull().sum()) == 9
+
+
+def test_load_output(tmp_path, fake_server):
+    da = Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=40.5,
+        east=-104.5,
+        cache_dir=tmp_path,
+    ).load()
+
+    result = slope(da, tile_size=16)
+    assert result.name == "slope"
+    assert result.shape == da.shape
+    assert result.dtype == np.float32
+    assert result.rio.crs == da.rio.crs
+    assert (result > 0.0).all()
+
+
+def test_bad_tile_size():
+    with pytest.raises(ValueError):
+        slope(_dem(np.zeros((3, 3))), tile_size=0)
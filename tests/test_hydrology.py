@@ -0,0 +1,158 @@
+"""Test depression filling and flow routing"""
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from bmi_topography import Topography
+from bmi_topography.cache import CacheIndex, hydrology_file
+from bmi_topography.hydrology import (
+    D8_CODES,
+    NODATA_DIRECTION,
+    OUTLET,
+    check_size,
+    route,
+)
+
+STEPS = {
+    code: (row, col)
+    for code, (row, col) in zip(
+        D8_CODES.values(),
+        [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)],
+    )
+}
+
+
+def _dem(z, fill_value=None):
+    ny, nx = z.shape
+    da = xr.DataArray(
+        np.asarray(z, dtype=np.float32)[np.newaxis],
+        dims=("band", "y", "x"),
+        coords={"band": [1], "y": ny - np.arange(ny) - 0.5, "x": np.arange(nx) + 0.5},
+        attrs={"units": "m"},
+    )
+    if fill_value is not None:
+        da.attrs["_FillValue"] = fill_value
+    return da
+
+
+def _outlet(direction, row, col):
+    """Follow flow directions from a pixel to where it leaves the DEM."""
+    for _ in range(direction.size):
+        code = int(direction[row, col])
+        if code == OUTLET:
+            return row, col
+        step = STEPS[code]
+        row, col = row + step[0], col + step[1]
+    raise AssertionError("flow directions form a loop")
+
+
+def test_fill_pit():
+    z = np.full((5, 5), 10.0)
+    z[1:4, 1:4] = 2.0
+    z[2, 4] = 6.0
+
+    routes = route(_dem(z))
+    filled = routes.filled_elevation.values[0]
+
+    assert np.all(filled[1:4, 1:4] == 6.0)
+    assert routes.flow_accumulation.values[0, 2, 4] == z.size
+    assert routes.flow_direction.values[0, 2, 4] == OUTLET
+
+
+def test_random_dem_drains():
+    z = np.random.default_rng(1945).uniform(0.0, 100.0, size=(30, 40))
+
+    routes = route(_dem(z))
+    filled = routes.filled_elevation.values[0]
+    direction = routes.flow_direction.values[0]
+    accumulation = routes.flow_accumulation.values[0]
+
+    assert np.all(filled >= z.astype(np.float32))
+    assert accumulation[direction == OUTLET].sum() == z.size
+
+    rows, cols = np.indices(z.shape)
+    for row, col in zip(rows.flat, cols.flat):
+        outlet = _outlet(direction, row, col)
+        assert filled[outlet] <= filled[row, col]
+        assert outlet[0] in (0, 29) or outlet[1] in (0, 39)
+
+
+def test_steepest_descent():
+    rows, cols = np.indices((7, 7))
+    routes = route(_dem(10.0 * cols + 1.0 * rows))
+    assert np.all(routes.flow_direction.values[0, :, 1:] == D8_CODES["W"])
+
+
+def test_nodata_is_an_outlet():
+    z = np.full((5, 5), 10.0)
+    z[1:4, 1:4] = 5.0
+    z[2, 2] = -9999.0
+
+    routes = route(_dem(z, fill_value=-9999.0))
+
+    assert np.isnan(routes.filled_elevation.values[0, 2, 2])
+    assert routes.flow_direction.values[0, 2, 2] == NODATA_DIRECTION
+    assert routes.filled_elevation.values[0, 1, 1] == 5.0
+    assert routes.flow_direction.values[0, 1, 1] == OUTLET
+
+
+def test_cache_file(tmp_path, monkeypatch):
+    da = _dem(np.random.default_rng(1945).uniform(0.0, 100.0, size=(8, 8)))
+    cache_file = tmp_path / "dem.tif.hydrology.npz"
+
+    routes = route(da, cache_file=cache_file, key="v1")
+    assert cache_file.is_file()
+
+    def fail(*args):
+        raise AssertionError("routes were recomputed")
+
+    monkeypatch.setattr("bmi_topography.hydrology._route", fail)
+    cached = route(da, cache_file=cache_file, key="v1")
+    xr.testing.assert_identical(cached, routes)
+
+    with pytest.raises(AssertionError):
+        route(da, cache_file=cache_file, key="v2")
+
+
+def test_max_pixels(tmp_path):
+    da = _dem(np.random.default_rng(1945).uniform(0.0, 100.0, size=(8, 8)))
+    cache_file = tmp_path / "dem.tif.hydrology.npz"
+
+    with pytest.raises(ValueError, match="max_pixels"):
+        route(da, cache_file=cache_file, key="v1", max_pixels=63)
+    assert not cache_file.exists()
+
+    routes = route(da, cache_file=cache_file, key="v1", max_pixels=None)
+    cached = route(da, cache_file=cache_file, key="v1", max_pixels=63)
+    xr.testing.assert_identical(cached, routes)
+
+
+def test_check_size():
+    check_size((1, 8, 8), max_pixels=64)
+    check_size((1, 3601, 3601), max_pixels=None)
+    with pytest.raises(ValueError, match="12967201 pixels"):
+        check_size((1, 3601, 3601))
+
+
+def test_topography_hydrology(tmp_path, fake_server):
+    topo = Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=40.1,
+        east=-104.9,
+        cache_dir=tmp_path,
+    )
+
+    routes = topo.hydrology()
+    fname = topo.fetch()
+    assert hydrology_file(fname).is_file()
+    assert CacheIndex(tmp_path).total_size() == (
+        fname.stat().st_size + hydrology_file(fname).stat().st_size
+    )
+    assert routes.filled_elevation.shape == topo.da.shape
+    assert int(routes.flow_accumulation.max()) <= topo.da.size
+
+    Topography.clear_cache(tmp_path)
+    assert not hydrology_file(fname).exists()
@@ -0,0 +1,77 @@
+"""Test cache file locking"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bmi_topography import Topography
+from bmi_topography.lock import FileLock
+
+
+def _hold_lock(path, held, done):
+    with FileLock(path):
+        held.touch()
+        time.sleep(0.5)
+        done.touch()
+
+
+def test_lock_is_exclusive_across_processes(tmp_path):
+    path, held, done = tmp_path / "dem.lock", tmp_path / "held", tmp_path / "done"
+
+    process = multiprocessing.Process(target=_hold_lock, args=(path, held, done))
+    process.start()
+    try:
+        while not held.exists():
+            time.sleep(0.01)
+        with FileLock(path):
+            assert done.exists()
+    finally:
+        process.join()
+    assert process.exitcode == 0
+
+
+def test_lock_is_exclusive_across_threads(tmp_path):
+    path = tmp_path / "dem.lock"
+    active = []
+    overlaps = []
+
+    def work():
+        with FileLock(path):
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.01)
+            active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == [1] * 8
+
+
+def test_lock_release(tmp_path):
+    lock = FileLock(tmp_path / "dem.lock")
+    assert not lock.is_locked
+    with lock:
+        assert lock.is_locked
+        assert lock.path.is_file()
+    assert not lock.is_locked
+    with lock:
+        pass
+
+
+def test_concurrent_fetches_download_once(tmp_path, fake_server):
+    fake_server.delay = 0.1
+    topos = [
+        Topography(**Topography.DEFAULT | {"cache_dir": tmp_path}) for _ in range(8)
+    ]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(Topography.fetch, topos))
+
+    assert len(set(paths)) == 1
+    assert paths[0].is_file()
+    assert len(fake_server.requests) == 1
@@ -0,0 +1,134 @@
+"""Test the process-wide registry of loaded DEMs"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+import xarray as xr
+from rasterio.windows import Window
+
+from bmi_topography import Topography
+from bmi_topography.registry import Registry, get_registry, set_memory_budget
+
+PARAMS = {
+    "dem_type": "SRTMGL3",
+    "south": 40.0,
+    "west": -105.0,
+    "north": 40.5,
+    "east": -104.5,
+}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry(max_bytes="1M")
+    monkeypatch.setattr("bmi_topography.registry._registry", registry)
+    return registry
+
+
+def _array(n):
+    return xr.DataArray(np.zeros(n, dtype=np.uint8))
+
+
+def test_loads_are_shared(tmp_path, fake_server, registry):
+    first = Topography(**PARAMS, cache_dir=tmp_path).load()
+    second = Topography(**PARAMS, cache_dir=tmp_path).load()
+
+    assert first is not second
+    assert np.shares_memory(first.values, second.values)
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["nbytes"] == first.nbytes
+
+
+def test_shared_data_are_read_only(tmp_path, fake_server, registry):
+    first = Topography(**PARAMS, cache_dir=tmp_path).load()
+    second = Topography(**PARAMS, cache_dir=tmp_path).load()
+
+    with pytest.raises(ValueError):
+        first.values[0, 0, 0] = 0.0
+
+    first.attrs["units"] = "m"
+    first.name = "changed"
+    assert second.attrs["units"] == "degrees"
+    assert second.name == "SRTMGL3"
+
+
+def test_refetched_file_is_reloaded(tmp_path, fake_server, registry):
+    topo = Topography(**PARAMS, cache_dir=tmp_path)
+    topo.load()
+
+    Topography.clear_cache(tmp_path)
+    Topography(**PARAMS, cache_dir=tmp_path).load()
+    assert registry.stats()["misses"] == 2
+
+
+def test_too_big_to_hold_is_lazy(tmp_path, fake_server, registry):
+    registry.max_bytes = "1K"
+    topo = Topography(**PARAMS, cache_dir=tmp_path)
+
+    da = topo.load()
+    assert not da.variable._in_memory
+    assert registry.stats()["misses"] == 0
+    assert da.shape == (1, 60, 60)
+    np.testing.assert_array_equal(
+        da[:, :10, :10], topo.load(window=Window(0, 0, 10, 10))
+    )
+    assert registry.stats()["entries"] == 1
+
+
+def test_evict_least_recently_used():
+    registry = Registry(max_bytes=250)
+    for key in ("a", "b"):
+        registry.get(key, lambda: _array(100))
+    registry.get("a", lambda: None)
+    registry.get("c", lambda: _array(100))
+
+    assert "a" in registry and "b" not in registry and "c" in registry
+    assert registry.nbytes == 200
+    assert registry.stats()["evictions"] == 1
+
+
+def test_too_big_to_hold():
+    registry = Registry(max_bytes=50)
+    da = registry.get("big", lambda: _array(100))
+    assert da.size == 100
+    assert len(registry) == 0
+
+
+def test_shrink_budget(registry):
+    for key in ("a", "b", "c"):
+        get_registry().get(key, lambda: _array(100))
+    set_memory_budget(150)
+
+    assert registry.max_bytes == 150
+    assert len(registry) == 1 and "c" in registry
+
+
+def test_memory_budget_from_env(monkeypatch):
+    monkeypatch.setenv("BMI_TOPOGRAPHY_MEMORY_BUDGET", "2M")
+    assert Registry().max_bytes == 2 * 1024**2
+
+
+def test_concurrent_loads_load_once():
+    registry = Registry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return _array(10)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(registry.get("a", loader)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(np.shares_memory(da.values, results[0].values) for da in results)
@@ -0,0 +1,128 @@
+"""Test retrying and rate limiting of downloads"""
+
+import time
+
+import pytest
+import requests
+
+from bmi_topography import Topography
+from bmi_topography.retry import (
+    RateLimiter,
+    Retry,
+    get_rate_limiter,
+    reset_retry_stats,
+    retry_stats,
+    set_rate_limit,
+)
+
+NO_WAIT = Retry(max_retries=3, backoff_factor=0.0)
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    reset_retry_stats()
+
+
+def _topo(tmp_path, **kwds):
+    return Topography(**Topography.DEFAULT | {"cache_dir": tmp_path} | kwds)
+
+
+def test_retry_from_value():
+    assert Retry.from_value(None).max_retries == 5
+    assert Retry.from_value(2).max_retries == 2
+    assert Retry.from_value(NO_WAIT) is NO_WAIT
+    with pytest.raises(ValueError):
+        Retry(max_retries=-1)
+
+
+def test_backoff_is_bounded():
+    retry = Retry(backoff_factor=1.0, max_backoff=5.0)
+    for attempt in range(10):
+        assert 0.0 <= retry.backoff(attempt) <= min(2**attempt, 5.0)
+
+
+def test_backoff_honors_retry_after():
+    response = requests.Response()
+    response.headers["Retry-After"] = "30"
+    assert Retry(max_backoff=3.0).backoff(0, response) == pytest.approx(30.0)
+
+    response.headers["Retry-After"] = "Wed, 21 Oct 2099 07:28:00 GMT"
+    assert Retry().backoff(0, response) > 365 * 24 * 60 * 60
+
+
+def test_retry_server_errors(tmp_path, fake_server):
+    fake_server.errors = [
+        (503, "Service Unavailable", {}),
+        (429, "Too Many Requests", {"Retry-After": "0"}),
+    ]
+    fname = _topo(tmp_path, retry=NO_WAIT).fetch()
+
+    assert fname.is_file()
+    assert len(fake_server.requests) == 3
+    assert retry_stats()["retries"] == 2
+    assert retry_stats()["throttled"] == 1
+
+
+def test_retry_gives_up(tmp_path, fake_server):
+    fake_server.errors = [(503, "Service Unavailable", {})] * 4
+    with pytest.raises(requests.exceptions.HTTPError):
+        _topo(tmp_path, retry=NO_WAIT).fetch()
+    assert len(fake_server.requests) == 4
+    assert retry_stats()["retries"] == 3
+
+
+def test_no_retry_after_long_retry_after(tmp_path, fake_server):
+    fake_server.errors = [(429, "Too Many Requests", {"Retry-After": "3600"})]
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError):
+        _topo(tmp_path, retry=NO_WAIT).fetch()
+    assert time.monotonic() - start < 1.0
+    assert len(fake_server.requests) == 1
+    assert retry_stats()["retries"] == 0
+
+
+def test_no_retry_client_errors(tmp_path, fake_server):
+    fake_server.errors = [(404, "Not Found", {})]
+    with pytest.raises(requests.exceptions.HTTPError):
+        _topo(tmp_path, retry=NO_WAIT).fetch()
+    assert len(fake_server.requests) == 1
+
+
+def test_retry_resumes_interrupted_download(tmp_path, fake_server):
+    fake_server.drop_after = 100
+    fname = _topo(tmp_path, retry=NO_WAIT).fetch()
+
+    assert fname.is_file()
+    assert fake_server.headers[-1]["Range"] == "bytes=100-"
+    assert retry_stats()["retries"] == 1
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=50.0, burst=2)
+    start = time.monotonic()
+    waits = [limiter.acquire() for _ in range(6)]
+    elapsed = time.monotonic() - start
+
+    assert waits[:2] == [0.0, 0.0]
+    assert all(wait > 0.0 for wait in waits[2:])
+    assert elapsed >= 4 / 50.0 * 0.9
+
+
+@pytest.mark.parametrize("rate,burst", [(0, 1), (-1, 1), (1, 0)])
+def test_rate_limiter_bad_args(rate, burst):
+    with pytest.raises(ValueError):
+        RateLimiter(rate, burst=burst)
+
+
+def test_rate_limit_is_per_key(tmp_path, fake_server):
+    set_rate_limit("key-a", 5.0)
+    try:
+        limiter = get_rate_limiter("key-a")
+        assert limiter.rate == 5.0
+        assert get_rate_limiter("key-b") is None
+
+        _topo(tmp_path, api_key="key-a").fetch()
+        _topo(tmp_path, api_key="key-a", north=38.5).fetch()
+        assert retry_stats()["waits"] == 1
+    finally:
+        set_rate_limit("key-a", None)
@@ -0,0 +1,114 @@
+"""Test sampling elevations at points"""
+
+import numpy as np
+import pytest
+import rasterio
+from conftest import RESOLUTION, elevation
+
+from bmi_topography import Topography
+from bmi_topography.sample import point_pixels, sample_raster
+
+
+@pytest.fixture
+def topo(tmp_path, fake_server):
+    return Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=40.5,
+        east=-104.5,
+        cache_dir=tmp_path,
+    )
+
+
+def _random_points(n, margin=RESOLUTION / 2):
+    rng = np.random.default_rng(1945)
+    lats = rng.uniform(40.0 + margin, 40.5 - margin, size=n)
+    lons = rng.uniform(-105.0 + margin, -104.5 - margin, size=n)
+    return lats, lons
+
+
+def test_nearest_at_pixel_centers(topo):
+    da = topo.load()
+    lats, lons = np.meshgrid(da.y.values, da.x.values, indexing="ij")
+
+    values = topo.sample(lats, lons)
+    assert values.shape == lats.shape
+    np.testing.assert_array_equal(values, da.values[0])
+
+
+def test_bilinear(topo):
+    lats, lons = _random_points(1000)
+    values = topo.sample(lats, lons, method="bilinear")
+    np.testing.assert_allclose(values, elevation(lats, lons), rtol=1e-6)
+
+
+def test_nearest(topo):
+    lats, lons = _random_points(1000, margin=0.0)
+    values = topo.sample(lats, lons, method="nearest")
+
+    rows = np.floor((40.5 - lats) / RESOLUTION)
+    cols = np.floor((lons + 105.0) / RESOLUTION)
+    expected = elevation(
+        40.5 - (rows + 0.5) * RESOLUTION, -105.0 + (cols + 0.5) * RESOLUTION
+    )
+    np.testing.assert_allclose(values, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["nearest", "bilinear"])
+def test_outside(topo, method):
+    values = topo.sample([40.25, 41.0, 40.25], [-104.75, -104.75, -106.0], method)
+    assert not np.isnan(values[0])
+    assert np.isnan(values[1:]).all()
+
+
+@pytest.mark.parametrize("method", ["nearest", "bilinear"])
+def test_each_tile_read_once(topo, method, monkeypatch):
+    fname = topo.fetch()
+    lats, lons = _random_points(500)
+    expected = sample_raster(fname, lats, lons, method=method)
+
+    reads = []
+    read = rasterio.io.DatasetReader.read
+    monkeypatch.setattr(
+        rasterio.io.DatasetReader,
+        "read",
+        lambda self, *args, **kwds: reads.append(kwds["window"])
+        or read(self, *args, **kwds),
+    )
+    values = sample_raster(fname, lats, lons, method=method, tile_size=16)
+
+    np.testing.assert_array_equal(values, expected)
+    assert len(reads) == 16
+    assert sum(window.width * window.height for window in reads) < 2 * 60 * 60
+
+
+def test_nodata(tmp_path):
+    path = tmp_path / "dem.tif"
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        height=2,
+        width=2,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=rasterio.transform.from_origin(0.0, 2.0, 1.0, 1.0),
+        nodata=-9999.0,
+    ) as dst:
+        dst.write(np.array([[[1.0, 2.0], [3.0, -9999.0]]], dtype="float32"))
+
+    values = sample_raster(path, [1.5, 0.5, 1.0], [0.5, 1.5, 1.0])
+    np.testing.assert_array_equal(values[:2], [1.0, np.nan])
+    assert np.isnan(sample_raster(path, [1.0], [1.0], method="bilinear"))
+
+
+def test_bad_method(topo):
+    with pytest.raises(ValueError):
+        topo.sample([40.25], [-104.75], method="cubic")
+
+
+def test_mismatched_points():
+    with pytest.raises(ValueError):
+        point_pixels(rasterio.Affine.identity(), "EPSG:4326", [0.0, 1.0], [0.0])
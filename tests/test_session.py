@@ -0,0 +1,84 @@
+"""Test the shared HTTP session"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from bmi_topography import Topography
+from bmi_topography.session import (
+    create_session,
+    get_session,
+    session_stats,
+    set_session,
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"elevation"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_session_reuses_connections(local_url):
+    session = create_session(pool_size=2)
+    for _ in range(5):
+        with session.get(local_url, stream=True) as response:
+            assert response.content == b"elevation"
+
+    stats = session_stats(session)
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["reused"] == 4
+
+
+@pytest.mark.parametrize("pool_size", [0, -1])
+def test_bad_pool_size(pool_size):
+    with pytest.raises(ValueError):
+        create_session(pool_size=pool_size)
+
+
+def test_pool_size_from_env(monkeypatch):
+    monkeypatch.setenv("BMI_TOPOGRAPHY_POOL_SIZE", "3")
+    adapter = create_session().get_adapter("https://portal.opentopography.org")
+    assert adapter._pool_maxsize == 3
+
+
+def test_shared_session(monkeypatch):
+    monkeypatch.setattr("bmi_topography.session._session", None)
+
+    session = get_session()
+    assert isinstance(session, requests.Session)
+    assert get_session() is session
+    assert Topography(**Topography.DEFAULT).session is session
+
+    other = create_session()
+    set_session(other)
+    assert get_session() is other
+
+
+def test_injected_session():
+    session = create_session()
+    topo = Topography(**Topography.DEFAULT, session=session)
+    assert topo.session is session
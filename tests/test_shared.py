@@ -0,0 +1,118 @@
+"""Test sharing DEMs between processes"""
+
+import gc
+import multiprocessing
+import pickle
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from bmi_topography import Topography
+from bmi_topography.shared import SharedDem, attach, attach_array, publish
+
+
+@pytest.fixture
+def da(tmp_path, fake_server):
+    return Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=40.5,
+        east=-104.5,
+        cache_dir=tmp_path,
+    ).load()
+
+
+def _checksum(handle):
+    da = attach(handle)
+    return float(da.sum()), da.rio.crs.to_epsg(), da.x.values[0]
+
+
+def test_attach(da):
+    with publish(da) as shared:
+        attached = attach(shared.handle)
+
+        np.testing.assert_array_equal(attached.values, da.values)
+        np.testing.assert_allclose(attached.x, da.x)
+        np.testing.assert_allclose(attached.y, da.y)
+        assert attached.rio.crs == da.rio.crs
+        assert attached.rio.transform() == da.rio.transform()
+        assert attached.attrs["_FillValue"] == da.attrs["_FillValue"]
+        assert attached.attrs["units"] == "degrees"
+        assert not attached.values.flags.writeable
+
+
+def test_attach_is_zero_copy(da):
+    with publish(da) as shared:
+        values, attached = attach_array(shared.handle), attach(shared.handle)
+
+        block = shared_memory.SharedMemory(name=shared.handle.name)
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[0, 0, 0] = -1.0
+        block.close()
+
+        assert values[0, 0, 0] == -1.0
+        assert attached.values[0, 0, 0] == -1.0
+
+
+def test_detached_when_collected(da):
+    with publish(da) as shared:
+        values = attach_array(shared.handle)
+        mapping = weakref.ref(values.base)
+        view = values[0, :10]
+
+        del values
+        assert mapping() is not None
+        del view
+        gc.collect()
+        assert mapping() is None
+
+
+def test_attach_after_close(da):
+    shared = publish(da)
+    attach(shared.handle)
+    shared.close()
+
+    with pytest.raises(FileNotFoundError):
+        attach(shared.handle)
+
+
+def test_handle_is_small(da):
+    with publish(da) as shared:
+        assert len(pickle.dumps(shared.handle)) < 2048
+        assert pickle.loads(pickle.dumps(shared.handle)) == shared.handle
+
+
+@pytest.mark.parametrize("method", ["fork", "spawn"])
+def test_workers(da, method):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{method} is not supported")
+
+    with publish(da) as shared:
+        ctx = multiprocessing.get_context(method)
+        with ctx.Pool(2) as pool:
+            results = pool.map(_checksum, [shared.handle] * 4)
+
+    expected = (float(da.sum()), 4326, da.x.values[0])
+    assert results == [pytest.approx(expected)] * 4
+
+
+def test_close(da):
+    shared = SharedDem(da)
+    name = shared.handle.name
+    shared.close()
+
+    assert shared.closed
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+    shared.close()
+
+
+def test_removed_when_collected(da):
+    shared = publish(da)
+    name = shared.handle.name
+    del shared
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
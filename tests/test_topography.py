@@ -1,15 +1,21 @@
 """Test Topography class"""
 
+import asyncio
 import os
 import random
 from pathlib import Path
 
+import numpy as np
 import pytest
+import rasterio
 import requests
+from affine import Affine
+from conftest import RESOLUTION, elevation, make_dem
+from rasterio.windows import Window
 
-from bmi_topography import Topography
+from bmi_topography import BoundingBox, Topography, fetch_many
 from bmi_topography.api_key import ApiKey
-from bmi_topography.errors import BoundingBoxError
+from bmi_topography.errors import BoundingBoxError, IncompleteDownloadError
 
 CENTER_LAT = 40.0
 CENTER_LON = -105.0
@@ -212,3 +218,459 @@ def test_fetch_load_sample(tmpdir, dem_type):
         list(Topography.VALID_OUTPUT_FORMATS.items())
     )
     _fetch_load(tmpdir, dem_type, output_format, file_type)
+
+
+def test_fetch_tiled(tmpdir, fake_server):
+    with tmpdir.as_cwd():
+        topo = Topography(
+            dem_type="SRTMGL3",
+            south=40.0,
+            west=-105.0,
+            north=40.5,
+            east=-104.0,
+            cache_dir=".",
+            tile_size=0.25,
+            max_workers=3,
+        )
+        fname = topo.fetch()
+
+        assert len(fake_server.requests) == 8
+        assert fname == topo._build_filename()
+        assert tmpdir.listdir(fil=lambda f: f.ext == ".tif") == [fname]
+
+        with rasterio.open(fname) as src:
+            assert src.shape == (60, 120)
+            assert src.bounds.left == pytest.approx(-105.0)
+            assert src.bounds.top == pytest.approx(40.5)
+            data = src.read(1)
+    assert data[0, 0] == pytest.approx(
+        elevation(40.5 - RESOLUTION / 2, -105.0 + RESOLUTION / 2)
+    )
+    assert data[-1, -1] == pytest.approx(
+        elevation(40.0 + RESOLUTION / 2, -104.0 - RESOLUTION / 2)
+    )
+
+
+def test_fetch_tiled_single_tile(tmpdir, fake_server):
+    with tmpdir.as_cwd():
+        topo = Topography(**Topography.DEFAULT | {"cache_dir": ".", "tile_size": 5.0})
+        topo.fetch()
+        assert len(fake_server.requests) == 1
+        assert fake_server.requests[0] == topo.url
+
+
+def _small_topos(cache_dir, n, **kwds):
+    return [
+        Topography(
+            dem_type="SRTMGL3",
+            south=40.0 + i * 0.1,
+            west=-105.0,
+            north=40.05 + i * 0.1,
+            east=-104.95,
+            cache_dir=cache_dir,
+            **kwds,
+        )
+        for i in range(n)
+    ]
+
+
+def test_fetch_many(tmpdir, fake_server):
+    fake_server.delay = 0.05
+    topos = _small_topos(str(tmpdir), 8)
+
+    paths = fetch_many(topos, max_concurrency=4)
+
+    assert paths == [topo._build_filename() for topo in topos]
+    assert all(path.is_file() for path in paths)
+    assert len(fake_server.requests) == 8
+    assert 1 < fake_server.max_in_flight <= 4
+
+
+def test_afetch(tmpdir, fake_server):
+    (topo,) = _small_topos(str(tmpdir), 1)
+    path = asyncio.run(topo.afetch())
+    assert path == topo._build_filename()
+    assert path.is_file()
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+def test_fetch_interrupted(tmpdir, fake_server, accept_ranges):
+    fake_server.accept_ranges = accept_ranges
+    fake_server.drop_after = 100
+    (topo,) = _small_topos(str(tmpdir), 1, retry=0)
+    fname = topo._build_filename()
+    part = fname.with_name(fname.name + ".part")
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        topo.fetch()
+    assert not fname.exists()
+    assert part.stat().st_size == 100
+
+    assert topo.fetch() == fname
+    assert not part.exists()
+    if accept_ranges:
+        assert fake_server.headers[-1]["Range"] == "bytes=100-"
+        assert fake_server.headers[-1]["If-Range"].startswith('"')
+
+    with rasterio.open(fname) as src:
+        assert src.read(1).shape == (6, 6)
+
+
+def _interrupted_fetch(tmpdir, fake_server):
+    fake_server.drop_after = 100
+    (topo,) = _small_topos(str(tmpdir), 1, retry=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        topo.fetch()
+    fname = topo._build_filename()
+    return topo, fname.with_name(fname.name + ".part")
+
+
+def _assert_downloaded(fname):
+    part = fname.with_name(fname.name + ".part")
+    assert not part.exists()
+    assert not part.with_name(part.name + ".validator").exists()
+    assert fname.read_bytes() == make_dem(40.0, -105.0, 40.05, -104.95)
+
+
+def test_fetch_restarts_changed_file(tmpdir, fake_server):
+    topo, part = _interrupted_fetch(tmpdir, fake_server)
+    part.with_name(part.name + ".validator").write_text('"stale"')
+
+    _assert_downloaded(topo.fetch())
+    assert fake_server.headers[-1]["If-Range"] == '"stale"'
+
+
+def test_fetch_restarts_without_validator(tmpdir, fake_server):
+    fake_server.etags = False
+    topo, part = _interrupted_fetch(tmpdir, fake_server)
+    assert part.stat().st_size == 100
+
+    _assert_downloaded(topo.fetch())
+    assert fake_server.headers[-1] == {}
+
+
+def test_fetch_restarts_misaligned_range(tmpdir, fake_server):
+    fake_server.range_shift = 10
+    topo, part = _interrupted_fetch(tmpdir, fake_server)
+
+    _assert_downloaded(topo.fetch())
+    assert fake_server.headers[-2]["Range"] == "bytes=100-"
+    assert fake_server.headers[-1] == {}
+
+
+def test_fetch_incomplete(tmpdir, fake_server, monkeypatch):
+    (topo,) = _small_topos(str(tmpdir), 1, retry=0)
+    fname = topo._build_filename()
+
+    get = fake_server.get
+
+    def short_get(*args, **kwds):
+        response = get(*args, **kwds)
+        response.headers["Content-Length"] = str(10**9)
+        return response
+
+    monkeypatch.setattr(fake_server, "get", short_get)
+    with pytest.raises(IncompleteDownloadError):
+        topo.fetch()
+    assert not fname.exists()
+    assert fname.with_name(fname.name + ".part").is_file()
+
+
+def test_fetch_tiled_resumes(tmpdir, fake_server):
+    topo = Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=40.5,
+        east=-104.5,
+        cache_dir=str(tmpdir),
+        tile_size=0.25,
+        max_workers=1,
+        retry=0,
+    )
+    fname = topo._build_filename()
+    tile_dir = fname.with_name(fname.name + ".tiles")
+
+    fake_server.drop_after = 10
+    with pytest.raises(requests.exceptions.ConnectionError):
+        topo.fetch()
+    assert tile_dir.is_dir()
+    assert not fname.exists()
+
+    topo.fetch()
+    assert fname.is_file()
+    assert not tile_dir.exists()
+    assert len(fake_server.requests) == 5
+
+
+def test_load_chunked(tmp_path, fake_server):
+    pytest.importorskip("dask")
+
+    (topo,) = _small_topos(tmp_path, 1)
+    da = topo.load(chunks=2)
+    assert da.chunks == ((1,), (2, 2, 2), (2, 2, 2))
+    assert da.attrs["units"] == "degrees"
+
+    with rasterio.open(topo.fetch()) as src:
+        np.testing.assert_array_equal(da.values, src.read())
+
+    assert topo.load().chunks is None
+    assert topo.load(chunks=2).chunks is not None
+
+
+def test_load_window(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+
+    bbox = BoundingBox((40.01, -104.99), (40.03, -104.97))
+    da = topo.load(window=bbox)
+    assert da.shape == (1, 3, 3)
+    assert da.attrs["units"] == "degrees"
+    np.testing.assert_array_equal(da, full.isel(y=slice(2, 5), x=slice(1, 4)))
+    assert da.rio.transform() == full.rio.transform() * Affine.translation(1, 2)
+    assert da.rio.bounds() == pytest.approx(
+        (
+            -105.0 + RESOLUTION,
+            40.05 - 5 * RESOLUTION,
+            -105.0 + 4 * RESOLUTION,
+            40.05 - 2 * RESOLUTION,
+        )
+    )
+
+
+@pytest.mark.parametrize("window", [((1, 3), (2, 5)), Window(2, 1, 3, 2)])
+def test_load_pixel_window(tmp_path, fake_server, window):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+
+    da = topo.load(window=window)
+    np.testing.assert_array_equal(da, full.isel(y=slice(1, 3), x=slice(2, 5)))
+    np.testing.assert_array_equal(da.y, full.y[1:3])
+    np.testing.assert_array_equal(da.x, full.x[2:5])
+
+
+def test_load_window_chunked(tmp_path, fake_server):
+    pytest.importorskip("dask")
+
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+
+    da = topo.load(chunks=2, window=((1, 3), (2, 5)))
+    assert da.chunks is not None
+    np.testing.assert_array_equal(da, full.isel(y=slice(1, 3), x=slice(2, 5)))
+
+
+def test_load_window_outside_data(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    with pytest.raises(BoundingBoxError):
+        topo.load(window=BoundingBox((10.0, 10.0), (11.0, 11.0)))
+    with pytest.raises(ValueError):
+        topo.load(window=((100, 200), (0, 1)))
+
+
+def _with_missing_values(tmp_path):
+    (topo,) = _small_topos(tmp_path, 1)
+    with rasterio.open(topo.fetch(), "r+") as dst:
+        data = dst.read()
+        data[0, 0, :2] = dst.nodata
+        dst.write(data)
+    (tmp_path / "cache.sqlite").unlink()
+    return topo
+
+
+def test_load_keeps_native_dtype(tmp_path, fake_server):
+    topo = _with_missing_values(tmp_path)
+    da = topo.load()
+    assert da.dtype == "float32"
+    assert da.rio.nodata == -9999.0
+    assert (da[0, 0, :2] == -9999.0).all()
+
+
+def test_load_as_int16(tmp_path, fake_server):
+    topo = _with_missing_values(tmp_path)
+    expected = np.round(topo.load().values[0, 1:, :])
+
+    da = topo.load(dtype="int16")
+    assert da.dtype == "int16"
+    assert da.rio.nodata == -9999
+    assert (da[0, 0, :2] == -9999).all()
+    np.testing.assert_array_equal(da[0, 1:, :], expected)
+    assert da.rio.crs is not None
+    assert da.attrs["units"] == "degrees"
+
+
+def test_load_nodata_mask(tmp_path, fake_server):
+    topo = _with_missing_values(tmp_path)
+
+    da = topo.load(nodata="mask")
+    assert da.dtype == "float32"
+    assert da.mask.dtype == bool
+    assert da.mask.sum() == 2
+    assert da.mask[0, 0, :2].all()
+
+
+@pytest.mark.parametrize("dtype,expected", [(None, "float32"), ("int16", "float32")])
+def test_load_nodata_nan(tmp_path, fake_server, dtype, expected):
+    topo = _with_missing_values(tmp_path)
+
+    da = topo.load(dtype=dtype, nodata="nan")
+    assert da.dtype == expected
+    assert np.isnan(da[0, 0, :2]).all()
+    assert np.isnan(da.rio.nodata)
+    assert int(da.isnull().sum()) == 2
+
+
+def test_load_bad_nodata(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    with pytest.raises(ValueError):
+        topo.load(nodata="zero")
+
+
+def _block_mean(values, factor):
+    nbands, ny, nx = values.shape
+    return values.reshape(nbands, ny // factor, factor, nx // factor, factor).mean(
+        axis=(2, 4)
+    )
+
+
+def test_load_factor(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+
+    da = topo.load(factor=2)
+    assert da.shape == (1, 3, 3)
+    assert da.rio.resolution() == pytest.approx((2 * RESOLUTION, -2 * RESOLUTION))
+    assert da.rio.bounds() == pytest.approx(full.rio.bounds())
+    np.testing.assert_allclose(da, _block_mean(full.values, 2), rtol=1e-6)
+    assert da.attrs["units"] == "degrees"
+
+    level = tmp_path / f"{topo.fetch().name}.pyramid" / "x2.tif"
+    assert level.is_file()
+    mtime = level.stat().st_mtime_ns
+    (again,) = _small_topos(tmp_path, 1)
+    assert again.load(factor=2).shape == (1, 3, 3)
+    assert level.stat().st_mtime_ns == mtime
+
+    Topography.clear_cache(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_refetch_removes_pyramid(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+    topo.load(factor=2)
+    fname = topo.fetch()
+    level = tmp_path / f"{fname.name}.pyramid" / "x2.tif"
+    assert level.is_file()
+
+    fname.write_bytes(b"truncated")
+    with pytest.warns(UserWarning, match="corrupt"):
+        topo.fetch()
+    assert not level.parent.exists()
+    np.testing.assert_allclose(
+        topo.load(factor=2), _block_mean(full.values, 2), rtol=1e-6
+    )
+
+
+def test_load_resolution(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load().copy()
+
+    da = topo.load(resolution=3.5 * RESOLUTION)
+    assert da.shape == (1, 2, 2)
+    np.testing.assert_allclose(da, _block_mean(full.values, 3), rtol=1e-6)
+
+
+def test_load_factor_from_overviews(tmp_path, fake_server):
+    topo = Topography(
+        dem_type="SRTMGL3",
+        south=40.0,
+        west=-105.0,
+        north=46.0,
+        east=-99.0,
+        cache_dir=tmp_path,
+        cache_layout="cog",
+    )
+    with rasterio.open(topo.fetch()) as src:
+        assert src.overviews(1) == [2]
+
+    da = topo.load(factor=2)
+    assert da.shape == (1, 360, 360)
+    assert not list(tmp_path.glob("*.pyramid"))
+
+
+def test_load_factor_with_window(tmp_path, fake_server):
+    (topo,) = _small_topos(tmp_path, 1)
+    full = topo.load(factor=2).copy()
+
+    da = topo.load(factor=2, window=((1, 3), (0, 2)))
+    np.testing.assert_array_equal(da, full[:, 1:3, 0:2])
+
+
+@pytest.mark.parametrize(
+    "kwds",
+    [
+        {"factor": 0},
+        {"factor": 1.5},
+        {"resolution": -1.0},
+        {"factor": 2, "resolution": 1.0},
+    ],
+)
+def test_load_bad_factor(tmp_path, fake_server, kwds):
+    (topo,) = _small_topos(tmp_path, 1)
+    with pytest.raises(ValueError):
+        topo.load(**kwds)
+
+
+@pytest.mark.parametrize(
+    "kwds",
+    [{}, {"factor": 4}, {"resolution": 2 * RESOLUTION}, {"dtype": "int16"}],
+)
+def test_metadata_matches_load(tmp_path, fake_server, kwds):
+    (topo,) = _small_topos(tmp_path, 1)
+
+    metadata = topo.metadata(**kwds)
+    da = topo.load(**kwds)
+    assert metadata["shape"] == da.shape
+    assert metadata["dtype"] == da.dtype
+    assert metadata["transform"].almost_equals(da.rio.transform())
+    assert metadata["units"] == da.attrs["units"]
+    assert rasterio.crs.CRS.from_wkt(metadata["crs"]) == da.rio.crs
+
+
+def test_metadata_does_not_read_data(tmp_path, fake_server, monkeypatch):
+    (topo,) = _small_topos(tmp_path, 1)
+    topo.fetch()
+
+    def no_reads(*args, **kwds):
+        raise AssertionError("data were read")
+
+    monkeypatch.setattr("rioxarray.open_rasterio", no_reads)
+    assert topo.metadata()["shape"] == (1, 6, 6)
+
+
+def test_fetch_tiled_resumes_with_other_tile_size(tmpdir, fake_server):
+    params = {
+        "dem_type": "SRTMGL3",
+        "south": 40.0,
+        "west": -105.0,
+        "north": 41.0,
+        "east": -104.0,
+        "cache_dir": str(tmpdir),
+        "max_workers": 1,
+        "retry": 0,
+    }
+    topo = Topography(**params, tile_size=0.25)
+    fname = topo._build_filename()
+    tile_dir = fname.with_name(fname.name + ".tiles")
+
+    fake_server.drop_after = 10
+    with pytest.raises(requests.exceptions.ConnectionError):
+        topo.fetch()
+    assert any(tile_dir.glob("*.tif"))
+
+    fname = Topography(**params, tile_size=0.5).fetch()
+    assert not tile_dir.exists()
+    with rasterio.open(fname) as src:
+        data = src.read(1)
+        assert not np.any(data == src.nodata)